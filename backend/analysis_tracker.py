@@ -0,0 +1,178 @@
+"""
+Analysis Session Tracker
+Stage record of every /api/analyze session, and the background workers that
+finish progressive analyses.
+
+With progressive=true (or HG_ANALYZE_PROGRESSIVE=1) /api/analyze answers as
+soon as the local DenseNet findings and heatmap are ready - with the LLM
+answers merged in only if they arrive within HG_ANALYZE_SLA_MS - and the LLM
+enrichment, merged report, PDF and cloud upload are finished here, on
+HG_ANALYZE_BACKGROUND_WORKERS threads, and attached to the session.
+
+  - one record per session: status (running -> complete | failed), every
+    finished stage with its time since the request started and a timestamp,
+    the early fields of the local model / each LLM provider and, for a
+    progressive analysis, the upgraded response once it is complete
+  - every change is published to a ProgressBroker (topic
+    "analyze:<analysis_id>") for the SSE endpoint
+  - the newest HG_ANALYZE_HISTORY finished records are kept for polling
+"""
+
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+RUNNING, COMPLETE, FAILED = "running", "complete", "failed"
+
+
+class AnalysisTracker:
+    """Per-session stage records + bounded background pool for progressive analyses."""
+
+    def __init__(self, workers: int = 4, history: int = 500, events=None):
+        self.workers = max(1, workers)
+        self.history = max(1, history)
+        self.events = events  # ProgressBroker or None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hg-enrich")
+        self._lock = threading.Lock()
+        self._records = {}  # session_id -> record
+        self._started = {}  # session_id -> time.perf_counter() of the request
+
+        self.in_background = 0
+        self.progressive = 0
+        self.enriched_in_sla = 0  # progressive responses that already carried the LLM answers
+        self.sla_missed = 0       # progressive responses sent after the SLA (local work alone too slow)
+
+    # ---------- Stages ----------
+
+    def start(self, session_id: str, analysis_id: str = None, progressive: bool = False,
+              started: float = None):
+        with self._lock:
+            self._records[session_id] = {
+                "session_id": session_id,
+                "analysis_id": analysis_id or session_id,
+                "progressive": progressive,
+                "status": RUNNING,
+                "stage": "received",
+                "message": "Analyzing scan...",
+                "created_at": time.time(),
+                "finished_at": None,
+                "stages": {},
+                "preliminary": {},  # source ("local", "groq", "claude") -> early fields
+                "result": None,
+                "error": None,
+            }
+            self._started[session_id] = started if started is not None else time.perf_counter()
+            self._prune()
+
+    def stage(self, session_id: str, name: str, message: str = None):
+        """Record that stage `name` of the session has finished."""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None:
+                return
+            self._mark(record, name)
+            if message:
+                record["message"] = message
+            self._publish(record)
+
+    def partial(self, session_id: str, source: str, field: str, value):
+        """An early field of the local model or an LLM provider (analyzer on_partial)."""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None:
+                return
+            record["preliminary"].setdefault(source, {})[field] = value
+            record["message"] = f"Early {source} result"
+            self._publish(record)
+
+    def responded(self, session_id: str, enriched: bool, within_sla: bool = True):
+        """A progressive analysis answered the client (`enriched`: LLM answers included)."""
+        with self._lock:
+            self.progressive += 1
+            self.enriched_in_sla += bool(enriched)
+            self.sla_missed += not within_sla
+        self.stage(session_id, "responded", "Local result sent, finishing the report...")
+
+    def complete(self, session_id: str, result: dict = None, message: str = "Analysis complete"):
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None:
+                return
+            self._mark(record, "complete")
+            record.update(status=COMPLETE, message=message, finished_at=time.time())
+            if record["progressive"]:
+                record["result"] = result
+            self._publish(record)
+
+    def fail(self, session_id: str, error: str):
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None:
+                return
+            record.update(status=FAILED, message=error, error=error, finished_at=time.time())
+            self._publish(record)
+
+    def _mark(self, record: dict, name: str):
+        """Stage finish time (lock held)."""
+        started = self._started.get(record["session_id"], time.perf_counter())
+        record["stages"][name] = {"ms": round((time.perf_counter() - started) * 1000, 1), "at": time.time()}
+        record["stage"] = name
+
+    # ---------- Background ----------
+
+    def submit(self, session_id: str, fn, *args):
+        """Run fn(*args) on the background pool; an exception fails the session."""
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                traceback.print_exc()
+                self.fail(session_id, f"Analysis failed: {e}")
+            finally:
+                with self._lock:
+                    self.in_background -= 1
+
+        with self._lock:
+            self.in_background += 1
+        self._executor.submit(run)
+
+    # ---------- API ----------
+
+    def get(self, session_id: str):
+        with self._lock:
+            record = self._records.get(session_id)
+            return self._view(record) if record else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for record in self._records.values():
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+            return {
+                "workers": self.workers,
+                "in_background": self.in_background,
+                "sessions": counts,
+                "progressive_responses": self.progressive,
+                "enriched_within_sla": self.enriched_in_sla,
+                "sla_missed": self.sla_missed,
+            }
+
+    def _view(self, record: dict) -> dict:
+        """Public copy of a record (lock held)."""
+        return dict(record, stages=dict(record["stages"]),
+                    preliminary={source: dict(fields) for source, fields in record["preliminary"].items()})
+
+    def _publish(self, record: dict):
+        """Push the session's current state to SSE subscribers (lock held)."""
+        if self.events is not None:
+            self.events.publish(f"analyze:{record['analysis_id']}", self._view(record),
+                                final=record["status"] != RUNNING)
+
+    def _prune(self):
+        """Keep the newest `history` finished records (lock held)."""
+        finished = [r for r in self._records.values() if r["status"] != RUNNING]
+        for record in sorted(finished, key=lambda r: r["finished_at"] or 0)[:-self.history]:
+            self._records.pop(record["session_id"], None)
+            self._started.pop(record["session_id"], None)
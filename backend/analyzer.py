@@ -16,14 +16,39 @@ import torch.nn as nn
 import torch.nn.functional as F
 import datetime
 import random
+import time
+import tempfile
 from torchvision import models, transforms
-from pytorch_grad_cam import HiResCAM
-from pytorch_grad_cam.utils.image import show_cam_on_image
-from pytorch_grad_cam.utils.model_targets import ClassifierOutputTarget
-import requests
+from pytorch_grad_cam.utils.image import show_cam_on_image, scale_cam_image
 import base64
 import json
 import re
+import copy
+import traceback
+from collections import deque
+
+from backend.inference_queue import InferenceBatcher
+from backend.inference_backend import BackboneRunner
+from backend.precision import load_calibration_tensors, quantize_head_dynamic
+from backend.onnx_backend import OnnxFindingsEngine
+from backend.feature_store import FeatureStore
+from backend.head_registry import HeadRegistry, HeadVersion
+from backend.brain_checkpoint import BrainCheckpointWriter
+from backend.feedback_buffer import FeedbackAccumulator, FeedbackSample, rating_to_weight
+from backend.feedback_log import FeedbackLog
+from backend.llm_fanout import LLMFanout
+from backend.http_gateway import HttpGateway
+from backend.llm_cache import LLMResponseCache
+from backend.llm_payload import LLMImagePayload
+from backend.key_scheduler import KeyScheduler
+from backend.circuit_breaker import CircuitBreakers, Hedger
+from backend.llm_stream import EARLY_FIELDS, StreamedCompletion, iter_sse
+from backend.feature_store import image_digest
+from backend.training_data import (
+    discover_labeled_images, discover_archive_images, ArchiveSource,
+    make_scan_dataset, ThroughputMeter,
+    augment_batch, normalize_batch, loader_settings, make_loader,
+)
 
 
 # ---------- Medical Finding Labels ----------
@@ -193,6 +218,39 @@ SEVERITY_LEVELS = {
 }
 
 
+# LLM providers. Bump LLM_PROMPT_VERSION whenever a prompt changes so cached
+# responses of the old prompt are no longer used.
+GROQ_MODEL = "meta-llama/llama-4-maverick-17b-128e-instruct"
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+LLM_PROMPT_VERSION = 1
+
+
+def _env_keys(prefix: str) -> list:
+    """[(name, key)] of PREFIX, PREFIX_2, PREFIX_3 that are set."""
+    keys = []
+    for key_name in (prefix, f"{prefix}_2", f"{prefix}_3"):
+        k = os.getenv(key_name)
+        if k:
+            keys.append((key_name, k))
+    return keys
+
+
+def _request_timeout(deadline: float = None):
+    """(connect, read) timeout of an LLM request; None once `deadline` (perf_counter) has passed."""
+    if deadline is None:
+        return (10, 120)
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0.5:
+        return None
+    return (min(10.0, remaining), remaining)
+
+
+def _provider_error(usage: dict = None):
+    """Mark an LLM call as failed by the provider (counts against its circuit breaker)."""
+    if usage is not None:
+        usage["provider_error"] = True
+
+
 class MedicalImageAnalyzer:
     """
     Analyzes medical images using DenseNet121 with Hi-Res CAM heatmap generation.
@@ -254,57 +312,223 @@ class MedicalImageAnalyzer:
         # Hi-Res CAM target layer (last DenseNet block)
         self.target_layer = self.model.features[-1]
 
-        # Feedback & training system
-        self.feedback_history = []
+        # Backbone runner (eager, or compiled via HG_INFERENCE_BACKEND) at the
+        # precision tier selected with HG_PRECISION
+        self.backbone = BackboneRunner(
+            self.model.features, self.device,
+            backend=os.getenv("HG_INFERENCE_BACKEND", "eager"),
+            precision=os.getenv("HG_PRECISION", "fp32"),
+            calibration_loader=lambda: load_calibration_tensors(
+                os.getenv("HG_CALIBRATION_DIR", ""), self.transform,
+                limit=int(os.getenv("HG_CALIBRATION_SAMPLES", "64")),
+            ),
+        )
+        self._quantized_head = None  # (head version, int8 classifier) for int8-dynamic
+
+        # Feedback & training system. Writers train `working_head` (private, under
+        # heads.write_lock) and publish frozen copies; inference only ever uses
+        # published versions (see head_registry)
+        self.working_head = self.model.classifier
+        # Every feedback is appended to the feedback log (history survives restarts)
+        self.feedback_log = FeedbackLog(
+            os.getenv("HG_FEEDBACK_LOG_DIR",
+                      os.path.join(os.path.dirname(os.path.dirname(__file__)), "feedback")),
+            segment_bytes=int(float(os.getenv("HG_FEEDBACK_SEGMENT_MB", "8")) * 1024 * 1024),
+        )
         self.training_history = []
         self.learning_rate = 0.001
         self.optimizer = torch.optim.Adam(
-            self.model.classifier.parameters(), lr=self.learning_rate
+            self.working_head.parameters(), lr=self.learning_rate
         )
         self.feedback_count = 0
         self.training_sessions = 0
+        # Result-cache identity of the head: brain_id is random until a brain is
+        # saved (an unsaved head is re-initialized on every start); brain_version
+        # is the version of the published head, persisted with the brain
+        self.brain_id = uuid.uuid4().hex
+        self._loaded_brain_version = 0
 
         # Model save path
         self.models_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
         os.makedirs(self.models_dir, exist_ok=True)
         self.model_save_path = os.path.join(self.models_dir, "healthguard_brain.pth")
+        # Brain saves are coalesced and written atomically in the background
+        self.checkpoints = BrainCheckpointWriter(
+            self.model_save_path, self._brain_snapshot,
+            interval=float(os.getenv("HG_CHECKPOINT_INTERVAL_S", "5")),
+            generations=int(os.getenv("HG_CHECKPOINT_GENERATIONS", "3")),
+        )
 
         # Try to load previously saved trained brain
         self._load_brain()
+        self.heads = HeadRegistry(
+            self.working_head, self.findings_list, version=self._loaded_brain_version,
+            source="brain" if self._loaded_brain_version else "init",
+        )
+        self.model.classifier = self.heads.current().classifier
+
+        # Feedback corrections are trained as weighted minibatches (or one by
+        # one with HG_FEEDBACK_MODE=immediate)
+        self.feedback_buffer = FeedbackAccumulator(
+            self._apply_feedback_batch,
+            batch_size=int(os.getenv("HG_FEEDBACK_BATCH_SIZE", "16")),
+            interval=float(os.getenv("HG_FEEDBACK_INTERVAL_MS", "2000")) / 1000,
+            mode=os.getenv("HG_FEEDBACK_MODE", "buffered"),
+        )
+
+        # Optional ONNX Runtime engine for findings-only requests
+        self.findings_engine = None
+        if os.getenv("HG_FINDINGS_ENGINE", "torch") == "onnxruntime":
+            engine = OnnxFindingsEngine(
+                self.model.features, self.heads, os.path.join(self.models_dir, "onnx")
+            )
+            if engine.available:
+                self.findings_engine = engine
+            else:
+                print("[HealthGuard AI] ⚠️ onnxruntime not installed, findings-only requests use PyTorch")
+
+        # Backbone features of analyzed scans, reused by feedback / re-analysis
+        self.feature_store = None
+        if os.getenv("HG_FEATURE_STORE", "1") != "0":
+            try:
+                self.feature_store = FeatureStore(
+                    os.getenv("HG_FEATURE_STORE_DIR",
+                              os.path.join(tempfile.gettempdir(), "HealthGuard_features")),
+                    dim=self.num_features,
+                    map_shape=(self.num_features, 7, 7),
+                    store_maps=os.getenv("HG_FEATURE_STORE_MAPS", "1") != "0",
+                    max_bytes=int(float(os.getenv("HG_FEATURE_STORE_MB", "1024")) * 1024 * 1024),
+                )
+            except Exception as e:
+                print(f"[HealthGuard AI] ⚠️ Feature store disabled: {e}")
+
+        # Micro-batching queue: concurrent analyze() calls share one forward (+ CAM)
+        self.batcher = InferenceBatcher(
+            self._forward_items,
+            max_batch_size=int(os.getenv("HG_BATCH_MAX_SIZE", "16")),
+            window_ms=float(os.getenv("HG_BATCH_WINDOW_MS", "10")),
+            name="analyze",
+        )
+
+        # LLM providers run concurrently with the CNN under one deadline
+        self.llm_fanout = LLMFanout(
+            max_workers=int(os.getenv("HG_LLM_WORKERS", "8")),
+            deadline=float(os.getenv("HG_LLM_DEADLINE_S", "45")),
+        )
+
+        # Parsed Groq / Claude answers by (model, prompt version, patient fields, pixels)
+        self.llm_cache = LLMResponseCache(
+            path=os.getenv("HG_LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "HealthGuard_llm_cache.sqlite3")),
+            ttl=float(os.getenv("HG_LLM_CACHE_TTL_H", "168")) * 3600,
+            max_bytes=int(float(os.getenv("HG_LLM_CACHE_MB", "64")) * 1024 * 1024),
+            enabled=os.getenv("HG_LLM_CACHE", "1") != "0",
+        )
+
+        # API keys of each LLM provider, routed by their remaining rate-limit budget
+        self.groq_keys = KeyScheduler(
+            "groq", _env_keys("GROQ_API_KEY"),
+            rpm=float(os.getenv("HG_GROQ_KEY_RPM", "30")),
+            max_wait=float(os.getenv("HG_KEY_MAX_WAIT_S", "30")),
+            auth_cooldown=float(os.getenv("HG_KEY_AUTH_COOLDOWN_S", "300")),
+        )
+        self.claude_keys = KeyScheduler(
+            "claude", _env_keys("CLAUDE_API_KEY"),
+            rpm=float(os.getenv("HG_CLAUDE_KEY_RPM", "50")),
+            max_wait=float(os.getenv("HG_KEY_MAX_WAIT_S", "30")),
+            auth_cooldown=float(os.getenv("HG_KEY_AUTH_COOLDOWN_S", "300")),
+        )
+
+        # Per provider + model circuit breakers, and optional hedging of slow calls
+        self.breakers = CircuitBreakers(
+            window=int(os.getenv("HG_BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("HG_BREAKER_MIN_CALLS", "5")),
+            error_rate=float(os.getenv("HG_BREAKER_ERROR_RATE", "0.5")),
+            slow_ms=float(os.getenv("HG_BREAKER_SLOW_MS", "20000")),
+            slow_rate=float(os.getenv("HG_BREAKER_SLOW_RATE", "0.5")),
+            open_seconds=float(os.getenv("HG_BREAKER_OPEN_S", "30")),
+        )
+        self.hedger = Hedger(
+            enabled=os.getenv("HG_LLM_HEDGE", "0") == "1",
+            min_delay=float(os.getenv("HG_LLM_HEDGE_MIN_MS", "1000")) / 1000.0,
+            max_workers=2 * int(os.getenv("HG_LLM_WORKERS", "8")),
+        )
+        # Stream the Groq / Claude completions so early fields arrive before the full report
+        self.llm_stream = os.getenv("HG_LLM_STREAM", "1") != "0"
+
+        # Keep-alive pools shared by every outbound call (LLMs, NVIDIA, Supabase)
+        self.http = HttpGateway(
+            pool_size=int(os.getenv("HG_HTTP_POOL_SIZE", "10")),
+            timeout=float(os.getenv("HG_HTTP_TIMEOUT_S", "30")),
+            connect_timeout=float(os.getenv("HG_HTTP_CONNECT_TIMEOUT_S", "10")),
+            retries=int(os.getenv("HG_HTTP_RETRIES", "2")),
+            backoff=float(os.getenv("HG_HTTP_BACKOFF_MS", "200")) / 1000.0,
+        )
 
         print("[HealthGuard AI] Model loaded successfully")
         print("[HealthGuard AI] Feedback & dataset training system initialized")
 
+    def warm_up(self) -> dict:
+        """Build/warm the inference backends so the first request doesn't pay for it."""
+        if self.findings_engine is not None:
+            self.findings_engine.ensure_current(background=False)
+        return self.backbone.warm_up()
+
+    @property
+    def brain_version(self) -> int:
+        """Version of the current published head (saved with the brain)."""
+        return self.heads.current().version
+
+    def _publish_head(self, source: str):
+        """Make the working head (and its findings) the current inference head (write_lock held)."""
+        head = self.heads.publish(self.working_head, self.findings_list, source)
+        self.model.classifier = head.classifier
+        if self.findings_engine is not None:
+            self.findings_engine.ensure_current()  # background re-export for the new version
+        return head
+
     def _save_brain(self):
-        """Save the trained model brain (classifier weights + findings) to disk."""
-        try:
-            brain_data = {
-                "classifier_state_dict": self.model.classifier.state_dict(),
-                "findings_list": self.findings_list,
-                "custom_findings": self.custom_findings,
-                "num_features": self.num_features,
-                "feedback_count": self.feedback_count,
-                "training_sessions": self.training_sessions,
-                "training_history": self.training_history,
-                "feedback_history_count": len(self.feedback_history),
-            }
-            torch.save(brain_data, self.model_save_path)
-            size_mb = os.path.getsize(self.model_save_path) / (1024 * 1024)
-            timestamp = time.strftime("%H:%M:%S")
-            print(f"\n[HealthGuard AI] ✅ BRAIN SAVED! Weights updated at {timestamp}")
-            print(f"                 File: {self.model_save_path}")
-            print(f"                 Size: {size_mb:.2f} MB")
-        except Exception as e:
-            print(f"[HealthGuard AI] ❌ Warning: Could not save brain: {e}")
+        """Schedule a checkpoint of the brain (written by the checkpoint thread)."""
+        self.checkpoints.request()
+
+    def _brain_snapshot(self) -> dict:
+        """Brain contents for a checkpoint: the current published head (classifier weights + findings)."""
+        head = self.heads.current()
+        return {
+            "brain_id": self.brain_id,
+            "brain_version": head.version,
+            "classifier_state_dict": head.classifier.state_dict(),
+            "findings_list": list(head.findings),
+            "custom_findings": [f for f in self.custom_findings if f in head.findings],
+            "num_features": self.num_features,
+            "feedback_count": self.feedback_count,
+            "training_sessions": self.training_sessions,
+            "feedback_history_count": self.feedback_log.total,
+        }
+
+    def _read_brain(self):
+        """Newest readable checkpoint (the brain, else its rotated generations), or None."""
+        for path in self.checkpoints.candidates():
+            try:
+                brain_data = torch.load(path, map_location=self.device, weights_only=False)
+            except Exception as e:
+                print(f"[HealthGuard AI] ⚠️ Could not read brain checkpoint {os.path.basename(path)}: {e}")
+                continue
+            if path != self.model_save_path:
+                print(f"[HealthGuard AI] Restoring brain from {os.path.basename(path)}")
+            return brain_data
+        return None
 
     def _load_brain(self):
         """Load a previously saved model brain from disk."""
-        if not os.path.exists(self.model_save_path):
+        if not self.checkpoints.candidates():
             print("[HealthGuard AI] No saved brain found, starting fresh")
             return
 
         try:
-            brain_data = torch.load(self.model_save_path, map_location=self.device, weights_only=False)
+            brain_data = self._read_brain()
+            if brain_data is None:
+                print("[HealthGuard AI] Warning: No readable brain checkpoint, starting fresh")
+                return
 
             # Validate findings list
             saved_findings = brain_data.get("findings_list", [])
@@ -324,21 +548,28 @@ class MedicalImageAnalyzer:
                 # Rebuild classifier to match saved size
                 self.findings_list = saved_findings
                 self.custom_findings = saved_custom
-                self.model.classifier = nn.Linear(self.num_features, len(self.findings_list))
-                self.model.classifier = self.model.classifier.to(self.device)
+                self.working_head = nn.Linear(self.num_features, len(self.findings_list))
+                self.working_head = self.working_head.to(self.device)
 
             # Load classifier weights
-            self.model.classifier.load_state_dict(brain_data["classifier_state_dict"])
-            self.model.eval()
+            self.working_head.load_state_dict(brain_data["classifier_state_dict"])
+            self.working_head.eval()
 
             # Restore training stats
             self.feedback_count = brain_data.get("feedback_count", 0)
             self.training_sessions = brain_data.get("training_sessions", 0)
-            self.training_history = brain_data.get("training_history", [])
+            self.training_history = self.checkpoints.load_history()
+            if not self.training_history and brain_data.get("training_history"):
+                # Brain from before the history log: move its history there once
+                for record in brain_data["training_history"]:
+                    self.checkpoints.append_history(record)
+                self.training_history = list(brain_data["training_history"])
+            self.brain_id = brain_data.get("brain_id", "legacy")
+            self._loaded_brain_version = brain_data.get("brain_version", 0)
 
             # Rebuild optimizer for new classifier
             self.optimizer = torch.optim.Adam(
-                self.model.classifier.parameters(), lr=self.learning_rate
+                self.working_head.parameters(), lr=self.learning_rate
             )
 
             print(f"[HealthGuard AI] 🧠 Brain loaded! "
@@ -349,7 +580,10 @@ class MedicalImageAnalyzer:
             print(f"[HealthGuard AI] Warning: Could not load brain: {e}, starting fresh")
 
     def _expand_classifier(self, new_finding: str):
-        """Dynamically expand the classifier layer to support a new finding."""
+        """
+        Dynamically expand the working classifier to support a new finding
+        (caller holds heads.write_lock; inference sees it after the next publish).
+        """
         if new_finding in self.findings_list:
             return  # Already exists
 
@@ -359,7 +593,7 @@ class MedicalImageAnalyzer:
         new_num = len(self.findings_list)
 
         # Create new classifier with one more output
-        old_classifier = self.model.classifier
+        old_classifier = self.working_head
         new_classifier = nn.Linear(self.num_features, new_num).to(self.device)
 
         # Copy old weights
@@ -370,12 +604,11 @@ class MedicalImageAnalyzer:
             nn.init.xavier_uniform_(new_classifier.weight[old_num:old_num + 1])
             nn.init.zeros_(new_classifier.bias[old_num:old_num + 1])
 
-        self.model.classifier = new_classifier
-        self.model = self.model.to(self.device)
+        self.working_head = new_classifier
 
         # Rebuild optimizer with new params
         self.optimizer = torch.optim.Adam(
-            self.model.classifier.parameters(), lr=self.learning_rate
+            self.working_head.parameters(), lr=self.learning_rate
         )
 
         # Add default description/severity for the custom finding
@@ -403,9 +636,16 @@ class MedicalImageAnalyzer:
         self._expand_classifier(finding_name)
         return self.findings_list.index(finding_name)
 
-    def apply_feedback(self, image: Image.Image, feedback: dict) -> dict:
+    def apply_feedback(self, image: Image.Image, feedback: dict, session_id: str = None,
+                       original_filename: str = "") -> dict:
         """
         Apply reinforcement learning feedback to fine-tune the model.
+        If the backbone features of session_id are in the feature store, the
+        image is not run through DenseNet again. The correction is handed to
+        the feedback accumulator: applied now (HG_FEEDBACK_MODE=immediate) or
+        queued for the next weighted minibatch (result["queued"]). Training
+        publishes a new head version; analyses already running finish on the
+        version they started with. The feedback is stored in the feedback log.
 
         feedback dict should contain:
           - correct_finding: str (known finding OR custom typed finding)
@@ -430,209 +670,190 @@ class MedicalImageAnalyzer:
         result = {
             "feedback_applied": False,
             "model_updated": False,
-            "feedback_id": self.feedback_count + 1,
             "message": "",
             "is_custom_finding": False,
         }
+        is_new = bool(correct_finding) and correct_finding not in self.findings_list
+        record = self.feedback_log.append({
+            "session_id": session_id or "",
+            "original_filename": original_filename,
+            "correct_finding": correct_finding,
+            "custom_finding": custom_finding,
+            "severity_correction": feedback.get("severity_correction", ""),
+            "scan_type": scan_type,
+            "notes": notes,
+            "description": description,
+            "rating": rating,
+            "model_updated": False,
+            "is_custom": is_new,
+        })
+        feedback_id = record["id"]
+        with self.heads.write_lock:
+            self.feedback_count += 1
 
         if not correct_finding:
             result["message"] = "No finding specified. Feedback recorded but no training."
         else:
-            is_new = correct_finding not in self.findings_list
-            target_idx = self._get_finding_index(correct_finding)
-
+            stored = self._stored_features(session_id)
+            if stored is not None:
+                # Pooled features saved when the scan was analyzed
+                features = torch.from_numpy(stored.pooled).unsqueeze(0).to(self.device)
+            else:
+                # Convert image and run the frozen feature extractor
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+                with torch.no_grad():
+                    features = self.model.features(input_tensor)
+                    features = F.relu(features)
+                    features = F.adaptive_avg_pool2d(features, (1, 1))
+                    features = torch.flatten(features, 1)
+
+            # Reinforcement: low ratings pull harder, high ratings are smoothed
+            weight, smoothing = rating_to_weight(rating)
+            sample = FeedbackSample(features.detach(), correct_finding, weight, smoothing,
+                                    feedback_id=feedback_id)
             if is_new:
                 result["is_custom_finding"] = True
-                # Update description if provided
-                if description.strip():
-                    FINDING_DESCRIPTIONS[correct_finding] = description.strip()
-
-                # Update severity if provided
+                # Description / severity if provided, applied after the head is expanded
+                sample.description = description.strip()
                 sev = feedback.get("severity_correction", "")
                 if sev in ("low", "medium", "high"):
-                    SEVERITY_LEVELS[correct_finding] = sev
-
-            # Convert image and run training step
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            input_tensor = self.transform(image).unsqueeze(0).to(self.device)
-            target_tensor = torch.tensor([target_idx], dtype=torch.long).to(self.device)
-
-            # Fine-tune the classifier layer
-            self.model.classifier.train()
-            self.optimizer.zero_grad()
-
-            # Forward pass through frozen feature extractor
-            with torch.no_grad():
-                features = self.model.features(input_tensor)
-                features = F.relu(features)
-                features = F.adaptive_avg_pool2d(features, (1, 1))
-                features = torch.flatten(features, 1)
-
-            output = self.model.classifier(features)
+                    sample.severity = sev
+
+            applied = self.feedback_buffer.submit(sample)
+
+            if applied["applied"]:
+                result["feedback_applied"] = True
+                result["model_updated"] = True
+                result["loss"] = applied["loss"]
+                result["training_steps"] = applied["training_steps"]
+                result["head_version"] = applied["head_version"]
+                result["message"] = (
+                    f"{'New custom finding added and m' if is_new else 'M'}odel updated successfully! "
+                    f"Trained on '{correct_finding}' for {applied['training_steps']} step(s) "
+                    f"with avg loss={applied['loss']:.4f}. "
+                    f"Scan type: {scan_type}. "
+                    f"The model will now produce improved predictions for similar findings."
+                )
+            else:
+                buffer = self.feedback_buffer
+                result["queued"] = True
+                result["queue_depth"] = applied["queue_depth"]
+                result["message"] = (
+                    f"Feedback on '{correct_finding}' queued for training "
+                    f"({applied['queue_depth']} waiting). It is applied with the next feedback "
+                    f"minibatch, within {buffer.interval:g}s or once {buffer.batch_size} corrections are queued. "
+                    f"Scan type: {scan_type}."
+                )
+
+        result["feedback_id"] = feedback_id
+        result["total_feedbacks"] = self.feedback_log.total
+        result["total_findings"] = len(self.findings_list)
+        result["custom_findings"] = list(self.custom_findings)
 
-            # Loss with label smoothing based on rating
-            smoothing = max(0.0, (rating - 1) / 4.0) * 0.3
-            loss = F.cross_entropy(output, target_tensor, label_smoothing=smoothing)
+        print(f"[HealthGuard AI] Feedback #{feedback_id} processed. "
+              f"Model updated: {result['model_updated']}. "
+              f"Total findings: {len(self.findings_list)}")
 
-            # Reinforcement: repeat training steps for low ratings (stronger correction)
-            num_steps = max(1, 6 - rating)  # rating 1→5 steps, rating 5→1 step
-            total_loss = loss.item()
+        return result
 
-            loss.backward()
-            self.optimizer.step()
+    def _apply_feedback_batch(self, samples: list) -> dict:
+        """
+        Train the working head on a weighted minibatch of FeedbackSamples and
+        publish it as a new head version (called by the feedback accumulator).
+        Every sample's loss is cross-entropy with its own label smoothing; the
+        batch loss is the weight-normalized sum and max(weight) steps are taken.
+        """
+        with self.heads.write_lock:
+            targets = torch.tensor(
+                [self._get_finding_index(s.finding) for s in samples], dtype=torch.long
+            ).to(self.device)
+            # Reviewer's description / severity replace the defaults of new custom findings
+            for s in samples:
+                if s.description:
+                    FINDING_DESCRIPTIONS[s.finding] = s.description
+                if s.severity:
+                    SEVERITY_LEVELS[s.finding] = s.severity
+            features = torch.cat([s.features for s in samples]).to(self.device)
+            weights = torch.tensor([s.weight for s in samples], device=self.device)
+            smoothing = torch.tensor([s.smoothing for s in samples], device=self.device)
+            num_steps = int(max(s.weight for s in samples))
 
-            # Additional reinforcement steps for low ratings
-            for _ in range(num_steps - 1):
+            # Fine-tune the classifier layer
+            self.working_head.train()
+            total_loss = 0.0
+            for _ in range(num_steps):
                 self.optimizer.zero_grad()
-                output = self.model.classifier(features)
-                loss = F.cross_entropy(output, target_tensor, label_smoothing=smoothing)
+                log_probs = F.log_softmax(self.working_head(features), dim=1)
+                nll = -log_probs.gather(1, targets.unsqueeze(1)).squeeze(1)
+                per_sample = (1 - smoothing) * nll - smoothing * log_probs.mean(dim=1)
+                loss = (weights * per_sample).sum() / weights.sum()
                 loss.backward()
                 self.optimizer.step()
                 total_loss += loss.item()
+            self.working_head.eval()
 
-            self.model.classifier.eval()
-            avg_loss = total_loss / num_steps
-
-            result["feedback_applied"] = True
-            result["model_updated"] = True
-            result["loss"] = round(avg_loss, 4)
-            result["training_steps"] = num_steps
-            finding_label = correct_finding
-            result["message"] = (
-                f"{'New custom finding added and m' if is_new else 'M'}odel updated successfully! "
-                f"Trained on '{finding_label}' for {num_steps} step(s) with avg loss={avg_loss:.4f}. "
-                f"Scan type: {scan_type}. "
-                f"The model will now produce improved predictions for similar findings."
-            )
-
-        # Store feedback in history
-        self.feedback_count += 1
-        feedback_entry = {
-            "id": self.feedback_count,
-            "correct_finding": correct_finding,
-            "custom_finding": custom_finding,
-            "severity_correction": feedback.get("severity_correction", ""),
-            "scan_type": scan_type,
-            "notes": notes,
-            "description": description,
-            "rating": rating,
-            "model_updated": result["model_updated"],
-            "is_custom": result.get("is_custom_finding", False),
-            "timestamp": str(uuid.uuid4())[:8],
-        }
-        self.feedback_history.append(feedback_entry)
-
-        result["feedback_id"] = self.feedback_count
-        result["total_feedbacks"] = len(self.feedback_history)
-        result["total_findings"] = len(self.findings_list)
-        result["custom_findings"] = list(self.custom_findings)
-
-        print(f"[HealthGuard AI] Feedback #{self.feedback_count} processed. "
-              f"Model updated: {result['model_updated']}. "
-              f"Total findings: {len(self.findings_list)}")
+            head = self._publish_head("feedback")
+            for s in samples:
+                if s.feedback_id is not None:
+                    self.feedback_log.mark_applied(s.feedback_id, head.version)
 
-        # Auto-save brain after feedback
-        if result["model_updated"]:
-            self._save_brain()
+        # Auto-save brain after feedback (coalesced, written in the background)
+        self._save_brain()
 
-        return result
+        avg_loss = total_loss / num_steps
+        print(f"[HealthGuard AI] Feedback minibatch: {len(samples)} sample(s), "
+              f"{num_steps} step(s), avg loss={avg_loss:.4f}, head v{head.version}")
+        return {"loss": round(avg_loss, 4), "training_steps": num_steps,
+                "batch_size": len(samples), "head_version": head.version}
 
     def train_on_dataset(self, dataset_dir: str, description: str = "",
                          finding_label: str = "", epochs: int = 3,
-                         progress_callback=None, cancel_flag=None) -> dict:
+                         progress_callback=None, cancel_flag=None, mode: str = None,
+                         started_at: float = None) -> dict:
         """
         Train the model on a folder of images (e.g. from Kaggle).
 
         Args:
-            dataset_dir: Path to folder containing images (can have subfolders)
+            dataset_dir: Path to folder containing images (can have subfolders),
+                         or to a ZIP/TAR archive, which is read in place
+                         (indexed once, members decoded straight from it)
             description: Description of the dataset
             finding_label: What finding these images represent (or subfolder names used)
             epochs: Number of training epochs
-            progress_callback: Optional callback(progress_pct, message)
+            progress_callback: Optional callback(progress_pct, message, stats=None, event=None);
+                               stats carries the loader/compute throughput, event
+                               the phase, epoch, image index and running loss
             cancel_flag: Optional dict with 'cancel' key — if True, training stops early
+            mode: "precomputed" (default, HG_TRAIN_MODE) extracts pooled features
+                  once and trains the classifier on shuffled minibatches;
+                  "online" runs the backbone on freshly augmented minibatches
+                  every epoch ("per-image" is accepted as an alias)
+            started_at: time.perf_counter() of when the dataset arrived; origin
+                        of throughput["first_batch_seconds"] (default: loader start)
 
         Returns:
             Training result dict with stats
         """
-        import glob
         import time
 
-        IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp', '.dcm'}
-
-        # Collect all image files
-        all_images = []
-        label_map = {}  # maps image path -> finding label
-
-        # Check if dataset has subfolders (each subfolder = a label)
-        subdirs = [d for d in os.listdir(dataset_dir)
-                   if os.path.isdir(os.path.join(dataset_dir, d))
-                   and not d.startswith('.')]
-
-        if subdirs and not finding_label:
-            # Use subfolder names as labels
-            for subdir in subdirs:
-                subdir_path = os.path.join(dataset_dir, subdir)
-                for f in os.listdir(subdir_path):
-                    ext = os.path.splitext(f)[1].lower()
-                    if ext in IMAGE_EXTS:
-                        fpath = os.path.join(subdir_path, f)
-                        all_images.append(fpath)
-                        label_map[fpath] = subdir
-        else:
-            # All images get the same label
-            label = finding_label if finding_label else "Dataset Finding"
-            for root, dirs, files in os.walk(dataset_dir):
-                for f in files:
-                    ext = os.path.splitext(f)[1].lower()
-                    if ext in IMAGE_EXTS:
-                        fpath = os.path.join(root, f)
-                        all_images.append(fpath)
-                        label_map[fpath] = label
-
-        # Also check for CSV label files
-        csv_files = glob.glob(os.path.join(dataset_dir, "*.csv"))
-        if csv_files:
+        # Collect all image files and their labels
+        source = None
+        if os.path.isfile(dataset_dir):
             try:
-                import csv
-                csv_path = csv_files[0]
-                with open(csv_path, 'r', encoding='utf-8', errors='ignore') as cf:
-                    reader = csv.DictReader(cf)
-                    headers = [h.lower() for h in reader.fieldnames] if reader.fieldnames else []
-
-                    # Try to find image and label columns
-                    img_col = None
-                    label_col = None
-                    for h in reader.fieldnames or []:
-                        hl = h.lower()
-                        if any(k in hl for k in ['image', 'file', 'path', 'filename']):
-                            img_col = h
-                        if any(k in hl for k in ['label', 'finding', 'class', 'diagnosis', 'category']):
-                            label_col = h
-
-                    if img_col and label_col:
-                        cf.seek(0)
-                        next(reader)  # skip header
-                        for row in reader:
-                            img_name = row.get(img_col, '')
-                            lbl = row.get(label_col, '')
-                            if img_name and lbl:
-                                # Try to find the image file
-                                possible_paths = [
-                                    os.path.join(dataset_dir, img_name),
-                                    os.path.join(dataset_dir, 'images', img_name),
-                                ]
-                                for pp in possible_paths:
-                                    if os.path.exists(pp):
-                                        if pp not in all_images:
-                                            all_images.append(pp)
-                                        label_map[pp] = lbl
-                                        break
-
-                print(f"[HealthGuard AI] CSV labels loaded from {csv_files[0]}")
+                source = ArchiveSource(dataset_dir)
             except Exception as e:
-                print(f"[HealthGuard AI] CSV parsing warning: {e}")
+                return {
+                    "success": False,
+                    "message": f"Could not read the uploaded archive: {e}",
+                    "images_found": 0,
+                }
+            all_images, label_map = discover_archive_images(source, finding_label)
+            print(f"[HealthGuard AI] Indexed {len(source.members)} {source.kind} members in "
+                  f"{source.index_seconds:.2f}s (streaming={source.streaming})")
+        else:
+            all_images, label_map = discover_labeled_images(dataset_dir, finding_label)
 
         if not all_images:
             return {
@@ -643,103 +864,46 @@ class MedicalImageAnalyzer:
 
         # Ensure all labels have classifier neurons
         unique_labels = set(label_map.values())
-        for label in unique_labels:
-            if label not in self.findings_list:
-                self._expand_classifier(label)
-                if description:
-                    FINDING_DESCRIPTIONS[label] = description
+        with self.heads.write_lock:
+            for label in unique_labels:
+                if label not in self.findings_list:
+                    self._expand_classifier(label)
+                    if description:
+                        FINDING_DESCRIPTIONS[label] = description
+
+        if mode is None:
+            mode = os.getenv("HG_TRAIN_MODE", "precomputed")
+        if mode == "per-image":
+            mode = "online"
+        if mode not in ("precomputed", "online"):
+            print(f"[HealthGuard AI] ⚠️ Unknown training mode '{mode}', using precomputed")
+            mode = "precomputed"
 
         # Build training data
         start_time = time.time()
         total_images = len(all_images)
-        processed = 0
-        failed = 0
-        total_loss = 0.0
-        batch_losses = []
+        mode_stats = {}
 
         if progress_callback:
             progress_callback(0, f"Starting training on {total_images} images...")
 
-        self.model.classifier.train()
-
-        cancelled = False
-
-        for epoch in range(epochs):
-            # Check for cancellation at start of each epoch
-            if cancel_flag and cancel_flag.get("cancel"):
-                cancelled = True
-                print(f"[HealthGuard AI] Training cancelled at epoch {epoch + 1}")
-                break
-
-            epoch_loss = 0.0
-            epoch_count = 0
-
-            # Shuffle images each epoch
-            import random
-            random.shuffle(all_images)
-
-            for i, img_path in enumerate(all_images):
-                try:
-                    img = Image.open(img_path)
-                    if img.mode != "RGB":
-                        img = img.convert("RGB")
-
-                    label = label_map[img_path]
-                    target_idx = self.findings_list.index(label)
-
-                    # Use augmented transform for training
-                    input_tensor = self.train_transform(img).unsqueeze(0).to(self.device)
-                    target_tensor = torch.tensor([target_idx], dtype=torch.long).to(self.device)
-
-                    self.optimizer.zero_grad()
-
-                    # Forward through frozen features
-                    with torch.no_grad():
-                        features = self.model.features(input_tensor)
-                        features = F.relu(features)
-                        features = F.adaptive_avg_pool2d(features, (1, 1))
-                        features = torch.flatten(features, 1)
-
-                    output = self.model.classifier(features)
-                    loss = F.cross_entropy(output, target_tensor)
-
-                    loss.backward()
-                    self.optimizer.step()
-
-                    epoch_loss += loss.item()
-                    epoch_count += 1
-                    processed += 1
-
-                except Exception as e:
-                    failed += 1
-                    print(f"[HealthGuard AI] Skipping {img_path}: {e}")
-
-                # Progress update + cancellation check
-                if cancel_flag and cancel_flag.get("cancel"):
-                    cancelled = True
-                    print(f"[HealthGuard AI] Training cancelled during epoch {epoch + 1}")
-                    break
-
-                if progress_callback:
-                    overall_progress = ((epoch * total_images + i + 1) /
-                                        (epochs * total_images)) * 100
-                    progress_callback(
-                        round(overall_progress, 1),
-                        f"Epoch {epoch + 1}/{epochs} — Image {i + 1}/{total_images}"
-                    )
-
-            if cancelled:
-                batch_losses.append(round(epoch_loss / max(epoch_count, 1), 4))
-                break
-
-            avg_epoch_loss = epoch_loss / max(epoch_count, 1)
-            batch_losses.append(round(avg_epoch_loss, 4))
-            total_loss += epoch_loss
-
-            print(f"[HealthGuard AI] Epoch {epoch + 1}/{epochs} — "
-                  f"Loss: {avg_epoch_loss:.4f}, Images: {epoch_count}")
+        # Inference keeps using the published head; the working head is updated
+        # one optimizer step at a time under write_lock (feedback can interleave)
+        # and published when training ends
+        if mode == "online":
+            processed, failed, batch_losses, mode_stats = self._train_online(
+                all_images, label_map, epochs, progress_callback, cancel_flag,
+                source=source, started_at=started_at,
+            )
+        else:
+            processed, failed, batch_losses, mode_stats = self._train_precomputed(
+                all_images, label_map, epochs, progress_callback, cancel_flag,
+                source=source, started_at=started_at,
+            )
 
-        self.model.classifier.eval()
+        with self.heads.write_lock:
+            self.working_head.eval()
+            head = self._publish_head("dataset-training")
 
         elapsed = time.time() - start_time
         self.training_sessions += 1
@@ -755,8 +919,10 @@ class MedicalImageAnalyzer:
             "epoch_losses": batch_losses,
             "elapsed_seconds": round(elapsed, 1),
             "description": description,
+            "mode": mode,
         }
         self.training_history.append(training_record)
+        self.checkpoints.append_history(training_record)
 
         result = {
             "success": True,
@@ -774,7 +940,18 @@ class MedicalImageAnalyzer:
             "custom_findings": list(self.custom_findings),
             "elapsed_seconds": round(elapsed, 1),
             "training_session": self.training_sessions,
+            "mode": mode,
+            "head_version": head.version,
+            **mode_stats,
         }
+        if source is not None:
+            result["archive"] = {
+                "kind": source.kind,
+                "members": len(source.members),
+                "streaming": source.streaming,
+                "index_seconds": round(source.index_seconds, 3),
+                "uncompressed_bytes": source.uncompressed_bytes,
+            }
 
         if progress_callback:
             progress_callback(100, "Training complete! Saving brain...")
@@ -788,48 +965,466 @@ class MedicalImageAnalyzer:
 
         return result
 
+    def _training_loader(self, all_images: list, label_map: dict, batch_size: int,
+                         plain: bool, base: bool, shuffle: bool,
+                         source: ArchiveSource = None, started_at: float = None):
+        """DataLoader over the dataset (decoding in worker processes) + its throughput meter."""
+        label_index = {label: self.findings_list.index(label) for label in set(label_map.values())}
+        dataset = make_scan_dataset(
+            all_images, [label_index[label_map[p]] for p in all_images],
+            source=source, plain=plain, base=base,
+        )
+        settings = loader_settings(self.device)
+        loader = make_loader(dataset, batch_size, settings, shuffle=shuffle)
+        return loader, ThroughputMeter(settings["workers"], started=started_at)
+
+    def _pooled_batch(self, batch: torch.Tensor) -> torch.Tensor:
+        """Pooled 1024-d backbone features of a normalized NCHW batch (no autograd)."""
+        activations = self.backbone(batch.to(self.device, non_blocking=True))
+        with torch.no_grad():
+            return torch.flatten(F.adaptive_avg_pool2d(F.relu(activations), (1, 1)), 1).float()
+
+    def _train_online(self, all_images: list, label_map: dict, epochs: int,
+                      progress_callback=None, cancel_flag=None,
+                      source: ArchiveSource = None, started_at: float = None):
+        """
+        Every epoch: freshly augmented minibatches (augment_batch on loader
+        output) -> frozen backbone -> one classifier step per minibatch.
+        Compressed TAR archives can only be streamed, so they are not shuffled.
+        Returns (processed, failed, epoch_losses, stats).
+        """
+        batch_size = max(1, int(os.getenv("HG_TRAIN_BATCH_SIZE", "32")))
+        loader, meter = self._training_loader(
+            all_images, label_map, batch_size, plain=False, base=True, shuffle=True,
+            source=source, started_at=started_at,
+        )
+        total_images = len(all_images)
+        processed = 0
+        failed = 0
+        batch_losses = []
+        cancelled = False
+
+        for epoch in range(epochs):
+            # Check for cancellation at start of each epoch
+            if cancel_flag and cancel_flag.get("cancel"):
+                print(f"[HealthGuard AI] Training cancelled at epoch {epoch + 1}")
+                break
+
+            epoch_loss = 0.0
+            epoch_count = 0
+            done = 0
+            waited = time.perf_counter()
+            for batch in loader:
+                meter.batch_loaded(batch, time.perf_counter() - waited)
+                done += len(batch["labels"]) + batch["failed"]
+                if epoch == 0:
+                    failed += batch["failed"]  # the same files fail every epoch
+
+                if batch["base"] is not None:
+                    start = time.perf_counter()
+                    features = self._pooled_batch(augment_batch(batch["base"]))
+                    targets = batch["labels"].to(self.device)
+                    with self.heads.write_lock:
+                        self.working_head.train()
+                        self.optimizer.zero_grad()
+                        loss = F.cross_entropy(self.working_head(features), targets)
+                        loss.backward()
+                        self.optimizer.step()
+                    meter.computed(time.perf_counter() - start)
+
+                    epoch_loss += loss.item() * len(targets)
+                    epoch_count += len(targets)
+                    processed += len(targets)
+
+                # Progress update + cancellation check
+                if cancel_flag and cancel_flag.get("cancel"):
+                    cancelled = True
+                    print(f"[HealthGuard AI] Training cancelled during epoch {epoch + 1}")
+                    break
+
+                if progress_callback:
+                    overall_progress = ((epoch * total_images + done) /
+                                        (epochs * total_images)) * 100
+                    snapshot = meter.snapshot()
+                    progress_callback(
+                        round(overall_progress, 1),
+                        f"Epoch {epoch + 1}/{epochs} — Image {done}/{total_images}",
+                        stats=snapshot,
+                        event={
+                            "phase": "train", "epoch": epoch + 1, "epochs": epochs,
+                            "image": done, "images": total_images,
+                            "running_loss": round(epoch_loss / max(epoch_count, 1), 4),
+                            "images_per_second": snapshot["images_per_second"],
+                        },
+                    )
+                waited = time.perf_counter()
+
+            batch_losses.append(round(epoch_loss / max(epoch_count, 1), 4))
+            if cancelled:
+                break
+
+            print(f"[HealthGuard AI] Epoch {epoch + 1}/{epochs} — "
+                  f"Loss: {batch_losses[-1]:.4f}, Images: {epoch_count}")
+
+        return processed, failed, batch_losses, {"throughput": meter.snapshot(), "batch_size": batch_size}
+
+    def _train_precomputed(self, all_images: list, label_map: dict, epochs: int,
+                           progress_callback=None, cancel_flag=None,
+                           source: ArchiveSource = None, started_at: float = None):
+        """
+        Two-phase training: pooled backbone features of every image are extracted
+        once (decoded in DataLoader workers, batched backbone forwards) into one
+        contiguous array, then the classifier is trained on shuffled minibatches
+        of that array for the requested epochs.
+
+        Augmentation is done up front as HG_TRAIN_AUGMENT_VIEWS extra views per
+        image (augment_batch), next to the plain view.
+        Returns (processed, failed, epoch_losses, stats).
+        """
+        batch_size = max(1, int(os.getenv("HG_TRAIN_BATCH_SIZE", "32")))
+        extract_batch = max(1, int(os.getenv("HG_TRAIN_EXTRACT_BATCH", "32")))
+        augment_views = max(0, int(os.getenv("HG_TRAIN_AUGMENT_VIEWS", "0")))
+        views = 1 + augment_views
+        total_images = len(all_images)
+
+        loader, meter = self._training_loader(
+            all_images, label_map, extract_batch, plain=True, base=augment_views > 0, shuffle=False,
+            source=source, started_at=started_at,
+        )
+
+        # Phase 1: pooled features, one row per (image, view)
+        features = np.empty((total_images * views, self.num_features), dtype=np.float32)
+        labels = np.empty(total_images * views, dtype=np.int64)
+        rows = 0
+        failed = 0
+        done = 0
+        cancelled = False
+        extract_start = time.time()
+
+        waited = time.perf_counter()
+        for batch in loader:
+            meter.batch_loaded(batch, time.perf_counter() - waited)
+            done += len(batch["labels"]) + batch["failed"]
+            failed += batch["failed"]
+
+            if batch["plain"] is not None:
+                start = time.perf_counter()
+                view_batches = [normalize_batch(batch["plain"])]
+                view_batches += [augment_batch(batch["base"]) for _ in range(augment_views)]
+                for view in view_batches:
+                    n = len(view)
+                    features[rows:rows + n] = self._pooled_batch(view).cpu().numpy()
+                    labels[rows:rows + n] = batch["labels"].numpy()
+                    rows += n
+                meter.computed(time.perf_counter() - start)
+
+            if cancel_flag and cancel_flag.get("cancel"):
+                cancelled = True
+                print("[HealthGuard AI] Training cancelled during feature extraction")
+                break
+
+            if progress_callback:
+                snapshot = meter.snapshot()
+                progress_callback(
+                    round(done / total_images * 80, 1),
+                    f"Extracting features — Image {done}/{total_images}",
+                    stats=snapshot,
+                    event={
+                        "phase": "extract", "epoch": None, "epochs": epochs,
+                        "image": done, "images": total_images, "running_loss": None,
+                        "images_per_second": snapshot["images_per_second"],
+                    },
+                )
+            waited = time.perf_counter()
+
+        extract_seconds = time.time() - extract_start
+        print(f"[HealthGuard AI] Extracted {rows} feature rows ({views} view(s) per image) "
+              f"in {extract_seconds:.1f}s")
+
+        # Phase 2: classifier minibatch training on the cached features
+        batch_losses = []
+        processed = 0
+        if rows and not cancelled:
+            x_all = torch.from_numpy(features[:rows]).to(self.device)
+            y_all = torch.from_numpy(labels[:rows]).to(self.device)
+            num_batches = (rows + batch_size - 1) // batch_size
+
+            for epoch in range(epochs):
+                perm = torch.randperm(rows, device=self.device)
+                epoch_loss = 0.0
+                for b in range(num_batches):
+                    idx = perm[b * batch_size:(b + 1) * batch_size]
+                    with self.heads.write_lock:
+                        self.working_head.train()
+                        self.optimizer.zero_grad()
+                        loss = F.cross_entropy(self.working_head(x_all[idx]), y_all[idx])
+                        loss.backward()
+                        self.optimizer.step()
+                    epoch_loss += loss.item() * len(idx)
+
+                    if cancel_flag and cancel_flag.get("cancel"):
+                        cancelled = True
+                        break
+
+                batch_losses.append(round(epoch_loss / rows, 4))
+                processed += rows // views
+                if cancelled:
+                    print(f"[HealthGuard AI] Training cancelled during epoch {epoch + 1}")
+                    break
+
+                print(f"[HealthGuard AI] Epoch {epoch + 1}/{epochs} — "
+                      f"Loss: {batch_losses[-1]:.4f}, Samples: {rows}")
+                if progress_callback:
+                    snapshot = meter.snapshot()
+                    progress_callback(
+                        round(80 + (epoch + 1) / epochs * 20, 1),
+                        f"Epoch {epoch + 1}/{epochs} — {num_batches} minibatches of {batch_size}",
+                        stats=snapshot,
+                        event={
+                            "phase": "train", "epoch": epoch + 1, "epochs": epochs,
+                            "image": total_images, "images": total_images,
+                            "running_loss": batch_losses[-1],
+                            "images_per_second": snapshot["images_per_second"],
+                        },
+                    )
+
+        stats = {
+            "feature_extraction_seconds": round(extract_seconds, 1),
+            "images_per_second": round((total_images - failed) / extract_seconds, 1) if extract_seconds else None,
+            "augment_views": augment_views,
+            "batch_size": batch_size,
+            "throughput": meter.snapshot(),
+        }
+        return processed, failed, batch_losses, stats
+
     def get_feedback_stats(self) -> dict:
         """Return feedback and training statistics."""
-        total = len(self.feedback_history)
-        updated = sum(1 for f in self.feedback_history if f.get("model_updated"))
-        avg_rating = (
-            sum(f.get("rating", 3) for f in self.feedback_history) / total
-            if total > 0 else 0
-        )
+        log = self.feedback_log.stats()  # running aggregates, no history scan
         return {
-            "total_feedbacks": total,
-            "model_updates": updated,
-            "average_rating": round(avg_rating, 1),
-            "recent_feedbacks": self.feedback_history[-5:],
+            "total_feedbacks": log["total"],
+            "model_updates": log["model_updates"],
+            "average_rating": log["average_rating"],
+            "rating_counts": log["rating_counts"],
+            "finding_counts": log["finding_counts"],
+            "recent_feedbacks": self.feedback_log.recent(5),
             "total_findings": len(self.findings_list),
             "custom_findings": list(self.custom_findings),
             "training_sessions": self.training_sessions,
             "training_history": self.training_history[-5:],
+            "feedback_queue": self.feedback_buffer.stats(),
         }
 
-    def analyze(self, image: Image.Image, output_dir: str, patient_name: str = "", scan_type: str = "", body_part: str = "", patient_description: str = "", puter_result: dict = None) -> dict:
+    def analyze(self, image: Image.Image, output_dir: str, patient_name: str = "", scan_type: str = "", body_part: str = "", patient_description: str = "", puter_result: dict = None, generate_heatmap: bool = True, session_id: str = None, image_hash: str = None, head: HeadVersion = None, use_llm_cache: bool = True, on_partial=None) -> dict:
         """
         Analyze a medical image.
         Returns findings, heatmap path, annotated image path, and detailed report data.
         If puter_result is provided (from frontend Puter.js), it is used as primary AI result.
+        With generate_heatmap=False only the findings are computed (no CAM, no images).
+        session_id / image_hash key the feature store: if features for the session
+        or the same pixels are stored, only the classifier head runs; otherwise
+        the features of this forward are stored.
+        Every step uses one classifier head version (`head`, default: the current
+        one), reported as result["head_version"].
+        The LLM providers are called concurrently with the CNN work; per-stage
+        timings are returned in result["timings"]. use_llm_cache=False skips
+        cached LLM answers.
+        on_partial(source, field, value) receives the early fields (findings,
+        overall_severity, primary_finding) of the local model and of each LLM
+        provider as soon as they are known, before the full result.
+        This is analyze_local() followed by enrich().
+        """
+        result, llm = self.analyze_local(
+            image, output_dir, patient_name=patient_name, scan_type=scan_type, body_part=body_part,
+            patient_description=patient_description, puter_result=puter_result,
+            generate_heatmap=generate_heatmap, session_id=session_id, image_hash=image_hash, head=head,
+            use_llm_cache=use_llm_cache, on_partial=on_partial,
+        )
+        return self.enrich(result, llm, puter_result=puter_result)
+
+    def analyze_local(self, image: Image.Image, output_dir: str, patient_name: str = "", scan_type: str = "", body_part: str = "", patient_description: str = "", puter_result: dict = None, generate_heatmap: bool = True, session_id: str = None, image_hash: str = None, head: HeadVersion = None, use_llm_cache: bool = True, on_partial=None) -> tuple:
+        """
+        The local part of analyze(): DenseNet findings, Hi-Res CAM heatmap and
+        the local report, while the LLM providers run in the background.
+        Returns (result, llm): an analyze()-style result without the LLM
+        answers and the running provider calls, to be passed to enrich().
         """
+        started = time.perf_counter()
         # Convert to RGB if needed
         if image.mode != "RGB":
             image = image.convert("RGB")
+        head = head or self.heads.current()
+        llm = self._start_llm(image, patient_name, scan_type, body_part, patient_description,
+                              puter_result, started=started, image_hash=image_hash,
+                              use_llm_cache=use_llm_cache, on_partial=on_partial)
 
-        # Prepare input tensor
-        input_tensor = self.transform(image).unsqueeze(0).to(self.device)
+        stored = self._stored_features(session_id, image_hash, need_map=generate_heatmap)
 
-        # Get predictions
-        with torch.no_grad():
-            outputs = self.model(input_tensor)
-            probabilities = F.softmax(outputs, dim=1).cpu().numpy()[0]
+        if generate_heatmap:
+            if stored is not None:
+                # Head-only: predictions + Hi-Res CAM from the stored feature map
+                probabilities, grayscale_cam = self._cam_from_feature_map(stored.feature_map, head)
+            else:
+                # Single forward for predictions + Hi-Res CAM of the top prediction
+                # (batched with any concurrent requests)
+                probabilities, grayscale_cam, activations = self.batcher.run((self.transform(image), head))
+                self._store_features(session_id, image_hash, activations)
+            findings, _ = self._findings_from_probabilities(probabilities, head)
+            heatmap_path, annotated_path = self._save_heatmap_images(
+                image, grayscale_cam, output_dir
+            )
+        else:
+            if stored is not None:
+                # Head-only scoring of the stored pooled features
+                probabilities = self._score_pooled(stored.pooled, head)
+            else:
+                # Findings-only: no-CAM forward
+                probabilities = self._predict_findings([self.transform(image)], head)[0]
+            findings, _ = self._findings_from_probabilities(probabilities, head)
+            heatmap_path, annotated_path = None, None
+        cnn_ms = (time.perf_counter() - started) * 1000
+
+        result = self._local_result(
+            findings, heatmap_path, annotated_path,
+            patient_name=patient_name, scan_type=scan_type, body_part=body_part,
+            patient_description=patient_description, on_partial=on_partial,
+        )
+        result["head_version"] = head.version
+        result["timings"] = {"cnn_ms": round(cnn_ms, 1)}
+        return result, llm
+
+    def enrich(self, result: dict, llm, puter_result: dict = None) -> dict:
+        """
+        Wait for the LLM answers of `llm` (the run returned by analyze_local(),
+        at most until HG_LLM_DEADLINE_S) and merge them into the local `result`.
+        Returns a new result dict; `result` itself is left unchanged.
+        """
+        enriched = self._merge_llm_results(result, llm, puter_result)
+        enriched["timings"]["total_ms"] = round((time.perf_counter() - llm.started) * 1000, 1)
+        return enriched
+
+    def analyze_batch(self, images: list, output_dirs: list, patient_name: str = "",
+                      scan_types: list = None, body_part: str = "",
+                      patient_description: str = "", puter_result: dict = None,
+                      chunk_size: int = None, session_ids: list = None,
+                      image_hashes: list = None, progress_callback=None,
+                      use_llm_cache: bool = True) -> list:
+        """
+        Analyze a list of medical images with tensor-batched execution.
+        Images are preprocessed into one tensor and pushed through DenseNet-121 in
+        chunks of `chunk_size`; the Hi-Res CAM maps of a chunk come from the same
+        forward and a single backward pass. The LLM provider calls of an image
+        start as soon as its local result is ready, and the calls of up to
+        HG_LLM_WORKERS / 2 images run at once (across chunks) before the oldest
+        is merged, so an N-image batch does not wait N times for the providers.
+        Returns one analyze()-style result dict per image; an image that fails
+        gets {"error": ...} in its slot instead, without affecting the others
+        (a chunk whose batched forward fails is retried image by image).
+        puter_result (if any) is applied to the first image only.
+        Backbone features are stored under session_ids / image_hashes if given.
+        use_llm_cache=False skips cached LLM answers for every image.
+        progress_callback(pct, message, stats=None, event=None) is called after
+        every image (event: {"phase": "analyze", "index", "completed", "total"}).
+        The whole batch uses the head version current when it starts.
+        """
+        if chunk_size is None:
+            chunk_size = int(os.getenv("HG_BATCH_CHUNK_SIZE", "16"))
+        chunk_size = max(1, chunk_size)
+        if scan_types is None:
+            scan_types = [""] * len(images)
+        if session_ids is None:
+            session_ids = [None] * len(images)
+        if image_hashes is None:
+            image_hashes = [None] * len(images)
+        head = self.heads.current()
+        results = [None] * len(images)
+
+        def done(i, result):
+            results[i] = result
+            if progress_callback:
+                completed = sum(r is not None for r in results)
+                progress_callback(
+                    round(completed / len(images) * 100, 1),
+                    f"Analyzed image {completed}/{len(images)}",
+                    event={"phase": "analyze", "index": i, "completed": completed, "total": len(images)},
+                )
+
+        def failed(i, e):
+            traceback.print_exc()
+            done(i, {"error": f"Analysis failed: {e}"})
+
+        # Images whose provider calls are in flight: (index, local result, FanoutRun).
+        # Bounded so queued calls do not eat their deadline waiting for a pool thread
+        in_flight = deque()
+        window = max(1, self.llm_fanout.max_workers // 2)  # Groq + Claude per image
+
+        def merge_oldest():
+            i, local, llm = in_flight.popleft()
+            try:
+                result = self._merge_llm_results(local, llm, puter_result if i == 0 else None)
+                result["head_version"] = head.version
+            except Exception as e:
+                failed(i, e)
+                return
+            done(i, result)
 
-        # Get top findings
+        # Decode + preprocess each image on its own (a truncated upload only fails itself)
+        images = list(images)
+        tensors = {}
+        for i, img in enumerate(images):
+            try:
+                images[i] = img.convert("RGB") if img.mode != "RGB" else img
+                tensors[i] = self.transform(images[i])
+            except Exception as e:
+                failed(i, e)
+        valid = list(tensors)
+
+        for start in range(0, len(valid), chunk_size):
+            indices = valid[start:start + chunk_size]
+
+            # Probabilities + Hi-Res CAM for the whole chunk
+            try:
+                chunk_outputs = self._forward_with_cam([tensors[i] for i in indices], [head] * len(indices))
+            except Exception as e:
+                print(f"[HealthGuard AI] ⚠️ Batched forward failed ({e}), analyzing the chunk image by image")
+                chunk_outputs = None
+
+            for offset, i in enumerate(indices):
+                try:
+                    if chunk_outputs is not None:
+                        probabilities, grayscale_cam, activations = chunk_outputs[offset]
+                    else:
+                        probabilities, grayscale_cam, activations = self._forward_with_cam([tensors[i]], [head])[0]
+                    self._store_features(session_ids[i], image_hashes[i], activations)
+                    findings, _ = self._findings_from_probabilities(probabilities, head)
+                    heatmap_path, annotated_path = self._save_heatmap_images(
+                        images[i], grayscale_cam, output_dirs[i]
+                    )
+                    local = self._local_result(
+                        findings, heatmap_path, annotated_path,
+                        patient_name=patient_name, scan_type=scan_types[i], body_part=body_part,
+                        patient_description=patient_description,
+                    )
+                    llm = self._start_llm(images[i], patient_name, scan_types[i], body_part, patient_description,
+                                          puter_result if i == 0 else None,
+                                          image_hash=image_hashes[i], use_llm_cache=use_llm_cache)
+                except Exception as e:
+                    failed(i, e)
+                    continue
+                in_flight.append((i, local, llm))
+                while len(in_flight) > window:
+                    merge_oldest()
+
+        while in_flight:
+            merge_oldest()
+        return results
+
+    def _findings_from_probabilities(self, probabilities: np.ndarray, head: HeadVersion = None) -> tuple:
+        """Turn a probability vector into the top findings list and the primary class index."""
+        names = (head or self.heads.current()).findings
         top_indices = np.argsort(probabilities)[::-1]
         findings = []
         for idx in top_indices[:5]:  # top 5 findings
-            finding_name = self.findings_list[idx] if idx < len(self.findings_list) else f"Finding_{idx}"
+            finding_name = names[idx] if idx < len(names) else f"Finding_{idx}"
             confidence = float(probabilities[idx]) * 100
             if confidence > 3.0:  # only include if above threshold
                 findings.append({
@@ -847,12 +1442,15 @@ class MedicalImageAnalyzer:
                 "severity": "low",
             })
 
-        # Generate Hi-Res CAM heatmap for top prediction
-        primary_idx = top_indices[0]
-        heatmap_path, annotated_path = self._generate_heatmap(
-            image, input_tensor, primary_idx, output_dir
-        )
+        return findings, top_indices[0]
 
+    def _local_result(self, findings: list, heatmap_path: str, annotated_path: str, patient_name: str = "",
+                      scan_type: str = "", body_part: str = "", patient_description: str = "",
+                      on_partial=None) -> dict:
+        """
+        Analysis result from the local model alone (findings, severity, report).
+        The findings are passed to on_partial (see analyze()) right away.
+        """
         # Overall severity
         severities = [f["severity"] for f in findings]
         if "high" in severities:
@@ -862,6 +1460,11 @@ class MedicalImageAnalyzer:
         else:
             overall_severity = "low"
 
+        if on_partial:
+            on_partial("local", "findings", findings)
+            on_partial("local", "overall_severity", overall_severity)
+            on_partial("local", "primary_finding", findings[0]["finding"] if findings else "Normal")
+
         # Generate Professional Report Data
         detailed_report = self._generate_professional_report_data(
             findings, severity=overall_severity, 
@@ -872,28 +1475,56 @@ class MedicalImageAnalyzer:
             # If description provided, add it to report metadata
             detailed_report["header"]["description"] = patient_description
 
+        return {
+            "findings": findings,
+            "heatmap_path": heatmap_path,
+            "annotated_path": annotated_path,
+            "overall_severity": overall_severity,
+            "primary_finding": findings[0]["finding"] if findings else "Normal",
+            "model_info": {
+                "name": "HealthGuard DenseNet-121",
+                "device": str(self.device),
+                "version": "v2.5.0",
+            },
+            "detailed_report": detailed_report,
+            "medical_viz_path": None,  # Medical Visualization disabled (NVIDIA API no longer active)
+            "timings": {},
+        }
+
+    def _merge_llm_results(self, local: dict, llm, puter_result: dict = None) -> dict:
+        """
+        Wait for the provider calls of `llm` and merge their answers into a copy
+        of the `local` result.
+        """
+        findings = local["findings"]
+        overall_severity = local["overall_severity"]
+        detailed_report = copy.deepcopy(local["detailed_report"])
+
         # ---------------------------------------------------------
         # AI ENGINE SELECTION
         # Priority: Puter.js result (free, from frontend) > Groq > Claude > Local
         # Note: Puter.js is frontend-only, no server-side API available
         # ---------------------------------------------------------
         effective_puter = puter_result  # From frontend Puter.js (if it succeeded)
-        
         if effective_puter:
             print(f"[HealthGuard AI] ✅ Using Puter.js result (free AI, no API keys consumed)")
-            groq_result = self._analyze_with_groq(image, patient_name, scan_type, body_part, patient_description)
-            claude_result = None
-        else:
-            # Puter.js didn't provide result, use API key models
-            groq_result = self._analyze_with_groq(image, patient_name, scan_type, body_part, patient_description)
-            claude_result = self._analyze_with_claude(image, patient_name, scan_type, body_part, patient_description)
-        
-        # Medical Visualization disabled (NVIDIA API no longer active)
-        medical_viz_path = None
+
+        # Provider calls run concurrently; take whatever arrived before the deadline
+        ai_results, timings = llm.wait()
+        encoded = llm.image_payload.stats()["variants"]
+        timings["llm_encode_ms"] = round(sum(v["encode_ms"] for v in encoded), 1)
+        timings["llm_image_bytes"] = max((v["jpeg_bytes"] for v in encoded), default=0)
+        timings["skipped"] = list(llm.skipped)
+        timings["llm_first_field_ms"] = dict(llm.first_field_ms)
+        # No provider late or skipped, and at least one answer merged in
+        answered = any(result is not None for result in ai_results.values()) or bool(effective_puter)
+        timings["llm_complete"] = answered and not timings["late"] and not timings["skipped"]
+        groq_result = ai_results.get("groq")
+        claude_result = ai_results.get("claude")
         
-        primary_finding_name = findings[0]["finding"] if findings else "Normal"
-        model_name = "HealthGuard DenseNet-121"
-        model_device = str(self.device)
+        primary_finding_name = local["primary_finding"]
+        model_name = local["model_info"]["name"]
+        model_device = local["model_info"]["device"]
 
         # --- Merge results (Puter/Claude + Groq dual-AI analysis) ---
         primary_ai = effective_puter or claude_result  # Puter takes priority over Claude
@@ -935,20 +1566,262 @@ class MedicalImageAnalyzer:
             if "header" in detailed_report:
                 detailed_report["header"]["ai_version"] = "HealthGuard DenseNet-121 v2.5"
 
-        return {
-            "findings": findings,
-            "heatmap_path": heatmap_path,
-            "annotated_path": annotated_path,
-            "overall_severity": overall_severity,
-            "primary_finding": primary_finding_name,
-            "model_info": {
-                "name": model_name,
-                "device": model_device,
-                "version": "v2.5.0",
-            },
-            "detailed_report": detailed_report,
-            "medical_viz_path": medical_viz_path,
+        return dict(
+            local,
+            findings=findings,
+            overall_severity=overall_severity,
+            primary_finding=primary_finding_name,
+            model_info=dict(local["model_info"], name=model_name, device=model_device),
+            detailed_report=detailed_report,
+            timings=dict(local["timings"], **timings),
+        )
+
+    def _start_llm(self, image: Image.Image, patient_name: str, scan_type: str, body_part: str,
+                   patient_description: str = "", puter_result: dict = None, started: float = None,
+                   image_hash: str = None, use_llm_cache: bool = True, on_partial=None):
+        """
+        Start the LLM provider calls for one scan in the background: Groq, plus
+        Claude unless the frontend already delivered a Puter.js result.
+        Each provider answers from the LLM response cache when it can
+        (use_llm_cache=False forces fresh calls, whose answers are still stored).
+        A provider whose circuit breaker is open is skipped without a request
+        (listed in the run's `skipped`), so the analysis falls back to the local
+        report; slow calls may be hedged on a second key (HG_LLM_HEDGE).
+        The early fields of each answer go to on_partial(provider, field, value)
+        as soon as they are complete (streamed, cached or not); the time to a
+        provider's first one is kept in the run's `first_field_ms`.
+        """
+        image.load()  # decode once here, not concurrently in the provider threads
+        started = started if started is not None else time.perf_counter()
+        fields = {
+            "patient_name": patient_name,
+            "scan_type": scan_type.lower(),
+            "body_part": body_part.lower(),
+            "patient_description": patient_description,
         }
+        if self.llm_cache.enabled and image_hash is None:
+            image_hash = image_digest(image)
+
+        image_payload = self._llm_payload(image)  # encoded lazily, once, by the first provider that misses the cache
+
+        providers = {"groq": (GROQ_MODEL, self._analyze_with_groq, self.groq_keys)}
+        if not puter_result:
+            providers["claude"] = (CLAUDE_MODEL, self._analyze_with_claude, self.claude_keys)
+        calls, skipped, first_field_ms = {}, [], {}
+        for name, (model, analyze_fn, scheduler) in providers.items():
+            def call(deadline, name=name, model=model, analyze_fn=analyze_fn, scheduler=scheduler):
+                emitted = set()
+
+                def on_field(field, value):
+                    # Hedged attempts repeat the same fields; the first one wins
+                    if field not in EARLY_FIELDS or field in emitted:
+                        return
+                    emitted.add(field)
+                    first_field_ms.setdefault(name, round((time.perf_counter() - started) * 1000, 1))
+                    if on_partial:
+                        try:
+                            on_partial(name, field, value)
+                        except Exception as e:
+                            print(f"[HealthGuard AI] ⚠️ Partial result listener failed: {e}")
+
+                def answered(result):
+                    # Non-streamed and cached answers deliver their early fields at once
+                    if result is not None:
+                        for field in EARLY_FIELDS:
+                            if field in result:
+                                on_field(field, result[field])
+                    return result
+
+                key = None
+                if self.llm_cache.enabled:
+                    key = LLMResponseCache.make_key(name, model, LLM_PROMPT_VERSION, fields, image_hash)
+                    cached = self.llm_cache.get(key, provider=name, bypass=not use_llm_cache)
+                    if cached is not None:
+                        print(f"[HealthGuard AI] ⚡ {name} answer served from the LLM response cache")
+                        return answered(cached)
+                if not scheduler.keys:
+                    # Logs the missing keys; not a provider failure
+                    return analyze_fn(image, patient_name, scan_type, body_part, patient_description,
+                                      deadline=deadline, image_payload=image_payload)
+
+                breaker = self.breakers.get(name, model)
+                probe = False
+                if breaker.state != "closed":
+                    if not breaker.allow():
+                        skipped.append(name)
+                        print(f"[HealthGuard AI] ⚡ {name} circuit is open, using the local report instead")
+                        return None
+                    probe = True  # half-open: this call is the probe
+
+                def attempt(probe=probe):
+                    # A probe already holds its permission from allow() above
+                    if not probe and not breaker.allow():
+                        return None
+                    start, usage, result = time.perf_counter(), {}, None
+                    try:
+                        result = analyze_fn(image, patient_name, scan_type, body_part, patient_description,
+                                            deadline=deadline, usage=usage, image_payload=image_payload,
+                                            on_partial=on_field)
+                    except Exception:
+                        _provider_error(usage)
+                        raise
+                    finally:
+                        if result is not None or usage.get("provider_error"):
+                            breaker.record(result is not None, (time.perf_counter() - start) * 1000)
+                        else:
+                            # No key budget / deadline before a request, or only 429s:
+                            # says nothing about the provider's health
+                            breaker.cancel()
+                    return (result, usage.get("tokens", 0)) if result is not None else None
+
+                answer = self.hedger.run(attempt, p95_ms=breaker.p95_ms(), deadline=deadline,
+                                         can_hedge=len(scheduler.keys) > 1 and not probe)
+                if answer is None:
+                    return None
+                result, tokens = answer
+                if key is not None:
+                    self.llm_cache.put(key, name, model, result, tokens)
+                return answered(result)
+            calls[name] = call
+        run = self.llm_fanout.start(calls, started=started)
+        run.image_payload = image_payload
+        run.skipped = skipped
+        run.first_field_ms = first_field_ms
+        return run
+
+    def _llm_payload(self, image: Image.Image) -> LLMImagePayload:
+        """Per-request encoder of `image` for the vision LLMs (HG_LLM_IMAGE_* budget)."""
+        return LLMImagePayload(
+            image,
+            max_edge=int(os.getenv("HG_LLM_IMAGE_MAX_EDGE", "1568")),
+            max_bytes=int(float(os.getenv("HG_LLM_IMAGE_MAX_KB", "1024")) * 1024),
+            min_quality=int(os.getenv("HG_LLM_IMAGE_MIN_QUALITY", "40")),
+            max_quality=int(os.getenv("HG_LLM_IMAGE_MAX_QUALITY", "75")),
+        )
+
+    def _classify_features(self, features: torch.Tensor, classifier: nn.Module = None) -> torch.Tensor:
+        """DenseNet head: feature map -> ReLU -> global average pool -> classifier logits."""
+        if classifier is None:
+            classifier = self.heads.current().classifier
+        out = F.relu(features)
+        out = F.adaptive_avg_pool2d(out, (1, 1))
+        out = torch.flatten(out, 1)
+        return classifier(out)
+
+    def _findings_head(self, head: HeadVersion = None) -> nn.Module:
+        """
+        Classifier for the findings-only path: a dynamically quantized int8 copy
+        under the int8-dynamic tier (quantized once per head version), otherwise
+        the float classifier of the head version.
+        """
+        head = head or self.heads.current()
+        if self.backbone.active_precision != "int8-dynamic" or self.device.type != "cpu":
+            return head.classifier
+        cached = self._quantized_head
+        if cached is None or cached[0] != head.version:
+            cached = (head.version, quantize_head_dynamic(head.classifier))
+            self._quantized_head = cached
+        return cached[1]
+
+    def _forward_items(self, items: list) -> list:
+        """InferenceBatcher target: items are (CHW tensor, HeadVersion) pairs."""
+        tensors, heads = zip(*items)
+        return self._forward_with_cam(list(tensors), list(heads))
+
+    def _forward_with_cam(self, tensors: list, heads: list = None) -> list:
+        """
+        Fused inference: one backbone forward for a list of CHW tensors, returning
+        (probabilities, hi-res CAM of the top class, backbone feature map) per image.
+
+        The backbone runs without autograd; its output is the Hi-Res CAM target
+        layer (features[-1]), so the activations are kept and only the head is
+        differentiated to get the gradients for the top class of every image
+        in a single backward. Scaling matches pytorch_grad_cam's HiResCAM.
+
+        `heads` gives the HeadVersion of every image (default: the current one);
+        a batch spanning a publish runs the head step once per version.
+        """
+        if heads is None:
+            heads = [self.heads.current()] * len(tensors)
+        batch = torch.stack(tensors).to(self.device)
+        activations = self.backbone(batch)
+        target_size = (batch.size(-1), batch.size(-2))
+
+        outputs = [None] * len(tensors)
+        for version in dict.fromkeys(h.version for h in heads):
+            idx = [i for i, h in enumerate(heads) if h.version == version]
+            group = activations[idx] if len(idx) < len(tensors) else activations
+            probabilities, cams = self._head_with_cam(group, target_size, heads[idx[0]])
+            for j, i in enumerate(idx):
+                outputs[i] = (probabilities[j], cams[j], activations[i].detach().cpu())
+        return outputs
+
+    def _head_with_cam(self, activations: torch.Tensor, target_size: tuple, head: HeadVersion = None):
+        """Classifier head + Hi-Res CAM of the top class for a batch of feature maps."""
+        head = head or self.heads.current()
+        activations = activations.detach().requires_grad_(True)
+        with torch.enable_grad():
+            logits = self._classify_features(activations, head.classifier)
+            top_classes = logits.argmax(dim=1, keepdim=True)
+            score = logits.gather(1, top_classes).sum()
+            grads, = torch.autograd.grad(score, activations)
+
+        probabilities = F.softmax(logits.detach(), dim=1).cpu().numpy()
+
+        # HiResCAM: element-wise gradient x activation, summed over channels
+        cams = (grads * activations.detach()).sum(dim=1).cpu().numpy()
+        cams = np.maximum(cams, 0)
+        cams = scale_cam_image(scale_cam_image(cams, target_size))
+
+        return probabilities, cams
+
+    def _cam_from_feature_map(self, feature_map: np.ndarray, head: HeadVersion = None):
+        """(probabilities, Hi-Res CAM) for one stored 1024x7x7 feature map, head only."""
+        activations = torch.from_numpy(feature_map).unsqueeze(0).to(self.device)
+        probabilities, cams = self._head_with_cam(activations, (224, 224), head)
+        return probabilities[0], cams[0]
+
+    def _score_pooled(self, pooled: np.ndarray, head: HeadVersion = None) -> np.ndarray:
+        """Findings probabilities for one stored pooled feature vector, head only."""
+        with torch.no_grad():
+            features = torch.from_numpy(pooled).unsqueeze(0).to(self.device)
+            outputs = self._findings_head(head)(features)
+            return F.softmax(outputs, dim=1).cpu().numpy()[0]
+
+    def _stored_features(self, session_id: str = None, image_hash: str = None, need_map: bool = False):
+        """FeatureRecord for a session id / image hash from the feature store, or None."""
+        if self.feature_store is None or not (session_id or image_hash):
+            return None
+        return self.feature_store.get(session_id, image_hash, need_map=need_map)
+
+    def _store_features(self, session_id: str, image_hash: str, activations: torch.Tensor):
+        """Save the pooled vector (and feature map) of one analyzed image."""
+        if self.feature_store is None or not (session_id or image_hash):
+            return
+        try:
+            activations = activations.float()
+            pooled = torch.flatten(F.adaptive_avg_pool2d(F.relu(activations), (1, 1)))
+            self.feature_store.put(session_id, image_hash, pooled.numpy(), activations.numpy())
+        except Exception as e:
+            print(f"[HealthGuard AI] ⚠️ Could not store backbone features: {e}")
+
+    def _predict_findings(self, tensors: list, head: HeadVersion = None) -> list:
+        """Findings-only probabilities: ONNX Runtime when enabled and current, else PyTorch."""
+        head = head or self.heads.current()
+        if self.findings_engine is not None:
+            probabilities = self.findings_engine.predict(torch.stack(tensors).numpy(), head)
+            if probabilities is not None:
+                return list(probabilities)
+        return self._predict_batch(tensors, head)
+
+    def _predict_batch(self, tensors: list, head: HeadVersion = None) -> list:
+        """Run one stacked no-CAM forward for a list of CHW tensors, return per-image probabilities."""
+        batch = torch.stack(tensors).to(self.device)
+        features = self.backbone(batch)
+        with torch.no_grad():
+            outputs = self._classify_features(features, self._findings_head(head))
+            probabilities = F.softmax(outputs, dim=1).cpu().numpy()
+        return list(probabilities)
 
     def _analyze_with_nvidia(self, image: Image.Image, patient_name: str, scan_type: str, body_part: str, patient_description: str = "") -> dict:
         """
@@ -1045,7 +1918,8 @@ class MedicalImageAnalyzer:
         }
 
         try:
-            response = requests.post(invoke_url, headers=headers, json=payload)
+            response = self.http.post(invoke_url, endpoint="nvidia.chat", headers=headers, json=payload,
+                                      timeout=(10, 120))
             
             if response.status_code != 200:
                 print(f"[HealthGuard AI] ❌ NVIDIA API Error: {response.text}")
@@ -1112,7 +1986,7 @@ class MedicalImageAnalyzer:
         }
 
         try:
-            response = requests.post(invoke_url, headers=headers, json=payload, timeout=15)
+            response = self.http.post(invoke_url, endpoint="nvidia.sdxl", headers=headers, json=payload, timeout=15)
             
             if response.status_code != 200:
                 print(f"[HealthGuard AI] ⚠️ Visualization Error: {response.text}")
@@ -1134,29 +2008,30 @@ class MedicalImageAnalyzer:
             print(f"[HealthGuard AI] ❌ Visualization Exception: {e}")
             return None
 
-    def _analyze_with_groq(self, image: Image.Image, patient_name: str, scan_type: str, body_part: str, patient_description: str = "") -> dict:
-        """Analyze image using Groq Llama-4-Maverick with automatic API key rotation on rate limits."""
-
-        # Build ordered list of available API keys for fallback
-        api_keys = []
-        for key_name in ("GROQ_API_KEY", "GROQ_API_KEY_2", "GROQ_API_KEY_3"):
-            k = os.getenv(key_name)
-            if k:
-                api_keys.append((key_name, k))
+    def _analyze_with_groq(self, image: Image.Image, patient_name: str, scan_type: str, body_part: str, patient_description: str = "", deadline: float = None, usage: dict = None, image_payload: LLMImagePayload = None, on_partial=None) -> dict:
+        """
+        Analyze image using Groq Llama-4-Maverick, on the API key with the most rate-limit budget left
+        (self.groq_keys); waits for a key while all are saturated, but not past
+        `deadline` (time.perf_counter()), which also bounds the HTTP timeout.
+        The tokens of the successful call are stored in usage["tokens"] if given;
+        usage["provider_error"] is set when the provider itself failed (network
+        error / timeout, 5xx or other HTTP error, unparseable answer), as opposed
+        to no key budget or no time left before the deadline.
+        The image is taken from `image_payload` (encoded once per request) if given.
+        The answer is streamed (HG_LLM_STREAM); on_partial(field, value) gets each
+        top-level field of it as soon as it is complete.
+        """
 
-        if not api_keys:
+        scheduler = self.groq_keys
+        if not scheduler.keys:
             print("[HealthGuard AI] ❌ No Groq API keys found in environment")
             return None
 
-        print(f"[HealthGuard AI] 🟢 Using Groq API for analysis... ({len(api_keys)} key(s) available)")
+        print(f"[HealthGuard AI] 🟢 Using Groq API for analysis... ({len(scheduler.keys)} key(s) available)")
 
-        # Convert image to base64
-        buffered = io.BytesIO()
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        img_url = f"data:image/jpeg;base64,{img_str}"
+        # Downscaled JPEG within Groq's payload budget (shared with the other providers)
+        image_payload = image_payload or self._llm_payload(image)
+        img_url = image_payload.for_provider("groq").data_url
 
         # Prompt for structured JSON output
         system_prompt = """You are an expert medical AI assistant specialized in radiology. Analyze the provided medical scan image relative to the patient context.
@@ -1201,7 +2076,7 @@ class MedicalImageAnalyzer:
         user_content += "\nAnalyze this medical scan image in detail."
 
         payload = {
-            "model": "meta-llama/llama-4-maverick-17b-128e-instruct",
+            "model": GROQ_MODEL,
             "messages": [
                 {
                     "role": "user",
@@ -1213,35 +2088,64 @@ class MedicalImageAnalyzer:
             ],
             "temperature": 0.1,
             "max_tokens": 4096,
-            "stream": False
+            "stream": self.llm_stream
         }
 
-        # Try each API key; rotate on rate-limit (429) or server errors (5xx)
+        # Healthiest key first; a 429 cools that key down (retry-after / reset
+        # headers) and a 5xx makes the next attempt prefer another key
         last_error = None
-        for key_name, api_key in api_keys:
+        failed = []
+        for _ in range(3 * len(scheduler.keys)):
+            key = scheduler.acquire(deadline=deadline, tokens=payload["max_tokens"], avoid=failed)
+            if key is None:
+                print("[HealthGuard AI] ⏱️ No Groq key has rate-limit budget before the deadline")
+                break
+            key_name = key.name
+            timeout = _request_timeout(deadline)
+            if timeout is None:
+                scheduler.cancel(key)
+                print(f"[HealthGuard AI] ⏱️ Groq deadline reached, not trying {key_name}")
+                break
             headers = {
-                "Authorization": f"Bearer {api_key}",
+                "Authorization": f"Bearer {key.secret}",
                 "Content-Type": "application/json"
             }
             try:
-                response = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload)
+                response = self.http.post("https://api.groq.com/openai/v1/chat/completions", endpoint="groq.chat",
+                                          headers=headers, json=payload, timeout=timeout, deadline=deadline,
+                                          retry_statuses=(), stream=self.llm_stream)  # 5xx rotates keys below
+                content, tokens = None, 0
+                if response.status_code == 200:
+                    content, tokens = self._read_completion("groq", response, "groq.chat", deadline, on_partial)
+            except Exception as e:
+                scheduler.release(key)
+                print(f"[HealthGuard AI] ⚠️ Exception with {key_name}: {e}")
+                _provider_error(usage)
+                last_error = e
+                failed.append(key_name)
+                continue
 
-                if response.status_code == 429:
-                    print(f"[HealthGuard AI] ⚠️ Rate limit hit on {key_name}, rotating to next key...")
-                    import time
-                    time.sleep(1)   # brief pause before retrying
-                    continue
+            scheduler.release(key, response.status_code, response.headers, tokens)
 
-                if response.status_code >= 500:
-                    print(f"[HealthGuard AI] ⚠️ Server error ({response.status_code}) on {key_name}, rotating...")
-                    continue
+            if response.status_code == 429:
+                print(f"[HealthGuard AI] ⚠️ Rate limit hit on {key_name}, switching key...")
+                continue
 
-                if response.status_code != 200:
-                    print(f"[HealthGuard AI] ❌ Groq API Error ({key_name}): {response.text}")
-                    return None
+            if response.status_code >= 500:
+                print(f"[HealthGuard AI] ⚠️ Server error ({response.status_code}) on {key_name}, rotating...")
+                _provider_error(usage)
+                failed.append(key_name)
+                continue
 
-                result = response.json()
-                content = result['choices'][0]['message']['content']
+            if response.status_code != 200:
+                print(f"[HealthGuard AI] ❌ Groq API Error ({key_name}): {response.text}")
+                if response.status_code not in (401, 403):  # a rejected key is not the provider's fault
+                    _provider_error(usage)
+                return None
+
+            try:
+                if usage is not None:
+                    usage["tokens"] = tokens
 
                 # Clean up potential markdown formatting
                 content = content.replace("```json", "").replace("```", "").strip()
@@ -1255,38 +2159,42 @@ class MedicalImageAnalyzer:
                     return data
                 except json.JSONDecodeError:
                     print(f"[HealthGuard AI] ⚠️ Failed to parse Groq JSON response. Raw content:\n{content}")
+                    _provider_error(usage)
                     return None
 
             except Exception as e:
                 print(f"[HealthGuard AI] ⚠️ Exception with {key_name}: {e}")
+                _provider_error(usage)
                 last_error = e
                 continue
 
         print(f"[HealthGuard AI] ❌ All Groq API keys exhausted. Last error: {last_error}")
         return None
 
-    def _analyze_with_claude(self, image: Image.Image, patient_name: str, scan_type: str, body_part: str, patient_description: str = "") -> dict:
-        """Analyze image using Claude (Anthropic) with automatic API key rotation on rate limits."""
-
-        # Build ordered list of available API keys for fallback
-        api_keys = []
-        for key_name in ("CLAUDE_API_KEY", "CLAUDE_API_KEY_2", "CLAUDE_API_KEY_3"):
-            k = os.getenv(key_name)
-            if k:
-                api_keys.append((key_name, k))
+    def _analyze_with_claude(self, image: Image.Image, patient_name: str, scan_type: str, body_part: str, patient_description: str = "", deadline: float = None, usage: dict = None, image_payload: LLMImagePayload = None, on_partial=None) -> dict:
+        """
+        Analyze image using Claude (Anthropic), on the API key with the most rate-limit budget left
+        (self.claude_keys); waits for a key while all are saturated, but not past
+        `deadline` (time.perf_counter()), which also bounds the HTTP timeout.
+        The tokens of the successful call are stored in usage["tokens"] if given;
+        usage["provider_error"] is set when the provider itself failed (network
+        error / timeout, 5xx or other HTTP error, unparseable answer), as opposed
+        to no key budget or no time left before the deadline.
+        The image is taken from `image_payload` (encoded once per request) if given.
+        The answer is streamed (HG_LLM_STREAM); on_partial(field, value) gets each
+        top-level field of it as soon as it is complete.
+        """
 
-        if not api_keys:
+        scheduler = self.claude_keys
+        if not scheduler.keys:
             print("[HealthGuard AI] ⚠️ No Claude API keys found in environment, skipping Claude analysis")
             return None
 
-        print(f"[HealthGuard AI] 🟣 Using Claude API for analysis... ({len(api_keys)} key(s) available)")
+        print(f"[HealthGuard AI] 🟣 Using Claude API for analysis... ({len(scheduler.keys)} key(s) available)")
 
-        # Convert image to base64
-        buffered = io.BytesIO()
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        image.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        # Downscaled JPEG within Claude's payload budget (shared with the other providers)
+        image_payload = image_payload or self._llm_payload(image)
+        encoded = image_payload.for_provider("claude")
 
         # Prompt for structured JSON output
         system_prompt = """You are an expert medical AI assistant specialized in radiology. Analyze the provided medical scan image relative to the patient context.
@@ -1330,8 +2238,9 @@ Return a valid JSON object ONLY, with NO markdown formatting, matching this stru
         user_content += "\nAnalyze this medical scan image in detail."
 
         payload = {
-            "model": "claude-sonnet-4-20250514",
+            "model": CLAUDE_MODEL,
             "max_tokens": 4096,
+            "stream": self.llm_stream,
             "messages": [
                 {
                     "role": "user",
@@ -1340,8 +2249,8 @@ Return a valid JSON object ONLY, with NO markdown formatting, matching this stru
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": img_str,
+                                "media_type": encoded.media_type,
+                                "data": encoded.base64,
                             }
                         },
                         {
@@ -1353,42 +2262,69 @@ Return a valid JSON object ONLY, with NO markdown formatting, matching this stru
             ]
         }
 
-        # Try each API key; rotate on rate-limit (429) or server errors (5xx)
+        # Healthiest key first; a 429 cools that key down (retry-after / reset
+        # headers), auth rejections take it out for HG_KEY_AUTH_COOLDOWN_S and a
+        # 5xx makes the next attempt prefer another key
         last_error = None
-        for key_name, api_key in api_keys:
+        failed = []
+        for _ in range(3 * len(scheduler.keys)):
+            key = scheduler.acquire(deadline=deadline, tokens=payload["max_tokens"], avoid=failed)
+            if key is None:
+                print("[HealthGuard AI] ⏱️ No Claude key has rate-limit budget before the deadline")
+                break
+            key_name = key.name
+            timeout = _request_timeout(deadline)
+            if timeout is None:
+                scheduler.cancel(key)
+                print(f"[HealthGuard AI] ⏱️ Claude deadline reached, not trying {key_name}")
+                break
             headers = {
-                "x-api-key": api_key,
+                "x-api-key": key.secret,
                 "Content-Type": "application/json",
                 "anthropic-version": "2023-06-01"
             }
             try:
-                response = requests.post("https://api.anthropic.com/v1/messages", headers=headers, json=payload)
+                response = self.http.post("https://api.anthropic.com/v1/messages", endpoint="claude.messages",
+                                          headers=headers, json=payload, timeout=timeout, deadline=deadline,
+                                          retry_statuses=(), stream=self.llm_stream)  # 5xx rotates keys below
+                content, tokens = None, 0
+                if response.status_code == 200:
+                    content, tokens = self._read_completion("claude", response, "claude.messages", deadline,
+                                                            on_partial)
+            except Exception as e:
+                scheduler.release(key)
+                print(f"[HealthGuard AI] ⚠️ Exception with Claude {key_name}: {e}")
+                _provider_error(usage)
+                last_error = e
+                failed.append(key_name)
+                continue
 
-                if response.status_code == 429:
-                    print(f"[HealthGuard AI] ⚠️ Rate limit hit on {key_name}, rotating to next key...")
-                    import time
-                    time.sleep(1)
-                    continue
+            scheduler.release(key, response.status_code, response.headers, tokens)
 
-                if response.status_code >= 500:
-                    print(f"[HealthGuard AI] ⚠️ Server error ({response.status_code}) on {key_name}, rotating...")
-                    continue
+            if response.status_code == 429:
+                print(f"[HealthGuard AI] ⚠️ Rate limit hit on {key_name}, switching key...")
+                continue
 
-                # Billing / auth / credit errors — rotate to next key
-                if response.status_code in (400, 401, 403):
-                    print(f"[HealthGuard AI] ⚠️ Auth/billing error on {key_name} (HTTP {response.status_code}), rotating to next key...")
-                    continue
+            if response.status_code >= 500:
+                print(f"[HealthGuard AI] ⚠️ Server error ({response.status_code}) on {key_name}, rotating...")
+                _provider_error(usage)
+                failed.append(key_name)
+                continue
 
-                if response.status_code != 200:
-                    print(f"[HealthGuard AI] ❌ Claude API Error ({key_name}): {response.text}")
-                    return None
+            # Billing / auth / credit errors — rotate to next key
+            if response.status_code in (400, 401, 403):
+                print(f"[HealthGuard AI] ⚠️ Auth/billing error on {key_name} (HTTP {response.status_code}), rotating to next key...")
+                failed.append(key_name)
+                continue
 
-                result = response.json()
-                # Extract text from Claude's response
-                content = ""
-                for block in result.get("content", []):
-                    if block.get("type") == "text":
-                        content += block["text"]
+            if response.status_code != 200:
+                print(f"[HealthGuard AI] ❌ Claude API Error ({key_name}): {response.text}")
+                _provider_error(usage)
+                return None
+
+            try:
+                if usage is not None:
+                    usage["tokens"] = tokens
 
                 # Clean up potential markdown formatting
                 content = content.replace("```json", "").replace("```", "").strip()
@@ -1402,16 +2338,45 @@ Return a valid JSON object ONLY, with NO markdown formatting, matching this stru
                     return data
                 except json.JSONDecodeError:
                     print(f"[HealthGuard AI] ⚠️ Failed to parse Claude JSON response. Raw content:\n{content}")
+                    _provider_error(usage)
                     return None
 
             except Exception as e:
                 print(f"[HealthGuard AI] ⚠️ Exception with Claude {key_name}: {e}")
+                _provider_error(usage)
                 last_error = e
                 continue
 
         print(f"[HealthGuard AI] ❌ All Claude API keys exhausted. Last error: {last_error}")
         return None
 
+    def _read_completion(self, provider: str, response, endpoint: str, deadline: float = None,
+                         on_partial=None) -> tuple:
+        """
+        (text, tokens) of a 200 response of `provider` ("groq" / "claude").
+        A streamed response is read event by event, passing the top-level
+        fields of the JSON answer to on_partial(field, value) as they complete,
+        and given up once `deadline` has passed.
+        """
+        if not self.llm_stream:
+            result = response.json()
+            reported = result.get("usage", {})
+            if provider == "claude":
+                # Extract text from Claude's response
+                text = "".join(block["text"] for block in result.get("content", []) if block.get("type") == "text")
+                return text, reported.get("input_tokens", 0) + reported.get("output_tokens", 0)
+            return result['choices'][0]['message']['content'], reported.get("total_tokens", 0)
+
+        completion = StreamedCompletion(provider, on_field=on_partial)
+        try:
+            for event, data in iter_sse(self.http.iter_lines(response, endpoint)):
+                completion.feed(event, data)  # read to the end so the connection goes back to the pool
+                if deadline is not None and time.perf_counter() >= deadline:
+                    raise TimeoutError(f"{provider} answer still streaming at the deadline")
+        finally:
+            response.close()
+        return completion.text, completion.tokens
+
     def _merge_ai_results(self, claude_result: dict, groq_result: dict) -> dict:
         """
         Merge analysis results from Claude and Groq into a comprehensive combined report.
@@ -1612,26 +2577,19 @@ Return a valid JSON object ONLY, with NO markdown formatting, matching this stru
             "confidence": f"{confidence}% (Validated against Reference Dataset)"
         }
 
-    def _generate_heatmap(
+    def _save_heatmap_images(
         self,
         original_image: Image.Image,
-        input_tensor: torch.Tensor,
-        target_class: int,
+        grayscale_cam: np.ndarray,
         output_dir: str,
     ) -> tuple:
-        """Generate Hi-Res CAM heatmap and annotated image."""
+        """Save the CAM overlay and the annotated image, return their filenames."""
         uid = str(uuid.uuid4())[:8]
 
         # Resize original for overlay
         img_resized = original_image.resize((224, 224))
         img_np = np.array(img_resized).astype(np.float32) / 255.0
 
-        # Hi-Res CAM
-        cam = HiResCAM(model=self.model, target_layers=[self.target_layer])
-        targets = [ClassifierOutputTarget(target_class)]
-        grayscale_cam = cam(input_tensor=input_tensor, targets=targets)
-        grayscale_cam = grayscale_cam[0, :]
-
         # Create heatmap overlay
         heatmap_overlay = show_cam_on_image(img_np, grayscale_cam, use_rgb=True)
 
@@ -0,0 +1,195 @@
+"""
+Brain Checkpoint Writer
+Persists the classifier brain (healthguard_brain.pth) off the request thread.
+
+  - request() only marks the brain dirty; a background thread writes at most
+    once per HG_CHECKPOINT_INTERVAL_S, so a burst of feedback becomes a single
+    write of the newest state (snapshot taken at write time)
+  - every write goes to a temp file, is fsync'ed and renamed over the brain,
+    so a crash leaves either the old or the new file, never a torn one
+  - a failed write (disk full, fsync / rename error) leaves the brain dirty,
+    so the background thread retries it one interval later
+  - the previous HG_CHECKPOINT_GENERATIONS files are kept as
+    healthguard_brain.pth.1 (newest) .. .N and are tried in turn on load
+  - the training history lives in an append-only JSONL next to the brain
+    instead of being rewritten inside every checkpoint
+
+An interval of 0 writes synchronously on every request().
+"""
+
+import os
+import json
+import time
+import shutil
+import atexit
+import threading
+
+import torch
+
+
+class BrainCheckpointWriter:
+    """Coalescing, atomic, rotating writer of brain checkpoints."""
+
+    def __init__(self, path: str, snapshot, interval: float = 5.0, generations: int = 3):
+        self.path = path
+        self.snapshot = snapshot  # () -> dict saved with torch.save
+        self.interval = max(0.0, interval)
+        self.generations = max(0, generations)
+        self.history_path = os.path.splitext(path)[0] + ".history.jsonl"
+
+        self._dirty_since = None
+        self._write_lock = threading.Lock()  # one writer at a time (thread or flush)
+        self._cond = threading.Condition()
+
+        self.requests = 0
+        self.writes = 0
+        self.failures = 0
+        self.last_write_at = None
+        self.last_write_seconds = None
+        self.last_error = None
+
+        if self.interval > 0:
+            threading.Thread(target=self._loop, name="hg-checkpoint", daemon=True).start()
+        atexit.register(self.flush)
+
+    # ---------- Weights ----------
+
+    def request(self):
+        """Ask for a checkpoint of the current state; returns immediately."""
+        with self._cond:
+            self.requests += 1
+            if self._dirty_since is None:
+                self._dirty_since = time.time()
+            self._cond.notify()
+        if self.interval == 0:
+            self.flush()
+
+    def flush(self):
+        """Write now if a checkpoint is pending (shutdown, tests, interval 0)."""
+        with self._cond:
+            if self._dirty_since is None:
+                return
+            self._dirty_since = None
+        if not self._write():
+            with self._cond:
+                # Retry on the next interval (or the next request when synchronous)
+                if self._dirty_since is None:
+                    self._dirty_since = time.time()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty_since is not None)
+                delay = self._dirty_since + self.interval - time.time()
+            if delay > 0:
+                time.sleep(delay)  # requests meanwhile are folded into this write
+            self.flush()
+
+    def _write(self) -> bool:
+        """Write one checkpoint; False if it failed (the brain on disk is unchanged)."""
+        with self._write_lock:
+            start = time.perf_counter()
+            tmp = self.path + ".tmp"
+            try:
+                data = self.snapshot()
+                with open(tmp, "wb") as f:
+                    torch.save(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._rotate()
+                os.replace(tmp, self.path)
+                _fsync_dir(os.path.dirname(self.path))
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"[HealthGuard AI] ❌ Warning: Could not save brain (will retry): {e}")
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                return False
+
+            self.writes += 1
+            self.last_write_at = time.time()
+            self.last_write_seconds = round(time.perf_counter() - start, 3)
+            self.last_error = None
+            size_mb = os.path.getsize(self.path) / (1024 * 1024)
+            print(f"\n[HealthGuard AI] ✅ BRAIN SAVED! Weights updated at {time.strftime('%H:%M:%S')}")
+            print(f"                 File: {self.path}")
+            print(f"                 Size: {size_mb:.2f} MB (v{data.get('brain_version')}, "
+                  f"{self.requests} save requests, {self.writes} writes)")
+            return True
+
+    def _rotate(self):
+        """Shift .1..N-1 up by one and keep the current brain as .1 (it stays in place)."""
+        if self.generations == 0 or not os.path.exists(self.path):
+            return
+        newest = f"{self.path}.1"
+        if os.path.exists(newest) and os.path.samefile(self.path, newest):
+            return  # a failed write already kept this brain as .1; don't push the older ones out
+        for n in range(self.generations - 1, 0, -1):
+            older = f"{self.path}.{n}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{n + 1}")
+        if os.path.exists(newest):
+            os.remove(newest)  # generations == 1
+        try:
+            os.link(self.path, newest)  # no copy, and the brain never disappears
+        except OSError:
+            shutil.copy2(self.path, newest)
+
+    def candidates(self) -> list:
+        """Existing checkpoint files, newest first: the brain, then .1 .. .N."""
+        paths = [self.path] + [f"{self.path}.{n}" for n in range(1, self.generations + 1)]
+        return [p for p in paths if os.path.exists(p)]
+
+    # ---------- History ----------
+
+    def append_history(self, record: dict):
+        """Append one training record to the history log."""
+        try:
+            with open(self.history_path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            print(f"[HealthGuard AI] ⚠️ Could not append training history: {e}")
+
+    def load_history(self) -> list:
+        if not os.path.exists(self.history_path):
+            return []
+        history = []
+        with open(self.history_path) as f:
+            for line in f:
+                try:
+                    history.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # partially written last line
+        return history
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = self._dirty_since is not None
+        return {
+            "interval_seconds": self.interval,
+            "generations": self.generations,
+            "pending": pending,
+            "requests": self.requests,
+            "writes": self.writes,
+            "failures": self.failures,
+            "last_write_at": self.last_write_at,
+            "last_write_seconds": self.last_write_seconds,
+            "last_error": self.last_error,
+        }
+
+
+def _fsync_dir(path: str):
+    """Make the rename durable (not supported on Windows)."""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
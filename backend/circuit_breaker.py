@@ -0,0 +1,230 @@
+"""
+Provider Circuit Breakers and Hedged Requests
+Keeps a degraded LLM provider from stalling every analysis.
+
+Circuit breaker (one per provider + model):
+  - closed     calls go through; the last HG_BREAKER_WINDOW outcomes are kept
+               and the breaker trips once at least HG_BREAKER_MIN_CALLS of
+               them show an error rate >= HG_BREAKER_ERROR_RATE or a share of
+               calls slower than HG_BREAKER_SLOW_MS >= HG_BREAKER_SLOW_RATE
+  - open       the provider is skipped without a request for HG_BREAKER_OPEN_S
+  - half-open  one probe call is let through; success closes the breaker,
+               failure opens it again
+
+Hedging (HG_LLM_HEDGE=1): if an attempt has not answered after the provider's
+p95 latency (at least HG_LLM_HEDGE_MIN_MS), a second attempt is fired - the
+key scheduler routes it to another key - and the first valid answer wins.
+The slower attempt is left to finish in the background and its answer is
+ignored.
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, \
+    wait as wait_futures
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitBreaker:
+    """Error-rate and latency circuit breaker with half-open probing."""
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_ms: float = 20000, slow_rate: float = 0.5, open_seconds: float = 30.0,
+                 probes: int = 1):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.probes = max(1, probes)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._outcomes = deque(maxlen=max(self.min_calls, window))  # (ok, slow)
+        self._latencies = deque(maxlen=200)  # successful calls, ms
+        self._opened_at = None
+        self._probes_in_flight = 0
+
+        self.trips = 0
+        self.skipped = 0
+        self.last_trip_reason = None
+
+    def _current(self, now: float) -> str:
+        """State, moving open -> half-open once the open period is over (lock held)."""
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current(time.perf_counter())
+
+    def allow(self) -> bool:
+        """Claim permission for one call; in half-open only `probes` calls are let through."""
+        with self._lock:
+            state = self._current(time.perf_counter())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, ok: bool, latency_ms: float):
+        """Outcome of a call let through by allow()."""
+        with self._lock:
+            now = time.perf_counter()
+            state = self._current(now)
+            slow = latency_ms >= self.slow_ms
+            if ok:
+                self._latencies.append(latency_ms)
+            if state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    print(f"[HealthGuard AI] ✅ {self.name} recovered, circuit closed")
+                else:
+                    self._trip(now, "probe failed" if not ok else f"probe took {latency_ms:.0f} ms")
+                return
+            if state == OPEN:
+                return  # a call started before the trip
+            self._outcomes.append((ok, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            errors = sum(1 for o, _ in self._outcomes if not o) / len(self._outcomes)
+            slow_share = sum(1 for _, s in self._outcomes if s) / len(self._outcomes)
+            if errors >= self.error_rate:
+                self._trip(now, f"error rate {errors:.0%}")
+            elif slow_share >= self.slow_rate:
+                self._trip(now, f"{slow_share:.0%} of calls slower than {self.slow_ms:.0f} ms")
+
+    def cancel(self):
+        """Return the permission of a call let through by allow() that got no verdict."""
+        with self._lock:
+            if self._current(time.perf_counter()) == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _trip(self, now: float, reason: str):
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self.trips += 1
+        self.last_trip_reason = reason
+        print(f"[HealthGuard AI] ⚠️ {self.name} circuit opened ({reason}), skipping it for {self.open_seconds:g}s")
+
+    def p95_ms(self, min_samples: int = 5):
+        """p95 latency of recent successful calls, None with too few samples."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.perf_counter()
+            state = self._current(now)
+            outcomes = list(self._outcomes)
+            latencies = sorted(self._latencies)
+            return {
+                "state": state,
+                "open_for_seconds": round(self.open_seconds - (now - self._opened_at), 1) if state == OPEN else None,
+                "window_calls": len(outcomes),
+                "window_error_rate": round(sum(1 for o, _ in outcomes if not o) / len(outcomes), 3) if outcomes else None,
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1) if latencies else None,
+                "trips": self.trips,
+                "skipped": self.skipped,
+                "last_trip_reason": self.last_trip_reason,
+            }
+
+
+class CircuitBreakers:
+    """Breakers by provider and model, created on first use with shared settings."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        name = f"{provider}:{model}"
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, **self.settings)
+            return breaker
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: b.stats() for name, b in breakers.items()}
+
+
+class Hedger:
+    """Runs an attempt and, if it is slow, a second one; the first non-None answer wins."""
+
+    def __init__(self, enabled: bool = False, min_delay: float = 1.0, max_workers: int = 16):
+        self.enabled = enabled
+        self.min_delay = min_delay
+        self._executor = ThreadPoolExecutor(max_workers=max(2, max_workers), thread_name_prefix="hg-hedge") \
+            if enabled else None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def run(self, attempt, p95_ms: float = None, deadline: float = None, can_hedge: bool = True):
+        """
+        attempt() -> answer or None. Without hedging (disabled, no p95 yet or
+        `can_hedge` false) it simply runs inline. `deadline`
+        (time.perf_counter()) bounds the wait for the answers.
+        """
+        if not self.enabled or p95_ms is None or not can_hedge:
+            return attempt()
+        delay = max(self.min_delay, p95_ms / 1000)
+        with self._lock:
+            self.calls += 1
+
+        primary = self._executor.submit(attempt)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+
+        hedge = self._executor.submit(attempt)
+        with self._lock:
+            self.hedged += 1
+        pending = {primary, hedge}
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, pending = wait_futures(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                return None  # deadline; the attempts finish in the background
+            for future in done:
+                answer = future.result()
+                if answer is not None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return answer
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "min_delay_ms": round(self.min_delay * 1000),
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+            }
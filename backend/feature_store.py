@@ -0,0 +1,299 @@
+"""
+Backbone Feature Store
+Keeps the DenseNet-121 output of every analyzed scan on disk so that work
+which only depends on the classifier head (feedback fine-tuning, re-analysis
+after feedback, findings for a re-uploaded image) never runs the CNN again.
+
+Per row it stores the pooled 1024-d feature vector and, when enabled, the
+final 1024x7x7 feature map (needed to redraw the Hi-Res CAM). Both live in
+raw float32 files that are memory-mapped and grown on demand; rows are
+indexed by session id and by image hash through an append-only JSONL index
+that is replayed on startup.
+
+The store is bounded by HG_FEATURE_STORE_MB: once every row is in use, the
+least recently used row (put / alias / hit) is evicted, with all sessions and
+images pointing at it, and its slot is reused. The index is compacted (one
+line per live row, oldest first) when it grows past twice the live entries.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+
+POOLED_FILE = "pooled.f32"
+MAPS_FILE = "maps.f32"
+INDEX_FILE = "index.jsonl"
+META_FILE = "meta.json"
+
+
+def image_digest(image) -> str:
+    """SHA-256 of the decoded pixels (mode, size and raw bytes) of a PIL image."""
+    h = hashlib.sha256()
+    h.update(f"{image.mode}|{image.size}|".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+@dataclass
+class FeatureRecord:
+    row: int
+    pooled: np.ndarray                # (1024,)
+    feature_map: np.ndarray = None    # (1024, 7, 7) when maps are stored
+
+
+class FeatureStore:
+    """Memory-mapped store of backbone features indexed by session id and image hash."""
+
+    def __init__(self, root: str, dim: int = 1024, map_shape: tuple = (1024, 7, 7),
+                 store_maps: bool = True, initial_capacity: int = 64, max_bytes: int = 1024 * 1024 * 1024):
+        self.root = root
+        self.dim = dim
+        self.map_shape = tuple(map_shape)
+        self.map_size = int(np.prod(self.map_shape))
+        self.store_maps = store_maps
+        row_bytes = (self.dim + (self.map_size if store_maps else 0)) * 4
+        self.max_rows = max(1, max_bytes // row_bytes)
+
+        self._by_session = {}
+        self._by_hash = {}
+        self._sessions_of = {}  # row -> {session ids}
+        self._hashes_of = {}    # row -> {image hashes}
+        self._has_map = {}      # row -> bool
+        self._lru = OrderedDict()  # row -> None, least recently used first
+        self._count = 0         # rows (slots) in use
+        self._capacity = 0
+        self._index_lines = 0
+        self._pooled = None
+        self._maps = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._check_layout()
+        self._replay_index()
+        self._open(max(min(initial_capacity, self.max_rows), self._count))
+
+    def _check_layout(self):
+        """Start over if the store on disk was written with a different feature shape."""
+        meta_path = os.path.join(self.root, META_FILE)
+        meta = {"dim": self.dim, "map_shape": list(self.map_shape)}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f) == meta:
+                    return
+            print("[HealthGuard AI] ⚠️ Feature store layout changed, starting a new store")
+            for name in (POOLED_FILE, MAPS_FILE, INDEX_FILE):
+                path = os.path.join(self.root, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+
+    def _replay_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                    # Compacted lines list every session / image of their row
+                    self._index(item["row"], item.get("sessions") or [item.get("session_id")],
+                                item.get("hashes") or [item.get("image_hash")],
+                                item.get("has_map", False), reset=item.get("reset", False))
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue  # torn last line after a crash
+                self._index_lines += 1
+        if self._count > self.max_rows:
+            # HG_FEATURE_STORE_MB was lowered: drop the rows past the new bound
+            for row in range(self.max_rows, self._count):
+                self._forget(row)
+            self._count = self.max_rows
+            self._compact_index()
+        elif self._index_too_long():
+            self._compact_index()
+        if self._count:
+            print(f"[HealthGuard AI] 🧬 Feature store: {self._count} scans, "
+                  f"{len(self._by_session)} sessions")
+
+    def _index(self, row, sessions, hashes, has_map, reset=False):
+        """Point sessions / image hashes at `row` (lock held or replay); `reset`: the slot was reused."""
+        if reset:
+            self._forget(row)
+        for session_id in sessions:
+            if session_id:
+                _link(self._by_session, self._sessions_of, session_id, row)
+        for image_hash in hashes:
+            if image_hash:
+                _link(self._by_hash, self._hashes_of, image_hash, row)
+        self._has_map[row] = self._has_map.get(row, False) or has_map
+        self._count = max(self._count, row + 1)
+        self._touch(row)
+
+    def _touch(self, row):
+        self._lru[row] = None
+        self._lru.move_to_end(row)
+
+    def _forget(self, row):
+        """Drop a row and every session / image pointing at it."""
+        for session_id in self._sessions_of.pop(row, ()):
+            self._by_session.pop(session_id, None)
+        for image_hash in self._hashes_of.pop(row, ()):
+            self._by_hash.pop(image_hash, None)
+        self._has_map.pop(row, None)
+        self._lru.pop(row, None)
+
+    def _append_index(self, **item):
+        with open(os.path.join(self.root, INDEX_FILE), "a") as f:
+            f.write(json.dumps(item) + "\n")
+        self._index_lines += 1
+        if self._index_too_long():
+            self._compact_index()
+
+    def _index_too_long(self) -> bool:
+        return self._index_lines > 2 * (len(self._by_session) + len(self._by_hash)) + 1024
+
+    def _compact_index(self):
+        """Rewrite the index as one line per live row, least recently used first."""
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for row in self._lru:
+                f.write(json.dumps({
+                    "row": row,
+                    "sessions": sorted(self._sessions_of.get(row, ())),
+                    "hashes": sorted(self._hashes_of.get(row, ())),
+                    "has_map": self._has_map.get(row, False),
+                    "reset": True,
+                }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._index_lines = len(self._lru)
+
+    def _open(self, capacity: int):
+        """(Re)map the data files with room for `capacity` rows, resizing them if needed."""
+        # Drop the old mappings first: a mapped file can't be resized on Windows
+        self._pooled = self._maps = None
+        self._pooled = _grow_memmap(os.path.join(self.root, POOLED_FILE), capacity, self.dim)
+        if self.store_maps:
+            self._maps = _grow_memmap(os.path.join(self.root, MAPS_FILE), capacity, self.map_size)
+        self._capacity = capacity
+
+    def put(self, session_id: str, image_hash: str, pooled: np.ndarray,
+            feature_map: np.ndarray = None) -> int:
+        """Store the features of one analyzed image; returns its row."""
+        has_map = self.store_maps and feature_map is not None
+        with self._lock:
+            row = self._by_hash.get(image_hash) if image_hash else None
+            reset = False
+            if row is None or (has_map and not self._has_map.get(row)):
+                if self._count < self.max_rows:
+                    row = self._count
+                    if row >= self._capacity:
+                        self._open(min(self._capacity * 2, self.max_rows))
+                else:
+                    # Full: reuse the least recently used slot
+                    row = next(iter(self._lru))
+                    self._forget(row)
+                    self.evictions += 1
+                    reset = True
+                self._pooled[row] = pooled
+                self._pooled.flush()
+                if has_map:
+                    self._maps[row] = feature_map.reshape(-1)
+                    self._maps.flush()
+            else:
+                has_map = self._has_map[row]
+            # The index line is written after the data, so a replayed row is complete;
+            # memory is updated first so a compaction triggered by the append includes it
+            self._index(row, [session_id], [image_hash], has_map, reset=reset)
+            item = {"reset": True} if reset else {}
+            self._append_index(row=row, session_id=session_id, image_hash=image_hash, has_map=has_map, **item)
+        return row
+
+    def alias(self, session_id: str, source_session_id: str = None, image_hash: str = None) -> bool:
+        """Point a new session (re-analysis, cached result) at existing features."""
+        with self._lock:
+            row = self._by_session.get(source_session_id) if source_session_id else None
+            if row is None and image_hash:
+                row = self._by_hash.get(image_hash)
+            if row is None:
+                return False
+            self._index(row, [session_id], [], False)
+            self._append_index(row=row, session_id=session_id, image_hash=None, has_map=False)
+        return True
+
+    def get(self, session_id: str = None, image_hash: str = None, need_map: bool = False):
+        """
+        FeatureRecord for a session id or image hash, or None. A hit by image
+        hash for an unknown session id links that session to the row.
+        """
+        with self._lock:
+            row = self._by_session.get(session_id) if session_id else None
+            linked = row is not None
+            if row is None and image_hash:
+                row = self._by_hash.get(image_hash)
+            if row is None or (need_map and not self._has_map.get(row)):
+                self.misses += 1
+                return None
+            if session_id and not linked:
+                self._index(row, [session_id], [], False)
+                self._append_index(row=row, session_id=session_id, image_hash=None, has_map=False)
+            self._touch(row)
+            self.hits += 1
+            pooled = np.array(self._pooled[row])
+            feature_map = None
+            if self.store_maps and self._has_map.get(row):
+                feature_map = np.array(self._maps[row]).reshape(self.map_shape)
+        return FeatureRecord(row, pooled, feature_map)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = sum(
+                os.path.getsize(os.path.join(self.root, name))
+                for name in (POOLED_FILE, MAPS_FILE, INDEX_FILE)
+                if os.path.exists(os.path.join(self.root, name))
+            )
+            return {
+                "rows": self._count,
+                "capacity": self._capacity,
+                "max_rows": self.max_rows,
+                "evictions": self.evictions,
+                "index_lines": self._index_lines,
+                "sessions": len(self._by_session),
+                "images": len(self._by_hash),
+                "store_maps": self.store_maps,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_mb": round(size / (1024 * 1024), 2),
+            }
+
+
+def _link(index: dict, reverse: dict, key: str, row: int):
+    """index[key] = row, keeping the row -> keys map in step."""
+    old = index.get(key)
+    if old is not None and old != row:
+        reverse.get(old, set()).discard(key)
+    index[key] = row
+    reverse.setdefault(row, set()).add(key)
+
+
+def _grow_memmap(path: str, rows: int, width: int) -> np.memmap:
+    """Open a raw float32 (rows, width) file read/write, resized to exactly `rows` rows."""
+    nbytes = rows * width * 4
+    mode = "r+b" if os.path.exists(path) else "w+b"
+    with open(path, mode) as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() != nbytes:
+            f.truncate(nbytes)
+    return np.memmap(path, dtype=np.float32, mode="r+", shape=(rows, width))
@@ -0,0 +1,167 @@
+"""
+Feedback Accumulator
+Collects feedback corrections as (pooled feature vector, target finding,
+rating-derived weight) samples and hands them to the trainer as weighted
+minibatches, instead of running single-sample optimizer steps inside every
+/api/feedback request.
+
+A minibatch is applied when HG_FEEDBACK_BATCH_SIZE samples are waiting or
+the oldest one has waited HG_FEEDBACK_INTERVAL_MS, whichever comes first.
+HG_FEEDBACK_MODE=immediate applies every sample synchronously on its own
+(the previous behaviour, fine for a single reviewer).
+
+The rating keeps its old meaning, expressed per sample:
+  - weight     6 - rating (rating 1 -> 5, rating 5 -> 1): relative pull of the
+               sample in the weighted loss, and a minibatch takes
+               max(weight) optimizer steps
+  - smoothing  label smoothing (rating - 1) / 4 * 0.3
+so a single sample in immediate mode trains exactly as before.
+"""
+
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+import torch
+
+
+@dataclass
+class FeedbackSample:
+    features: torch.Tensor   # (1, 1024) pooled backbone features
+    finding: str             # target finding name (may still be new to the head)
+    weight: float
+    smoothing: float
+    feedback_id: int = None  # feedback log record, marked applied once trained
+    description: str = ""    # reviewer's description / severity of a finding new to the head,
+    severity: str = ""       # written once the head has been expanded for it
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+def rating_to_weight(rating: int) -> tuple:
+    """(sample weight, label smoothing) for a 1-5 accuracy rating."""
+    rating = min(5, max(1, int(rating)))
+    return float(max(1, 6 - rating)), max(0.0, (rating - 1) / 4.0) * 0.3
+
+
+class FeedbackAccumulator:
+    """Queue of feedback samples applied as weighted minibatches by `apply_batch(samples)`."""
+
+    def __init__(self, apply_batch, batch_size: int = 16, interval: float = 2.0, mode: str = "buffered"):
+        self.apply_batch = apply_batch  # list[FeedbackSample] -> dict (loss, training_steps, ...)
+        self.batch_size = max(1, batch_size)
+        self.interval = max(0.0, interval)
+        self.mode = "immediate" if mode == "immediate" else "buffered"
+
+        self._pending = deque()
+        self._in_flight = 0  # minibatches taken but not yet applied
+        self._cond = threading.Condition()
+
+        self.submitted = 0
+        self.applied_samples = 0
+        self.applied_batches = 0
+        self.last_batch_size = 0
+        self.last_apply_ms = None          # optimizer steps of the last minibatch
+        self._time_to_apply = deque(maxlen=256)  # enqueue -> applied, ms
+        self.last_error = None
+
+        if self.mode == "buffered":
+            threading.Thread(target=self._loop, name="hg-feedback", daemon=True).start()
+
+    def submit(self, sample: FeedbackSample) -> dict:
+        """
+        Queue a sample. In immediate mode it is applied before returning and
+        the trainer's result is returned with applied=True; otherwise
+        {"applied": False, "queue_depth": n}.
+        """
+        with self._cond:
+            self.submitted += 1
+            if self.mode == "buffered":
+                self._pending.append(sample)
+                self._cond.notify()
+                return {"applied": False, "queue_depth": len(self._pending)}
+            self._in_flight += 1
+        return dict(self._apply([sample]), applied=True)
+
+    def flush(self):
+        """Apply everything queued now, and wait for a minibatch being applied (e.g. before a re-analysis)."""
+        while True:
+            with self._cond:
+                batch = self._take()
+                if not batch:
+                    self._cond.wait_for(lambda: self._in_flight == 0)
+                    return
+            try:
+                self._apply(batch)
+            except Exception:
+                pass  # logged in _apply; the samples are dropped
+
+    def _take(self) -> list:
+        """Up to batch_size of the oldest samples, counted as in flight (lock held)."""
+        batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+        if batch:
+            self._in_flight += 1
+        return batch
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                # Wait for a full batch or for the oldest sample's deadline
+                deadline = self._pending[0].enqueued_at + self.interval
+                while len(self._pending) < self.batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or not self._pending:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take()
+            if batch:
+                try:
+                    self._apply(batch)
+                except Exception:
+                    pass  # logged in _apply; the samples are dropped
+
+    def _apply(self, batch: list) -> dict:
+        start = time.perf_counter()
+        try:
+            result = self.apply_batch(batch)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[HealthGuard AI] ❌ Feedback minibatch of {len(batch)} failed: {e}")
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+            raise
+        done = time.perf_counter()
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+            self.applied_samples += len(batch)
+            self.applied_batches += 1
+            self.last_batch_size = len(batch)
+            self.last_apply_ms = round((done - start) * 1000, 1)
+            self._time_to_apply.extend((done - s.enqueued_at) * 1000 for s in batch)
+        return result
+
+    def stats(self) -> dict:
+        with self._cond:
+            waits = sorted(self._time_to_apply)
+            oldest = self._pending[0].enqueued_at if self._pending else None
+            return {
+                "mode": self.mode,
+                "batch_size": self.batch_size,
+                "interval_ms": round(self.interval * 1000),
+                "queue_depth": len(self._pending),
+                "oldest_wait_ms": round((time.perf_counter() - oldest) * 1000, 1) if oldest else None,
+                "submitted": self.submitted,
+                "applied_samples": self.applied_samples,
+                "applied_batches": self.applied_batches,
+                "last_batch_size": self.last_batch_size,
+                "last_apply_ms": self.last_apply_ms,
+                "time_to_apply_ms": {
+                    "p50": round(waits[len(waits) // 2], 1) if waits else None,
+                    "max": round(waits[-1], 1) if waits else None,
+                },
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,312 @@
+"""
+Feedback Log
+Single append-only store for reviewer feedback, replacing the in-memory
+feedback_history list and the one-JSON-file-per-feedback folder.
+
+  - records are JSON lines in segment files (feedback-000001.jsonl, ...),
+    a new segment is started once the active one reaches
+    HG_FEEDBACK_SEGMENT_MB
+  - later state changes (a queued correction being trained) are appended as
+    small "applied" events instead of rewriting the record
+  - kept in memory: the location of every record, an index by session id
+    and by finding, the most recent records and running aggregates (count,
+    rating sum, model updates, per-finding and per-rating tallies) updated
+    on every write, so stats never scan the history
+  - on startup the segments are replayed to rebuild all of the above
+
+Compaction / migration (run with the server stopped):
+    python -m backend.feedback_log feedback/ --migrate-json
+rewrites the segments with applied events folded into their records and
+imports the legacy feedback_*.json files of that folder.
+"""
+
+import os
+import json
+import glob
+import time
+import shutil
+import argparse
+import threading
+from collections import deque
+
+
+SEGMENT_PATTERN = "feedback-*.jsonl"
+
+
+def _segment_name(number: int) -> str:
+    return f"feedback-{number:06d}.jsonl"
+
+
+class FeedbackLog:
+    """Append-only, segment-rotated feedback log with indexes and running aggregates."""
+
+    def __init__(self, root: str, segment_bytes: int = 8 * 1024 * 1024, recent: int = 20):
+        self.root = root
+        self.segment_bytes = max(1024, segment_bytes)
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._segments = []        # segment numbers, oldest first
+        self._active = None        # append handle of the newest segment
+        self._locations = {}       # id -> (segment number, byte offset)
+        self._applied = {}         # id -> head version it was trained into
+        self._by_session = {}      # session id -> [ids]
+        self._by_finding = {}      # finding -> [ids]
+        self._recent = deque(maxlen=recent)
+        self.last_id = 0
+
+        self.total = 0
+        self.rating_sum = 0
+        self.model_updates = 0
+        self.custom = 0
+        self.finding_counts = {}
+        self.rating_counts = {}
+
+        self._replay()
+
+    # ---------- Replay ----------
+
+    def _replay(self):
+        start = time.perf_counter()
+        for path in sorted(glob.glob(os.path.join(self.root, SEGMENT_PATTERN))):
+            number = int(os.path.basename(path)[len("feedback-"):-len(".jsonl")])
+            self._segments.append(number)
+            offset = good_end = 0  # good_end: just past the last line that replayed
+            line = b""
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        self._apply_event(json.loads(line), number, offset)
+                        good_end = offset + len(line)
+                    except (json.JSONDecodeError, KeyError, TypeError, UnicodeDecodeError):
+                        pass  # torn last line of a crashed write
+                    offset += len(line)
+            # The next append must start on a fresh line, not continue a torn one
+            if offset > good_end:
+                os.truncate(path, good_end)
+                print(f"[HealthGuard AI] ⚠️ Feedback log: dropped {offset - good_end} bytes of a torn "
+                      f"write at the end of {os.path.basename(path)}")
+            elif not line.endswith(b"\n") and offset:
+                with open(path, "ab") as f:
+                    f.write(b"\n")
+        if self.total:
+            print(f"[HealthGuard AI] 📝 Feedback log: {self.total} feedbacks in "
+                  f"{len(self._segments)} segment(s), replayed in {time.perf_counter() - start:.2f}s")
+
+    def _apply_event(self, event: dict, segment: int, offset: int):
+        """Update indexes and aggregates for one log line (lock held or replay)."""
+        if event.get("event") == "applied":
+            self._mark(event["id"], event.get("head_version"))
+            return
+
+        record_id = event["id"]
+        self._locations[record_id] = (segment, offset)
+        self.last_id = max(self.last_id, record_id)
+        self._by_session.setdefault(event.get("session_id") or "", []).append(record_id)
+        finding = event.get("correct_finding") or ""
+        self._by_finding.setdefault(finding, []).append(record_id)
+
+        try:
+            rating = int(event.get("rating", 3))
+        except (TypeError, ValueError):
+            rating = 3
+        self.total += 1
+        self.rating_sum += rating
+        self.rating_counts[rating] = self.rating_counts.get(rating, 0) + 1
+        if finding:
+            self.finding_counts[finding] = self.finding_counts.get(finding, 0) + 1
+        if event.get("is_custom"):
+            self.custom += 1
+        self._recent.append(event)
+        if event.get("model_updated"):
+            self._mark(record_id, event.get("head_version"))
+
+    def _mark(self, record_id: int, head_version):
+        if record_id in self._applied:
+            return
+        self._applied[record_id] = head_version
+        self.model_updates += 1
+        for record in self._recent:
+            if record["id"] == record_id:
+                record["model_updated"] = True
+                record["head_version"] = head_version
+
+    # ---------- Writes ----------
+
+    def _write(self, event: dict):
+        """Append one line to the active segment; returns (segment, offset) (lock held)."""
+        if self._active is None:
+            # Continue the newest segment from the last run
+            if not self._segments:
+                self._segments.append(1)
+            self._active = open(os.path.join(self.root, _segment_name(self._segments[-1])), "ab")
+        if self._active.tell() >= self.segment_bytes:
+            self._active.close()
+            self._segments.append(self._segments[-1] + 1)
+            self._active = open(os.path.join(self.root, _segment_name(self._segments[-1])), "ab")
+        offset = self._active.tell()
+        self._active.write((json.dumps(event, default=str) + "\n").encode())
+        self._active.flush()
+        return self._segments[-1], offset
+
+    def append(self, record: dict) -> dict:
+        """Store a feedback record; assigns and returns it with its `id`."""
+        with self._lock:
+            record = dict(record, id=self.last_id + 1, event="feedback")
+            record.setdefault("created_at", time.time())
+            segment, offset = self._write(record)
+            self._apply_event(record, segment, offset)
+            return dict(record)
+
+    def mark_applied(self, record_id: int, head_version: int = None):
+        """Record that feedback `record_id` was trained into head `head_version`."""
+        with self._lock:
+            if record_id in self._applied or record_id not in self._locations:
+                return
+            self._write({"event": "applied", "id": record_id, "head_version": head_version,
+                         "at": time.time()})
+            self._mark(record_id, head_version)
+
+    # ---------- Reads ----------
+
+    def get(self, record_id: int):
+        with self._lock:
+            location = self._locations.get(record_id)
+            applied = self._applied.get(record_id, False)
+        if location is None:
+            return None
+        segment, offset = location
+        with open(os.path.join(self.root, _segment_name(segment)), "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.readline())
+        if applied is not False:
+            record["model_updated"] = True
+            record["head_version"] = applied
+        return record
+
+    def find(self, session_id: str = None, finding: str = None, limit: int = 50) -> list:
+        """Newest-first records of a session and/or finding, through the indexes."""
+        with self._lock:
+            ids = None
+            for index, key in ((self._by_session, session_id), (self._by_finding, finding)):
+                if key is None:
+                    continue
+                matches = index.get(key, [])
+                if ids is None:
+                    ids = matches
+                else:
+                    wanted = set(matches)
+                    ids = [i for i in ids if i in wanted]
+            if ids is None:
+                ids = sorted(self._locations)
+            ids = ids[-limit:][::-1] if limit else ids[::-1]
+        return [r for r in (self.get(i) for i in ids) if r is not None]
+
+    def recent(self, count: int = 5) -> list:
+        with self._lock:
+            return [dict(r) for r in list(self._recent)[-count:]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": self.total,
+                "model_updates": self.model_updates,
+                "custom_findings": self.custom,
+                "average_rating": round(self.rating_sum / self.total, 1) if self.total else 0,
+                "rating_counts": {str(k): v for k, v in sorted(self.rating_counts.items())},
+                "finding_counts": dict(sorted(self.finding_counts.items(), key=lambda kv: -kv[1])),
+                "segments": len(self._segments),
+                "sessions": len(self._by_session),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+
+# ---------- Compaction / migration ----------
+
+def _legacy_record(path: str) -> dict:
+    """Log record for one legacy feedback_<session>_<id>.json file."""
+    with open(path) as f:
+        data = json.load(f)
+    feedback = data.get("feedback", {})
+    result = data.get("result", {})
+    return {
+        "session_id": data.get("session_id", ""),
+        "correct_finding": feedback.get("correct_finding", ""),
+        "custom_finding": feedback.get("custom_finding", ""),
+        "severity_correction": feedback.get("severity_correction", ""),
+        "scan_type": feedback.get("scan_type", "Unknown"),
+        "notes": feedback.get("notes", ""),
+        "description": feedback.get("description", ""),
+        "rating": feedback.get("rating", 3),
+        "model_updated": bool(result.get("model_updated")),
+        "is_custom": bool(result.get("is_custom_finding")),
+        "message": result.get("message", ""),
+        "original_filename": data.get("original_filename", ""),
+        "legacy_id": result.get("feedback_id"),
+        "migrated_from": os.path.basename(path),
+        "created_at": os.path.getmtime(path),
+    }
+
+
+def compact(root: str, migrate_json: bool = False, segment_bytes: int = 8 * 1024 * 1024) -> dict:
+    """
+    Rewrite the log in `root` with applied events folded into their records,
+    optionally importing legacy feedback_*.json files (moved to
+    legacy_json/ afterwards). Ids are kept. The server must not be running.
+    """
+    old = FeedbackLog(root, segment_bytes)
+    records = [old.get(i) for i in sorted(old._locations)]
+    old.close()
+
+    legacy = sorted(glob.glob(os.path.join(root, "feedback_*.json")), key=os.path.getmtime) \
+        if migrate_json else []
+    imported = [_legacy_record(p) for p in legacy]
+
+    staging = os.path.join(root, ".compact")
+    shutil.rmtree(staging, ignore_errors=True)
+    new = FeedbackLog(staging, segment_bytes)
+    for record in records:
+        with new._lock:
+            new.last_id = record["id"] - 1  # keep ids
+        new.append({k: v for k, v in record.items() if k not in ("id", "event")})
+    for record in imported:
+        new.append(record)
+    new.close()
+
+    # Swap the segments in
+    for path in glob.glob(os.path.join(root, SEGMENT_PATTERN)):
+        os.remove(path)
+    for path in glob.glob(os.path.join(staging, SEGMENT_PATTERN)):
+        os.replace(path, os.path.join(root, os.path.basename(path)))
+    shutil.rmtree(staging, ignore_errors=True)
+
+    if legacy:
+        archive = os.path.join(root, "legacy_json")
+        os.makedirs(archive, exist_ok=True)
+        for path in legacy:
+            os.replace(path, os.path.join(archive, os.path.basename(path)))
+
+    return {"records": len(records), "imported": len(imported), "total": len(records) + len(imported)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", nargs="?", default=os.getenv(
+        "HG_FEEDBACK_LOG_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "feedback")))
+    parser.add_argument("--migrate-json", action="store_true",
+                        help="Import legacy feedback_*.json files (moved to legacy_json/)")
+    parser.add_argument("--segment-mb", type=float, default=float(os.getenv("HG_FEEDBACK_SEGMENT_MB", "8")))
+    args = parser.parse_args()
+
+    summary = compact(args.root, args.migrate_json, int(args.segment_mb * 1024 * 1024))
+    print(f"Compacted {summary['records']} records, imported {summary['imported']} legacy files "
+          f"-> {summary['total']} feedbacks in {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Classifier Head Registry
+Copy-on-write versioning of the findings classifier so inference never sees a
+head that is being trained.
+
+Writers (feedback fine-tuning, dataset training, classifier expansion) work on
+a private trainable head under `write_lock` and call publish(), which freezes a
+copy of it as a new immutable HeadVersion and swaps the current pointer in one
+assignment. Readers call current() once per request and run every step of that
+request (probabilities, Hi-Res CAM, findings names) on the version they got,
+so an in-flight analysis finishes on the version it started with.
+"""
+
+import copy
+import time
+import threading
+from dataclasses import dataclass
+
+import torch.nn as nn
+
+
+@dataclass(frozen=True)
+class HeadVersion:
+    version: int
+    classifier: nn.Module   # eval mode, parameters frozen; never modified after publish
+    findings: tuple         # output index -> finding name
+    source: str             # what produced it: "init", "brain", "feedback", "dataset-training"
+    created_at: float
+
+
+class HeadRegistry:
+    """Holds the current HeadVersion; publish() is the only way to change it."""
+
+    def __init__(self, classifier: nn.Module, findings: list, version: int = 0, source: str = "init"):
+        # Serializes writers (they mutate the shared working head); readers never take it
+        self.write_lock = threading.RLock()
+        self._publish_lock = threading.Lock()
+        self._current = _freeze(classifier, findings, version, source)
+        self.publishes = 0
+
+    def current(self) -> HeadVersion:
+        """The latest published head (a plain attribute read, no locking)."""
+        return self._current
+
+    def publish(self, classifier: nn.Module, findings: list, source: str) -> HeadVersion:
+        """Freeze a copy of `classifier` as the next version and make it current."""
+        with self._publish_lock:
+            head = _freeze(classifier, findings, self._current.version + 1, source)
+            self._current = head  # atomic pointer swap
+            self.publishes += 1
+        return head
+
+    def stats(self) -> dict:
+        head = self._current
+        return {
+            "version": head.version,
+            "source": head.source,
+            "findings": len(head.findings),
+            "published_at": round(head.created_at, 3),
+            "publishes": self.publishes,
+        }
+
+
+def _freeze(classifier: nn.Module, findings: list, version: int, source: str) -> HeadVersion:
+    frozen = copy.deepcopy(classifier).eval()
+    for p in frozen.parameters():
+        p.requires_grad_(False)
+    return HeadVersion(version, frozen, tuple(findings), source, time.time())
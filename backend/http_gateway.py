@@ -0,0 +1,216 @@
+"""
+Outbound HTTP Gateway
+Single place every outbound call (Groq, Claude, NVIDIA, Supabase) goes
+through, instead of a fresh requests.post / SDK client per call.
+
+  - one keep-alive requests.Session per host with a pool of
+    HG_HTTP_POOL_SIZE connections, so TLS handshakes are paid once per
+    connection instead of once per request
+  - uniform timeouts: (connect, read) = (HG_HTTP_CONNECT_TIMEOUT_S,
+    HG_HTTP_TIMEOUT_S) unless the caller passes its own
+  - retries with exponential backoff + jitter (HG_HTTP_RETRIES,
+    HG_HTTP_BACKOFF_MS) on connection errors and on 502/503/504; read
+    timeouts are not retried (the provider may still be working on it) and
+    an optional deadline stops retrying once there is no time left
+  - per-endpoint accounting: calls, errors, retries, status codes, bytes
+    sent / received and latency p50 / p95
+  - streamed responses (stream=True) are timed to their headers; their body
+    bytes are counted as the caller reads them through iter_lines()
+"""
+
+import time
+import random
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class HttpGateway:
+    """Pooled, retrying, instrumented HTTP client shared by all outbound calls."""
+
+    def __init__(self, pool_size: int = 10, timeout: float = 30.0, connect_timeout: float = 10.0,
+                 retries: int = 2, backoff: float = 0.2):
+        self.pool_size = max(1, pool_size)
+        self.timeout = (connect_timeout, timeout)
+        self.retries = max(0, retries)
+        self.backoff = max(0.0, backoff)
+
+        self._lock = threading.Lock()
+        self._sessions = {}   # "scheme://host" -> requests.Session
+        self._endpoints = {}  # endpoint label -> counters
+
+    # ---------- Connection pools ----------
+
+    def _session(self, origin: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                      max_retries=0, pool_block=False)
+                session.mount(origin, adapter)
+                self._sessions[origin] = session
+            return session
+
+    # ---------- Requests ----------
+
+    def request(self, method: str, url: str, endpoint: str = None, timeout=None,
+                retry_statuses=RETRY_STATUSES, deadline: float = None, stream: bool = False,
+                **kwargs) -> requests.Response:
+        """
+        Send a request through the host's pool and return the Response.
+        `endpoint` labels the metrics (defaults to host + path), `deadline`
+        (time.perf_counter() based) stops retries that could not finish in
+        time. With stream=True the body of a successful response is left
+        unread (see iter_lines()).
+        Raises the last requests exception when all attempts failed.
+        """
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        endpoint = endpoint or f"{parts.netloc}{parts.path}"
+        session = self._session(origin)
+        timeout = timeout if timeout is not None else self.timeout
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            sent = 0
+            try:
+                prepared = session.prepare_request(requests.Request(method, url, **kwargs))
+                sent = _body_size(prepared.body)
+                response = session.send(prepared, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                elapsed = time.perf_counter() - start
+                if self._should_retry(attempt, deadline):
+                    self._record(endpoint, elapsed, sent, 0, None, retried=True)
+                    attempt = self._sleep(attempt)
+                    continue
+                self._record(endpoint, elapsed, sent, 0, None, error=type(e).__name__)
+                raise
+            except requests.RequestException as e:
+                self._record(endpoint, time.perf_counter() - start, sent, 0, None, error=type(e).__name__)
+                raise
+
+            elapsed = time.perf_counter() - start
+            # Error bodies of a stream are short; reading them keeps the connection reusable
+            received = 0 if stream and response.status_code < 400 else len(response.content)
+            if response.status_code in retry_statuses and self._should_retry(attempt, deadline):
+                self._record(endpoint, elapsed, sent, received, response.status_code, retried=True)
+                response.close()
+                attempt = self._sleep(attempt)
+                continue
+            self._record(endpoint, elapsed, sent, received, response.status_code)
+            return response
+
+    def iter_lines(self, response: requests.Response, endpoint: str):
+        """Lines of a streamed response as they arrive; its bytes are added to `endpoint`."""
+        received = 0
+        try:
+            for line in response.iter_lines():
+                received += len(line) + 1
+                yield line
+        finally:
+            response.close()
+            with self._lock:
+                e = self._endpoints.get(endpoint)
+                if e is not None:
+                    e["bytes_received"] += received
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _should_retry(self, attempt: int, deadline: float) -> bool:
+        if attempt >= self.retries:
+            return False
+        if deadline is not None and time.perf_counter() + self._delay(attempt) >= deadline:
+            return False
+        return True
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt)
+
+    def _sleep(self, attempt: int) -> int:
+        delay = self._delay(attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+        return attempt + 1
+
+    # ---------- Metrics ----------
+
+    def _record(self, endpoint: str, elapsed: float, sent: int, received: int, status,
+                retried: bool = False, error: str = None):
+        with self._lock:
+            e = self._endpoints.setdefault(endpoint, {
+                "calls": 0, "errors": 0, "retries": 0, "status": {},
+                "bytes_sent": 0, "bytes_received": 0, "latency": deque(maxlen=512),
+            })
+            e["bytes_sent"] += sent
+            e["bytes_received"] += received
+            if status is not None:
+                e["status"][str(status)] = e["status"].get(str(status), 0) + 1
+            if retried:
+                e["retries"] += 1
+                return
+            e["calls"] += 1
+            if error:
+                e["errors"] += 1
+                e["status"][error] = e["status"].get(error, 0) + 1
+            e["latency"].append(elapsed * 1000)
+
+    def _connections(self) -> dict:
+        """Connections opened / requests sent per host, from the urllib3 pools."""
+        hosts = {}
+        for origin, session in list(self._sessions.items()):
+            opened = sent = 0
+            for adapter in session.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        opened += getattr(pool, "num_connections", 0)
+                        sent += getattr(pool, "num_requests", 0)
+            if sent:
+                hosts[origin] = {"connections_opened": opened, "requests": sent}
+        return hosts
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {}
+            for name, e in self._endpoints.items():
+                latency = sorted(e["latency"])
+                endpoints[name] = {
+                    "calls": e["calls"],
+                    "errors": e["errors"],
+                    "retries": e["retries"],
+                    "status": dict(e["status"]),
+                    "bytes_sent": e["bytes_sent"],
+                    "bytes_received": e["bytes_received"],
+                    "latency_ms": {
+                        "p50": round(latency[len(latency) // 2], 1) if latency else None,
+                        "p95": round(latency[min(len(latency) - 1, int(len(latency) * 0.95))], 1) if latency else None,
+                    },
+                }
+            hosts = self._connections()
+        return {
+            "pool_size": self.pool_size,
+            "timeout_seconds": {"connect": self.timeout[0], "read": self.timeout[1]},
+            "retries": self.retries,
+            "hosts": hosts,
+            "endpoints": endpoints,
+        }
+
+
+def _body_size(body) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return 0  # streamed / file bodies are not counted
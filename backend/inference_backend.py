@@ -0,0 +1,208 @@
+"""
+Inference Backend Module
+Runs the frozen DenseNet-121 feature extractor through an optional compiled
+backend selected with HG_INFERENCE_BACKEND:
+  - eager        plain PyTorch (default)
+  - torchscript  torch.jit.trace + torch.jit.freeze
+  - compile      torch.compile
+on top of the precision tier selected with HG_PRECISION (see precision.py).
+The backbone variant is built and warmed up at server start, checked against
+its eager counterpart for numerical parity, and the runner falls back step by
+step (compiled -> eager precision variant -> eager fp32) if a build or any
+call fails.
+"""
+
+import os
+import time
+import threading
+
+import torch
+import torch.nn as nn
+
+from backend.precision import (
+    PRECISION_TIERS, BF16Autocast, quantize_features_static,
+)
+
+
+SUPPORTED_BACKENDS = ("eager", "torchscript", "compile")
+
+
+class BackboneRunner:
+    """
+    Callable wrapper around model.features returning the final feature map.
+
+    Only the backbone is compiled/quantized: it is never trained (feedback and
+    dataset training only touch the classifier), so changes to the classifier
+    head never invalidate the compiled module.
+    """
+
+    def __init__(self, features: nn.Module, device: torch.device, backend: str = "eager",
+                 precision: str = "fp32", calibration_loader=None):
+        self.features = features
+        self.device = device
+        if backend not in SUPPORTED_BACKENDS:
+            print(f"[HealthGuard AI] ⚠️ Unknown inference backend '{backend}', using eager")
+            backend = "eager"
+        if precision not in PRECISION_TIERS:
+            print(f"[HealthGuard AI] ⚠️ Unknown precision tier '{precision}', using fp32")
+            precision = "fp32"
+        self.requested_backend = backend
+        self.requested_precision = precision
+        self.active_backend = "eager"
+        self.active_precision = "fp32"
+        self.calibration_loader = calibration_loader  # () -> list of CHW tensors
+        self.fallback_reason = None
+        self.warmed_up = False
+        self.warmup_latency_ms = {}
+        self.precision_max_abs_diff = None
+
+        self._module = None    # precision variant of the backbone (None = fp32 features)
+        self._compiled = None  # compiled version of the active backbone module
+        self._lock = threading.Lock()
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        """Run the backbone without autograd on an NCHW batch."""
+        compiled, module = self._compiled, self._module
+        with torch.no_grad():
+            if compiled is not None:
+                try:
+                    return compiled(batch)
+                except Exception as e:
+                    self._fall_back(f"runtime error: {e}")
+            if module is not None:
+                try:
+                    return module(batch)
+                except Exception as e:
+                    self._fall_back(f"runtime error: {e}")
+            return self.features(batch)
+
+    def _fall_back(self, reason: str):
+        """Drop one level: compiled -> eager precision variant -> eager fp32."""
+        with self._lock:
+            if self._compiled is not None:
+                dropped = f"{self.requested_backend} backend"
+                self._compiled = None
+                self.active_backend = "eager"
+            elif self._module is not None:
+                dropped = f"{self.active_precision} precision"
+                self._module = None
+                self.active_precision = "fp32"
+            else:
+                return
+            self.fallback_reason = reason
+        print(f"[HealthGuard AI] ⚠️ {dropped} disabled ({reason}), falling back")
+
+    def _build_precision_module(self):
+        """Backbone variant for the requested precision tier (None for fp32)."""
+        if self.requested_precision == "bf16":
+            return BF16Autocast(self.features, device_type=self.device.type).eval()
+        if self.requested_precision == "int8-static":
+            if self.device.type != "cpu":
+                raise RuntimeError("static int8 quantization is CPU-only")
+            calibration = self.calibration_loader() if self.calibration_loader else []
+            print(f"[HealthGuard AI] ⚙️ Calibrating static int8 backbone on "
+                  f"{len(calibration)} image(s)...")
+            return quantize_features_static(self.features, calibration)
+        # fp32 and int8-dynamic (head-only) keep the float backbone
+        return None
+
+    def _build_compiled(self, module: nn.Module, example: torch.Tensor):
+        """Compile the backbone module with the requested backend."""
+        module.eval()
+        if self.requested_backend == "torchscript":
+            with torch.no_grad():
+                traced = torch.jit.trace(module, example)
+            return torch.jit.freeze(traced)
+        if self.requested_backend == "compile":
+            return torch.compile(module, dynamic=True)
+        return None
+
+    def warm_up(self, iterations: int = None, batch_size: int = 1) -> dict:
+        """
+        Build the precision variant and compiled backend (if requested), verify
+        parity and record warm-up latency of each stage vs eager fp32.
+        Safe to call more than once.
+        """
+        if iterations is None:
+            iterations = int(os.getenv("HG_WARMUP_ITERS", "3"))
+        iterations = max(1, iterations)
+        example = torch.randn(batch_size, 3, 224, 224, device=self.device)
+
+        with torch.no_grad():
+            reference = self.features(example)
+            self.warmup_latency_ms["eager/fp32"] = _time_ms(lambda: self.features(example), iterations)
+
+        # 1. Precision tier
+        if self.requested_precision != "fp32" and self._module is None \
+                and self.active_precision == "fp32":
+            try:
+                module = self._build_precision_module()
+                if module is not None:
+                    with torch.no_grad():
+                        output = module(example)
+                        self.precision_max_abs_diff = round((output - reference).abs().max().item(), 4)
+                        self.warmup_latency_ms[f"eager/{self.requested_precision}"] = _time_ms(
+                            lambda: module(example), iterations
+                        )
+                with self._lock:
+                    self._module = module
+                    self.active_precision = self.requested_precision
+                print(f"[HealthGuard AI] ✅ {self.requested_precision} precision tier ready")
+            except Exception as e:
+                self.fallback_reason = f"{self.requested_precision} build failed: {e}"
+                print(f"[HealthGuard AI] ⚠️ Could not build {self.requested_precision} precision "
+                      f"tier ({e}), using fp32")
+
+        # 2. Compiled backend on top of the active backbone module
+        if self.requested_backend != "eager" and self._compiled is None:
+            base = self._module if self._module is not None else self.features
+            key = f"{self.requested_backend}/{self.active_precision}"
+            print(f"[HealthGuard AI] ⚙️ Building {self.requested_backend} inference backend...")
+            try:
+                with torch.no_grad():
+                    base_output = base(example)
+                compiled = self._build_compiled(base, example)
+                with torch.no_grad():
+                    output = compiled(example)  # first call triggers compilation
+                if not torch.allclose(output, base_output, rtol=1e-3, atol=1e-4):
+                    max_diff = (output - base_output).abs().max().item()
+                    raise RuntimeError(f"output mismatch vs eager (max diff {max_diff:.2e})")
+                with torch.no_grad():
+                    self.warmup_latency_ms[key] = _time_ms(lambda: compiled(example), iterations)
+                with self._lock:
+                    self._compiled = compiled
+                    self.active_backend = self.requested_backend
+                print(f"[HealthGuard AI] ✅ {self.requested_backend} backend ready: "
+                      f"{self.warmup_latency_ms[key]:.1f} ms vs "
+                      f"eager fp32 {self.warmup_latency_ms['eager/fp32']:.1f} ms")
+            except Exception as e:
+                self.fallback_reason = f"{self.requested_backend} build failed: {e}"
+                print(f"[HealthGuard AI] ⚠️ Could not build {self.requested_backend} backend "
+                      f"({e}), using eager PyTorch")
+
+        self.warmed_up = True
+        return self.stats()
+
+    def stats(self) -> dict:
+        """Backend/precision selection, fallback state and warm-up latency comparison."""
+        eager_ms = self.warmup_latency_ms.get("eager/fp32")
+        active_ms = self.warmup_latency_ms.get(f"{self.active_backend}/{self.active_precision}")
+        return {
+            "requested": self.requested_backend,
+            "active": self.active_backend,
+            "requested_precision": self.requested_precision,
+            "active_precision": self.active_precision,
+            "warmed_up": self.warmed_up,
+            "fallback_reason": self.fallback_reason,
+            "precision_max_abs_diff": self.precision_max_abs_diff,
+            "warmup_latency_ms": {k: round(v, 2) for k, v in self.warmup_latency_ms.items()},
+            "speedup_vs_eager": round(eager_ms / active_ms, 2) if eager_ms and active_ms else None,
+        }
+
+
+def _time_ms(fn, iterations: int) -> float:
+    """Average wall time of fn() in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
@@ -0,0 +1,177 @@
+"""
+Inference Queue Module
+Collects concurrent single-image inference requests into micro-batches so a
+single stacked DenseNet-121 forward serves many callers at once.
+Tunable with HG_BATCH_WINDOW_MS (how long to wait for more requests) and
+HG_BATCH_MAX_SIZE (how many images at most per forward).
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+# Upper bounds of the batch size histogram buckets reported in stats()
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+
+class InferenceBatcher:
+    """
+    Micro-batching scheduler in front of a batch inference function.
+
+    batch_fn receives a list of items (one per caller) and must return a list
+    of results in the same order. Each caller blocks only on its own result.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 16, window_ms: float = 10.0,
+                 name: str = "inference"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window_s = max(0.0, float(window_ms)) / 1000.0
+        self.name = name
+
+        self._pending = deque()  # (item, future, enqueue_time)
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        # Metrics
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._histogram = {b: 0 for b in BATCH_SIZE_BUCKETS}
+        self._histogram_overflow = 0
+        self._wait_ms = deque(maxlen=1024)
+        self._forward_ms = deque(maxlen=1024)
+
+        self._worker = None
+        if self.enabled:
+            self._worker = threading.Thread(
+                target=self._run, name=f"hg-{name}-batcher", daemon=True
+            )
+            self._worker.start()
+
+    @property
+    def enabled(self) -> bool:
+        """Batching is bypassed when the window or the batch size is zero/one."""
+        return self.window_s > 0 and self.max_batch_size > 1
+
+    def submit(self, item) -> Future:
+        """Queue a single item and return a Future resolving to its result."""
+        future = Future()
+        if not self.enabled:
+            # Run inline on the caller's thread (no queue hop)
+            self._execute([(item, future, time.perf_counter())])
+            return future
+
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} batcher has been shut down")
+            self._pending.append((item, future, time.perf_counter()))
+            depth = len(self._pending)
+            self._cond.notify()
+
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def run(self, item, timeout: float = None):
+        """Submit an item and block until its result is ready."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped and not self._pending:
+                    return
+
+                # Hold the window open (from the oldest request) until it is
+                # full or the window elapses
+                deadline = self._pending[0][2] + self.window_s
+                while len(self._pending) < self.max_batch_size and not self._stopped:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = []
+                while self._pending and len(batch) < self.max_batch_size:
+                    batch.append(self._pending.popleft())
+
+            self._execute(batch)
+
+    def _execute(self, batch):
+        start = time.perf_counter()
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"{self.name} batch_fn returned {len(results)} results "
+                    f"for {len(batch)} items"
+                )
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        end = time.perf_counter()
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            for upper in BATCH_SIZE_BUCKETS:
+                if len(batch) <= upper:
+                    self._histogram[upper] += 1
+                    break
+            else:
+                self._histogram_overflow += 1
+            for _, _, enqueued in batch:
+                self._wait_ms.append((start - enqueued) * 1000)
+            self._forward_ms.append((end - start) * 1000)
+
+    def stats(self) -> dict:
+        """Return queue depth, batch size histogram and wait/forward times."""
+        with self._cond:
+            depth = len(self._pending)
+        with self._stats_lock:
+            histogram = {f"<={b}": n for b, n in self._histogram.items()}
+            histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] = self._histogram_overflow
+            return {
+                "enabled": self.enabled,
+                "window_ms": round(self.window_s * 1000, 2),
+                "max_batch_size": self.max_batch_size,
+                "queue_depth": depth,
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+                "batch_size_histogram": histogram,
+                "wait_ms": _summarize(self._wait_ms),
+                "forward_ms": _summarize(self._forward_ms),
+            }
+
+    def shutdown(self):
+        """Stop the worker after draining already queued requests."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+
+
+def _summarize(samples) -> dict:
+    """avg/p50/p95/max of a window of millisecond samples."""
+    if not samples:
+        return {"avg": 0, "p50": 0, "p95": 0, "max": 0}
+    ordered = sorted(samples)
+    n = len(ordered)
+    return {
+        "avg": round(sum(ordered) / n, 2),
+        "p50": round(ordered[n // 2], 2),
+        "p95": round(ordered[min(n - 1, int(n * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
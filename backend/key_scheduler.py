@@ -0,0 +1,261 @@
+"""
+API Key Scheduler
+Routes the calls of one LLM provider across its API keys (GROQ_API_KEY,
+GROQ_API_KEY_2, ...) by their remaining rate-limit budget, instead of always
+starting with the first key and sleeping a fixed second on HTTP 429.
+
+Per key it keeps:
+  - a token bucket of HG_<PROVIDER>_KEY_RPM requests per minute, so we stop
+    before the provider has to tell us
+  - the remaining requests / tokens and their reset times, as reported by the
+    provider's rate-limit response headers
+  - a cooldown from `retry-after` (or the reset headers) after a 429, and a
+    longer one after an auth / billing rejection (HG_KEY_AUTH_COOLDOWN_S)
+
+acquire() hands out the healthiest available key (most budget left, fewest
+calls in flight); when every key is saturated the call waits for the first
+one to free up, until the caller's deadline (or HG_KEY_MAX_WAIT_S), instead
+of failing. release() feeds the response back.
+"""
+
+import re
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime
+
+
+# Rate-limit response headers per provider:
+# (requests limit, requests remaining, requests reset, tokens limit, tokens remaining, tokens reset)
+RATE_LIMIT_HEADERS = {
+    "groq": ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests",
+             "x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+    "claude": ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining",
+               "anthropic-ratelimit-requests-reset", "anthropic-ratelimit-tokens-limit",
+               "anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-reset"),
+}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_reset(value: str):
+    """
+    Seconds until a reset header value: a duration ("1m30.5s", "120ms",
+    Groq), an RFC 3339 timestamp (Anthropic) or plain seconds. None if
+    unparseable.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _UNITS[u] for n, u in parts)
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)  # retry-after may be an HTTP date
+        except (TypeError, ValueError):
+            return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class ApiKey:
+    """Rate-limit state of one API key (guarded by the scheduler's lock)."""
+
+    def __init__(self, name: str, secret: str, rpm: float):
+        self.name = name
+        self.secret = secret
+        self.capacity = max(1.0, rpm)
+        self.rate = max(1.0, rpm) / 60.0  # bucket refill per second
+        self.bucket = self.capacity
+        self.refilled_at = time.perf_counter()
+
+        self.limit_requests = None
+        self.remaining_requests = None
+        self.requests_reset_at = None
+        self.limit_tokens = None
+        self.remaining_tokens = None
+        self.tokens_reset_at = None
+        self.cooldown_until = 0.0
+
+        self.in_flight = 0
+        self.calls = 0
+        self.ok = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.tokens_used = 0
+        self.last_used = 0.0
+
+    def refill(self, now: float):
+        self.bucket = min(self.capacity, self.bucket + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        # Reported budgets are stale once their window has reset
+        if self.requests_reset_at is not None and now >= self.requests_reset_at:
+            self.remaining_requests, self.requests_reset_at = self.limit_requests, None
+        if self.tokens_reset_at is not None and now >= self.tokens_reset_at:
+            self.remaining_tokens, self.tokens_reset_at = self.limit_tokens, None
+
+    def ready_at(self, now: float, tokens: int) -> float:
+        """Earliest time this key can take a call needing `tokens` tokens."""
+        ready = max(now, self.cooldown_until)
+        if self.bucket < 1:
+            ready = max(ready, now + (1 - self.bucket) / self.rate)
+        if self.remaining_requests is not None and self.remaining_requests <= 0 and self.requests_reset_at:
+            ready = max(ready, self.requests_reset_at)
+        if (tokens and self.remaining_tokens is not None and self.remaining_tokens < tokens
+                and self.tokens_reset_at):
+            ready = max(ready, self.tokens_reset_at)
+        return ready
+
+    def headroom(self) -> float:
+        """Fraction of the reported (or local bucket) budget left, 0..1."""
+        fractions = [self.bucket / self.capacity]
+        if self.limit_requests and self.remaining_requests is not None:
+            fractions.append(self.remaining_requests / self.limit_requests)
+        if self.limit_tokens and self.remaining_tokens is not None:
+            fractions.append(self.remaining_tokens / self.limit_tokens)
+        return min(fractions)
+
+
+class KeyScheduler:
+    """Rate-limit-aware choice of API key for one provider."""
+
+    def __init__(self, provider: str, keys: list, rpm: float = 30, max_wait: float = 30.0,
+                 auth_cooldown: float = 300.0):
+        self.provider = provider
+        self.keys = [ApiKey(name, secret, rpm) for name, secret in keys]
+        self.max_wait = max_wait
+        self.auth_cooldown = auth_cooldown
+        self.headers = RATE_LIMIT_HEADERS.get(provider)
+        self._cond = threading.Condition()
+        self.waits = 0
+        self.wait_ms_total = 0.0
+        self.timeouts = 0
+
+    def acquire(self, deadline: float = None, tokens: int = 0, avoid=()) -> ApiKey:
+        """
+        The healthiest key that can take a call now, waiting while all keys are
+        saturated. `deadline` (time.perf_counter()) or max_wait bounds the wait;
+        returns None when no key frees up in time. Keys named in `avoid`
+        (e.g. ones that just failed for this call) are used only if nothing
+        else is available. Every acquired key must be release()d (or cancel()ed).
+        """
+        if not self.keys:
+            return None
+        start = time.perf_counter()
+        limit = deadline if deadline is not None else start + self.max_wait
+        waited = False
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                for key in self.keys:
+                    key.refill(now)
+                ready = [k for k in self.keys if k.ready_at(now, tokens) <= now]
+                if ready:
+                    preferred = [k for k in ready if k.name not in avoid] or ready
+                    key = max(preferred, key=lambda k: (-k.in_flight, k.headroom(), -k.last_used))
+                    key.bucket -= 1
+                    key.in_flight += 1
+                    key.calls += 1
+                    key.last_used = now
+                    if waited:
+                        self.wait_ms_total += (now - start) * 1000
+                    return key
+
+                next_ready = min(k.ready_at(now, tokens) for k in self.keys)
+                if next_ready >= limit:
+                    self.timeouts += 1
+                    return None
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                self._cond.wait(min(next_ready, limit) - now)
+
+    def release(self, key: ApiKey, status: int = None, headers=None, tokens: int = 0):
+        """Return `key` with the outcome of its call (status None: no response / network error)."""
+        now = time.perf_counter()
+        with self._cond:
+            key.in_flight -= 1
+            if headers is not None:
+                self._update_limits(key, headers, now)
+            if status == 200:
+                key.ok += 1
+                key.tokens_used += tokens or 0
+            elif status == 429:
+                key.rate_limited += 1
+                retry_after = parse_reset(headers.get("retry-after")) if headers is not None else None
+                if retry_after is None:
+                    pending = [t for t in (key.requests_reset_at, key.tokens_reset_at) if t and t > now]
+                    retry_after = (min(pending) - now) if pending else 1.0
+                key.cooldown_until = max(key.cooldown_until, now + retry_after)
+            elif status in (401, 403):
+                key.errors += 1
+                key.cooldown_until = max(key.cooldown_until, now + self.auth_cooldown)
+            else:
+                key.errors += 1
+            self._cond.notify_all()
+
+    def cancel(self, key: ApiKey):
+        """Return an acquired key that was not used after all."""
+        with self._cond:
+            key.in_flight -= 1
+            key.calls -= 1
+            key.bucket = min(key.capacity, key.bucket + 1)
+            self._cond.notify_all()
+
+    def _update_limits(self, key: ApiKey, headers, now: float):
+        if not self.headers:
+            return
+        names = self.headers
+        limit_req, remaining_req = _int(headers.get(names[0])), _int(headers.get(names[1]))
+        limit_tok, remaining_tok = _int(headers.get(names[3])), _int(headers.get(names[4]))
+        reset_req, reset_tok = parse_reset(headers.get(names[2])), parse_reset(headers.get(names[5]))
+        if remaining_req is not None:
+            key.limit_requests = limit_req or key.limit_requests
+            key.remaining_requests = remaining_req
+            key.requests_reset_at = now + reset_req if reset_req is not None else None
+        if remaining_tok is not None:
+            key.limit_tokens = limit_tok or key.limit_tokens
+            key.remaining_tokens = remaining_tok
+            key.tokens_reset_at = now + reset_tok if reset_tok is not None else None
+
+    def stats(self) -> dict:
+        now = time.perf_counter()
+        with self._cond:
+            keys = {}
+            for k in self.keys:
+                k.refill(now)
+                keys[k.name] = {
+                    "utilization": round(1 - k.headroom(), 3),
+                    "in_flight": k.in_flight,
+                    "calls": k.calls,
+                    "ok": k.ok,
+                    "rate_limited": k.rate_limited,
+                    "errors": k.errors,
+                    "tokens_used": k.tokens_used,
+                    "bucket": round(k.bucket, 2),
+                    "remaining_requests": k.remaining_requests,
+                    "limit_requests": k.limit_requests,
+                    "remaining_tokens": k.remaining_tokens,
+                    "limit_tokens": k.limit_tokens,
+                    "cooldown_seconds": round(max(0.0, k.cooldown_until - now), 1),
+                }
+            return {
+                "keys": keys,
+                "waits": self.waits,
+                "avg_wait_ms": round(self.wait_ms_total / self.waits, 1) if self.waits else None,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,166 @@
+"""
+LLM Response Cache
+Persistent cache of the parsed JSON answers of the Groq / Claude scan
+analyses, so retries, batch re-runs and /api/reanalyze of the same scan do
+not spend another rate-limited provider call.
+
+  - key: SHA-256 of (provider, model id, prompt template version, normalized
+    patient fields, image content hash); bump LLM_PROMPT_VERSION in the
+    analyzer whenever a prompt changes
+  - stored in one SQLite file (HG_LLM_CACHE_PATH) that survives restarts
+  - entries expire after HG_LLM_CACHE_TTL_H hours; the file is kept under
+    HG_LLM_CACHE_MB by evicting the least recently used entries
+  - every hit is counted as a saved provider call, together with the tokens
+    the original call used
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def normalize_field(value) -> str:
+    """Collapse whitespace so trivially different inputs share an entry."""
+    return " ".join(str(value or "").split())
+
+
+class LLMResponseCache:
+    """SQLite-backed TTL + size-bounded LRU cache of parsed LLM responses."""
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 64 * 1024 * 1024,
+                 enabled: bool = True):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._db = None
+        self._used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.expired = 0
+        self.evictions = 0
+        self.saved = {}  # provider -> {"calls", "tokens"}
+
+        if enabled:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._purge_expired()
+            self._used = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt_version, fields: dict, image_hash: str) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps([provider, model, prompt_version], default=str).encode())
+        h.update(json.dumps({k: normalize_field(v) for k, v in fields.items()}, sort_keys=True).encode())
+        h.update(image_hash.encode())
+        return h.hexdigest()
+
+    def get(self, key: str, provider: str = "", bypass: bool = False):
+        """Cached response for `key`, or None on a miss, an expired entry or `bypass`."""
+        if not self.enabled:
+            return None
+        if bypass:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, tokens, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, tokens, size, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._used -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            saved = self.saved.setdefault(provider, {"calls": 0, "tokens": 0})
+            saved["calls"] += 1
+            saved["tokens"] += tokens
+        return json.loads(value)
+
+    def put(self, key: str, provider: str, model: str, response: dict, tokens: int = 0):
+        """Store a parsed response (replacing an older one) and evict down to the size bound."""
+        if not self.enabled or response is None:
+            return
+        value = json.dumps(response, default=str)
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, value, int(tokens or 0), size, now, now))
+            self._used += size - (old[0] if old else 0)
+            self.stores += 1
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until under max_bytes (lock held)."""
+        while self._used > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 32").fetchall()
+            if not rows:
+                self._used = 0
+                return
+            for key, size in rows:
+                if self._used <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._used -= size
+                self.evictions += 1
+
+    def _purge_expired(self):
+        if self.ttl:
+            cur = self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            self.expired += max(0, cur.rowcount)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": entries,
+                "size_mb": round(self._used / (1024 * 1024), 2),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+                "ttl_hours": round(self.ttl / 3600, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "saved_calls": sum(s["calls"] for s in self.saved.values()),
+                "saved_tokens": sum(s["tokens"] for s in self.saved.values()),
+                "saved_by_provider": {p: dict(s) for p, s in self.saved.items()},
+            }
@@ -0,0 +1,111 @@
+"""
+LLM Provider Fan-out
+Runs the LLM provider calls of one analysis (Groq, Claude) concurrently on a
+shared thread pool while the local DenseNet / Hi-Res CAM work proceeds, all
+under one deadline (HG_LLM_DEADLINE_S) counted from when the analysis
+started.
+
+Each provider function gets the absolute deadline (time.perf_counter()
+based) and is expected to stop rotating API keys and bound its HTTP timeout
+by it. wait() returns whatever arrived in time; a provider still running at
+the deadline is cancelled if it has not started yet and otherwise ignored
+(its result is discarded when it finishes).
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+
+class LLMFanout:
+    """Thread pool + deadline shared by all analyses."""
+
+    def __init__(self, max_workers: int = 8, deadline: float = 45.0):
+        self.deadline = deadline
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hg-llm")
+        self._lock = threading.Lock()
+        self._providers = {}  # name -> {"calls", "ok", "late", "failed", "total_ms"}
+
+    def start(self, calls: dict, started: float = None) -> "FanoutRun":
+        """Submit `calls` ({name: fn(deadline) -> result or None}) and return the run."""
+        started = started if started is not None else time.perf_counter()
+        deadline = started + self.deadline
+        futures = {name: self._executor.submit(self._timed, name, fn, deadline)
+                   for name, fn in calls.items()}
+        return FanoutRun(self, futures, started, deadline)
+
+    def _timed(self, name: str, fn, deadline: float):
+        start = time.perf_counter()
+        try:
+            result = fn(deadline)
+        except Exception as e:
+            print(f"[HealthGuard AI] ⚠️ {name} analysis failed: {e}")
+            result = None
+        return result, (time.perf_counter() - start) * 1000
+
+    def _record(self, name: str, outcome: str, ms: float = None):
+        with self._lock:
+            p = self._providers.setdefault(name, {"calls": 0, "ok": 0, "late": 0, "failed": 0, "total_ms": 0.0})
+            p["calls"] += 1
+            p[outcome] += 1
+            if ms is not None:
+                p["total_ms"] += ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            providers = {
+                name: {
+                    "calls": p["calls"], "ok": p["ok"], "late": p["late"], "failed": p["failed"],
+                    "avg_ms": round(p["total_ms"] / (p["ok"] + p["failed"]), 1) if p["ok"] + p["failed"] else None,
+                }
+                for name, p in self._providers.items()
+            }
+        return {"deadline_seconds": self.deadline, "providers": providers}
+
+
+class FanoutRun:
+    """The provider calls of one analysis."""
+
+    def __init__(self, fanout: LLMFanout, futures: dict, started: float, deadline: float):
+        self.fanout = fanout
+        self.futures = futures
+        self.started = started
+        self.deadline = deadline
+        self.image_payload = None  # LLMImagePayload shared by the providers (set by the analyzer)
+        self.skipped = []          # providers skipped by an open circuit breaker (set by the analyzer)
+        self.first_field_ms = {}   # provider -> ms to its first early answer field (set by the analyzer)
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait up to `timeout` seconds (never past the deadline); True once every provider has finished."""
+        remaining = max(0.0, self.deadline - time.perf_counter())
+        timeout = remaining if timeout is None else min(max(0.0, timeout), remaining)
+        _, pending = wait_futures(list(self.futures.values()), timeout=timeout)
+        return not pending
+
+    def wait(self) -> tuple:
+        """
+        Block until every provider finished or the deadline passed.
+        Returns ({name: result or None}, timings) where timings has
+        "<name>_ms" per provider (None when late), "llm_wait_ms" and "late".
+        """
+        wait_start = time.perf_counter()
+        done, _ = wait_futures(list(self.futures.values()),
+                               timeout=max(0.0, self.deadline - wait_start))
+        results, timings, late = {}, {}, []
+        for name, future in self.futures.items():
+            if future in done:
+                result, ms = future.result()
+                results[name] = result
+                timings[f"{name}_ms"] = round(ms, 1)
+                self.fanout._record(name, "ok" if result is not None else "failed", ms)
+            else:
+                future.cancel()  # no-op if it is already running; the result is ignored
+                results[name] = None
+                timings[f"{name}_ms"] = None
+                late.append(name)
+                self.fanout._record(name, "late")
+                print(f"[HealthGuard AI] ⏱️ {name} missed the {self.fanout.deadline:g}s deadline, continuing without it")
+        timings["llm_wait_ms"] = round((time.perf_counter() - wait_start) * 1000, 1)
+        timings["late"] = late
+        return results, timings
@@ -0,0 +1,137 @@
+"""
+LLM Image Payload
+Encodes a scan for the vision LLM providers once per request instead of
+every provider re-encoding the full-resolution image to JPEG + base64.
+
+  - the long edge is capped (HG_LLM_IMAGE_MAX_EDGE, and the provider's own
+    limit: Claude downsamples anything above 1568 px anyway)
+  - the JPEG quality is binary-searched between HG_LLM_IMAGE_MIN_QUALITY and
+    HG_LLM_IMAGE_MAX_QUALITY for the highest quality that fits the byte
+    budget (HG_LLM_IMAGE_MAX_KB, and the provider's request limit); if even
+    the lowest quality does not fit, the image is downscaled further
+  - results are memoized per (max edge, byte budget), so providers with the
+    same effective limits share one encode, and concurrent providers wait
+    for it instead of encoding in parallel
+"""
+
+import io
+import time
+import base64
+import threading
+from dataclasses import dataclass
+
+from PIL import Image
+
+
+# Provider limits: (max long edge px, max JPEG bytes before base64)
+PROVIDER_LIMITS = {
+    "groq": (4096, 3 * 1024 * 1024),      # 4 MB base64 request images
+    "claude": (1568, 3_750_000),          # 5 MB base64 per image, resized above 1568 px
+}
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    base64: str
+    media_type: str
+    size: tuple         # (width, height) sent
+    quality: int
+    jpeg_bytes: int
+    encode_ms: float
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.media_type};base64,{self.base64}"
+
+
+def _jpeg(image: Image.Image, quality: int) -> bytes:
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    return buffered.getvalue()
+
+
+def encode_within_budget(image: Image.Image, max_edge: int, max_bytes: int,
+                         min_quality: int = 40, max_quality: int = 75) -> EncodedImage:
+    """JPEG of `image` with long edge <= max_edge, at the highest quality that fits max_bytes."""
+    start = time.perf_counter()
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    edge = max(image.size)
+    if edge > max_edge:
+        scale = max_edge / edge
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.LANCZOS, reducing_gap=3.0)
+
+    while True:
+        data = _jpeg(image, max_quality)
+        quality = max_quality
+        if len(data) > max_bytes:
+            # Highest quality in [min_quality, max_quality) that fits
+            best = None
+            lo, hi = min_quality, max_quality - 1
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                candidate = _jpeg(image, mid)
+                if len(candidate) <= max_bytes:
+                    best, quality, lo = candidate, mid, mid + 1
+                else:
+                    hi = mid - 1
+            data = best
+        if data is not None or max(image.size) <= 64:
+            break
+        # Nothing fits: shrink and search again
+        image = image.resize((max(1, round(image.width * 0.75)), max(1, round(image.height * 0.75))),
+                             Image.LANCZOS, reducing_gap=3.0)
+
+    if data is None:
+        data, quality = _jpeg(image, min_quality), min_quality
+    return EncodedImage(
+        base64=base64.b64encode(data).decode(),
+        media_type="image/jpeg",
+        size=image.size,
+        quality=quality,
+        jpeg_bytes=len(data),
+        encode_ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+
+
+class LLMImagePayload:
+    """The encoded image(s) of one request, memoized per effective provider limits."""
+
+    def __init__(self, image: Image.Image, max_edge: int = 1568, max_bytes: int = 1024 * 1024,
+                 min_quality: int = 40, max_quality: int = 75):
+        self.image = image
+        self.max_edge = max_edge
+        self.max_bytes = max_bytes
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self._lock = threading.Lock()
+        self._encoded = {}  # (max edge, max bytes) -> EncodedImage
+        self.encodes = 0
+
+    def limits(self, provider: str) -> tuple:
+        edge, size = PROVIDER_LIMITS.get(provider, (self.max_edge, self.max_bytes))
+        return min(edge, self.max_edge), min(size, self.max_bytes)
+
+    def for_provider(self, provider: str) -> EncodedImage:
+        key = self.limits(provider)
+        with self._lock:  # a second provider waits for the first encode instead of repeating it
+            encoded = self._encoded.get(key)
+            if encoded is None:
+                encoded = encode_within_budget(self.image, *key, min_quality=self.min_quality,
+                                               max_quality=self.max_quality)
+                self._encoded[key] = encoded
+                self.encodes += 1
+            return encoded
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "encodes": self.encodes,
+                "source_size": list(self.image.size),
+                "variants": [
+                    {"size": list(e.size), "quality": e.quality, "jpeg_bytes": e.jpeg_bytes,
+                     "encode_ms": e.encode_ms}
+                    for e in self._encoded.values()
+                ],
+            }
@@ -0,0 +1,218 @@
+"""
+LLM Response Streaming
+Reads the Groq / Claude completions as they are generated (`"stream": true`,
+HG_LLM_STREAM) instead of waiting for the whole body, and hands out the
+top-level fields of the JSON answer the moment each one is complete.
+
+The prompts ask for "findings", "overall_severity" and "primary_finding"
+before the long "detailed_report", so the clinically useful part of an
+answer is available after a fraction of the completion time.
+
+  - iter_sse()               (event, data) pairs of a text/event-stream
+  - IncrementalJSONObject    top-level fields of a JSON object as text arrives
+                             (leading prose / markdown fences are skipped)
+  - StreamedCompletion       text + token usage of one streamed completion,
+                             from the OpenAI-compatible (Groq) or Anthropic
+                             stream events
+"""
+
+import json
+
+
+# Fields worth pushing to the client before the full answer is in
+EARLY_FIELDS = ("findings", "overall_severity", "primary_finding")
+
+_WHITESPACE = " \t\r\n"
+
+
+def iter_sse(lines):
+    """(event, data) pairs of a text/event-stream, from its lines (bytes or str)."""
+    event, data = None, []
+    for raw in lines:
+        line = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+        if not line:
+            if data:
+                yield event or "message", "\n".join(data)
+            event, data = None, []
+            continue
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event or "message", "\n".join(data)
+
+
+class IncrementalJSONObject:
+    """
+    Scans a JSON object as it arrives and parses each top-level value once
+    its last character is in. feed() returns the [(key, value)] completed by
+    that chunk; after a syntax error `failed` is set and nothing more is
+    emitted (the caller's final json.loads of the full text decides).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.complete = False
+        self.failed = False
+        self._pos = 0
+        self._state = "start"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = 0
+        self._key = None
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        completed = []
+        text, i = self.text, self._pos
+        while i < len(text) and not (self.complete or self.failed):
+            c = text[i]
+            state = self._state
+            if state == "start":
+                if c == "{":
+                    self._state = "key"
+            elif state == "key":
+                if c == '"':
+                    self._start, self._state = i, "key_string"
+                elif c == "}":
+                    self.complete = True
+                elif c not in _WHITESPACE:
+                    self.failed = True
+            elif state in ("key_string", "value_string"):
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    raw = text[self._start:i + 1]
+                    if state == "key_string":
+                        try:
+                            self._key, self._state = json.loads(raw), "colon"
+                        except ValueError:
+                            self.failed = True
+                    else:
+                        self._emit(raw, completed)
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value"
+                elif c not in _WHITESPACE:
+                    self.failed = True
+            elif state == "value":
+                if c == '"':
+                    self._start, self._state = i, "value_string"
+                elif c in "{[":
+                    self._start, self._state, self._depth = i, "value_nested", 1
+                elif c not in _WHITESPACE:
+                    self._start, self._state = i, "value_scalar"
+            elif state == "value_nested":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                elif c == '"':
+                    self._in_string = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._emit(text[self._start:i + 1], completed)
+            elif state == "value_scalar":
+                if c in ",}" or c in _WHITESPACE:
+                    self._emit(text[self._start:i], completed)
+                    continue  # the delimiter is handled in the "after" state
+            elif state == "after":
+                if c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self.complete = True
+                elif c not in _WHITESPACE:
+                    self.failed = True
+            i += 1
+        self._pos = i
+        return completed
+
+    def _emit(self, raw: str, completed: list):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self.failed = True
+            return
+        self.fields[self._key] = value
+        completed.append((self._key, value))
+        self._state = "after"
+
+
+class StreamedCompletion:
+    """Text and token usage of one streamed completion, fed the provider's SSE events."""
+
+    def __init__(self, provider: str, on_field=None):
+        self.provider = provider
+        self.on_field = on_field  # on_field(key, value) per completed top-level field
+        self.parser = IncrementalJSONObject()
+        self.parts = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def tokens(self) -> int:
+        if self.total_tokens is not None:
+            return self.total_tokens
+        return self.input_tokens + self.output_tokens
+
+    def feed(self, event: str, data: str):
+        if data.strip() == "[DONE]":
+            self.done = True
+            return
+        message = json.loads(data)
+        if self.provider == "claude":
+            text = self._anthropic(event, message)
+        else:
+            text = self._openai(message)
+        if text:
+            self.parts.append(text)
+            for key, value in self.parser.feed(text):
+                if self.on_field:
+                    self.on_field(key, value)
+
+    def _openai(self, message: dict) -> str:
+        usage = message.get("usage") or (message.get("x_groq") or {}).get("usage")
+        if usage:
+            self.total_tokens = usage.get("total_tokens", self.total_tokens)
+        choices = message.get("choices") or []
+        if not choices:
+            return ""
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+    def _anthropic(self, event: str, message: dict) -> str:
+        kind = message.get("type", event)
+        if kind == "message_start":
+            self.input_tokens = (message.get("message") or {}).get("usage", {}).get("input_tokens", 0)
+        elif kind == "content_block_delta":
+            delta = message.get("delta") or {}
+            if delta.get("type") == "text_delta":
+                return delta.get("text", "")
+        elif kind == "message_delta":
+            self.output_tokens = (message.get("usage") or {}).get("output_tokens", self.output_tokens)
+        elif kind == "message_stop":
+            self.done = True
+        elif kind == "error":
+            raise RuntimeError((message.get("error") or {}).get("message", "stream error"))
+        return ""
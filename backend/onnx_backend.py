@@ -0,0 +1,156 @@
+"""
+ONNX Runtime Findings Engine
+Exports the DenseNet-121 backbone together with the current published
+classifier head (see head_registry) to ONNX and serves findings-only
+inference through onnxruntime with tuned CPU intra/inter-op threading.
+Enabled with HG_FINDINGS_ENGINE=onnxruntime; onnxruntime is optional.
+
+The export is regenerated in the background whenever a new head version is
+published (e.g. after apply_feedback or train_on_dataset); a request is only
+served by the session exported from its own head version, otherwise the
+caller falls back to PyTorch. Hi-Res CAM always stays on PyTorch.
+"""
+
+import os
+import copy
+import time
+import threading
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional dependency
+    ort = None
+
+
+class _FindingsNet(nn.Module):
+    """Backbone + head producing class probabilities (the exported graph)."""
+
+    def __init__(self, features: nn.Module, classifier: nn.Module):
+        super().__init__()
+        self.features = features
+        self.classifier = classifier
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = F.relu(self.features(x))
+        out = F.adaptive_avg_pool2d(out, (1, 1))
+        out = torch.flatten(out, 1)
+        return F.softmax(self.classifier(out), dim=1)
+
+
+class OnnxFindingsEngine:
+    """onnxruntime session for findings-only requests, re-exported on head changes."""
+
+    def __init__(self, features: nn.Module, heads, export_dir: str):
+        self.features = features
+        self.heads = heads  # HeadRegistry
+        self.export_dir = export_dir
+        self.onnx_path = os.path.join(export_dir, "healthguard_findings.onnx")
+        self.intra_op_threads = int(os.getenv("HG_ORT_INTRA_OP_THREADS", str(os.cpu_count() or 1)))
+        self.inter_op_threads = int(os.getenv("HG_ORT_INTER_OP_THREADS", "1"))
+
+        self._session = None  # (head version it was exported from, InferenceSession)
+        self._exporting = False
+        self._lock = threading.Lock()
+
+        self.exports = 0
+        self.last_export_seconds = None
+        self.last_error = None
+        self.requests_served = 0
+        self.requests_fallback = 0
+
+        os.makedirs(export_dir, exist_ok=True)
+
+    @property
+    def available(self) -> bool:
+        return ort is not None
+
+    def is_current(self) -> bool:
+        return self._session is not None and self._session[0] == self.heads.current().version
+
+    def ensure_current(self, background: bool = True):
+        """Re-export if a new head version was published since the last export."""
+        if not self.available or self.is_current():
+            return
+        with self._lock:
+            if self._exporting:
+                return
+            self._exporting = True
+        if background:
+            threading.Thread(target=self._export, name="hg-onnx-export", daemon=True).start()
+        else:
+            self._export()
+
+    def _export(self):
+        try:
+            head = self.heads.current()
+            start = time.perf_counter()
+
+            # Export from a detached CPU copy: the live backbone (maybe on CUDA)
+            # and the published, immutable head keep serving PyTorch requests
+            net = copy.deepcopy(_FindingsNet(self.features, head.classifier)).cpu().float().eval()
+            tmp_path = self.onnx_path + ".tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    net, (torch.randn(1, 3, 224, 224),), tmp_path,
+                    input_names=["input"], output_names=["probabilities"],
+                    dynamic_axes={"input": {0: "batch"}, "probabilities": {0: "batch"}},
+                    opset_version=17, dynamo=False,
+                )
+            os.replace(tmp_path, self.onnx_path)
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.intra_op_threads
+            options.inter_op_num_threads = self.inter_op_threads
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(
+                self.onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+
+            self._session = (head.version, session)  # one assignment: never a torn pair
+            self.exports += 1
+            self.last_export_seconds = round(time.perf_counter() - start, 2)
+            self.last_error = None
+            print(f"[HealthGuard AI] ✅ ONNX findings engine exported head v{head.version} in {self.last_export_seconds}s "
+                  f"({self.intra_op_threads} intra-op / {self.inter_op_threads} inter-op threads)")
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[HealthGuard AI] ⚠️ ONNX export failed: {e}")
+        finally:
+            with self._lock:
+                self._exporting = False
+
+    def predict(self, batch: np.ndarray, head=None):
+        """
+        Probabilities for an NCHW float32 batch under `head` (default: the
+        current HeadVersion), or None when the session is missing or was
+        exported from another version (the caller then uses PyTorch). A stale
+        session triggers a background re-export.
+        """
+        exported = self._session
+        if exported is None or exported[0] != (head or self.heads.current()).version:
+            self.requests_fallback += 1
+            self.ensure_current()
+            return None
+        self.requests_served += 1
+        return exported[1].run(["probabilities"], {"input": batch})[0]
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "current": self.is_current(),
+            "head_version": self._session[0] if self._session else None,
+            "exporting": self._exporting,
+            "exports": self.exports,
+            "last_export_seconds": self.last_export_seconds,
+            "last_error": self.last_error,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "requests_served": self.requests_served,
+            "requests_fallback": self.requests_fallback,
+        }
@@ -0,0 +1,96 @@
+"""
+Precision Tier Module
+Reduced-precision variants of the DenseNet-121 analyzer for CPU-only nodes,
+selected with HG_PRECISION:
+  - fp32          full precision (default)
+  - bf16          backbone runs under bfloat16 autocast
+  - int8-dynamic  nn.Linear classifier dynamically quantized to int8
+                  (findings-only path; Hi-Res CAM keeps the float head)
+  - int8-static   post-training static int8 quantization of the convolutional
+                  features, calibrated on images from HG_CALIBRATION_DIR
+"""
+
+import os
+import copy
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+
+PRECISION_TIERS = ("fp32", "bf16", "int8-dynamic", "int8-static")
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp'}
+
+
+class BF16Autocast(nn.Module):
+    """Runs the wrapped module under bfloat16 autocast and returns float32."""
+
+    def __init__(self, module: nn.Module, device_type: str = "cpu"):
+        super().__init__()
+        self.module = module
+        self.device_type = device_type
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        with torch.autocast(device_type=self.device_type, dtype=torch.bfloat16):
+            out = self.module(x)
+        return out.float()
+
+
+def load_calibration_tensors(folder: str, transform, limit: int = 64) -> list:
+    """Load up to `limit` images from a local folder (recursively) as CHW tensors."""
+    if not folder or not os.path.isdir(folder):
+        return []
+
+    tensors = []
+    for root, _, files in os.walk(folder):
+        for f in sorted(files):
+            if os.path.splitext(f)[1].lower() not in IMAGE_EXTS:
+                continue
+            try:
+                img = Image.open(os.path.join(root, f)).convert("RGB")
+                tensors.append(transform(img))
+            except Exception as e:
+                print(f"[HealthGuard AI] Skipping calibration image {f}: {e}")
+            if len(tensors) >= limit:
+                return tensors
+    return tensors
+
+
+def quantize_features_static(features: nn.Module, calibration_tensors: list,
+                             batch_size: int = 8) -> nn.Module:
+    """
+    Post-training static int8 quantization (FX graph mode) of the backbone.
+    Observers are calibrated on the given tensors; the returned module takes
+    and returns float tensors.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if not calibration_tensors:
+        raise ValueError("static int8 quantization needs calibration images (HG_CALIBRATION_DIR)")
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+
+    float_features = _cpu_copy(features)
+    example = (calibration_tensors[0].unsqueeze(0),)
+    prepared = prepare_fx(float_features, get_default_qconfig_mapping(engine), example)
+
+    with torch.no_grad():
+        for start in range(0, len(calibration_tensors), batch_size):
+            prepared(torch.stack(calibration_tensors[start:start + batch_size]))
+
+    return convert_fx(prepared).eval()
+
+
+def quantize_head_dynamic(classifier: nn.Module) -> nn.Module:
+    """Dynamic int8 quantization of the nn.Linear classifier (CPU)."""
+    return torch.ao.quantization.quantize_dynamic(
+        _cpu_copy(classifier), {nn.Linear}, dtype=torch.qint8
+    )
+
+
+def _cpu_copy(module: nn.Module) -> nn.Module:
+    """Detached float CPU copy of a module in eval mode (quantization works in place)."""
+    return copy.deepcopy(module).cpu().float().eval()
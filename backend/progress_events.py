@@ -0,0 +1,99 @@
+"""
+Progress Event Broker
+Push channel behind the Server-Sent Events endpoints for training jobs and
+batch analysis. Producers publish the latest state of a topic (for example
+"train:<job_id>" or "batch:<batch_id>") from their progress callbacks; each
+subscriber receives at most one event per HG_PROGRESS_MIN_INTERVAL_MS, always
+carrying the newest state, so a 50k-image epoch doesn't turn into 50k events.
+The final event of a topic is always delivered and ends the stream.
+"""
+
+import json
+import time
+import threading
+
+
+class ProgressBroker:
+    """Latest-state-per-topic pub/sub with coalescing SSE streams."""
+
+    def __init__(self, min_interval: float = 0.25, heartbeat: float = 15.0, retention: float = 600.0):
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+        self.retention = retention  # seconds an idle topic is kept for late subscribers
+
+        self._topics = {}  # topic -> {"seq", "data", "final", "updated"}
+        self._cond = threading.Condition()
+
+        self.published = 0
+        self.delivered = 0
+        self.subscribers = 0
+
+    def publish(self, topic: str, data: dict, final: bool = False):
+        """Replace the state of `topic` and wake its subscribers."""
+        with self._cond:
+            state = self._topics.setdefault(topic, {"seq": 0, "data": None, "final": False, "updated": 0})
+            state["seq"] += 1
+            state["data"] = data
+            state["final"] = final
+            state["updated"] = time.time()
+            self.published += 1
+            self._prune()
+            self._cond.notify_all()
+
+    def latest(self, topic: str):
+        with self._cond:
+            state = self._topics.get(topic)
+            return dict(state["data"]) if state and state["data"] is not None else None
+
+    def stream(self, topic: str, last_seq: int = 0):
+        """
+        Generator of SSE frames for `topic`, starting after `last_seq`
+        (the Last-Event-ID of a reconnecting EventSource).
+        """
+        with self._cond:
+            self.subscribers += 1
+        try:
+            yield "retry: 2000\n\n"
+            seen = last_seq
+            while True:
+                with self._cond:
+                    self._cond.wait_for(
+                        lambda: self._topics.get(topic, {}).get("seq", 0) > seen,
+                        timeout=self.heartbeat,
+                    )
+                    state = self._topics.get(topic)
+                    if not state or state["seq"] <= seen:
+                        changed = False
+                    else:
+                        changed = True
+                        seen, data, final = state["seq"], state["data"], state["final"]
+                if not changed:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                with self._cond:
+                    self.delivered += 1
+                yield f"id: {seen}\nevent: {'done' if final else 'progress'}\ndata: {json.dumps(data, default=str)}\n\n"
+                if final:
+                    return
+                # Updates published meanwhile collapse into the next event
+                time.sleep(self.min_interval)
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def _prune(self):
+        """Forget topics not updated for `retention` seconds (lock held)."""
+        cutoff = time.time() - self.retention
+        for topic in [t for t, s in self._topics.items() if s["updated"] < cutoff]:
+            del self._topics[topic]
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "topics": len(self._topics),
+                "subscribers": self.subscribers,
+                "published": self.published,
+                "delivered": self.delivered,
+                "min_interval_ms": round(self.min_interval * 1000),
+            }
@@ -0,0 +1,270 @@
+"""
+Analysis Result Cache
+Content-addressed cache in front of /api/analyze. The key is a SHA-256 of the
+decoded pixels, the request metadata that changes the output and the brain
+identity (brain_id + published head version, bumped on every publish), so feedback
+or training automatically invalidates older entries.
+
+Two tiers:
+  - memory  LRU of recent entries, bounded by HG_RESULT_CACHE_MEMORY_MB
+  - disk    one directory per entry under HG_RESULT_CACHE_DIR, LRU by last
+            access and bounded by HG_RESULT_CACHE_DISK_MB; survives restarts
+
+An entry is the JSON payload needed to rebuild the response plus the raw
+bytes of its artifacts (heatmaps, original scan, PDF report). Entries may
+carry a TTL (analyses that are missing an LLM answer); an expired entry is
+a miss and is dropped.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+ENTRY_FILE = "entry.json"
+
+
+class AnalysisResultCache:
+    """Two-tier (memory + disk) LRU cache of finished analyses."""
+
+    def __init__(self, cache_dir: str, memory_bytes: int, disk_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.enabled = enabled
+
+        self._memory = OrderedDict()  # key -> (entry, size)
+        self._memory_used = 0
+        self._disk = OrderedDict()    # key -> size, least recently used first
+        self._disk_used = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+        self._hit_ms = []
+
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(image_hash: str, metadata: dict, brain: tuple) -> str:
+        """
+        SHA-256 over the pixel digest (feature_store.image_digest), the
+        output-relevant metadata and the brain identity.
+        """
+        h = hashlib.sha256()
+        h.update(image_hash.encode())
+        h.update(json.dumps(metadata, sort_keys=True, default=str).encode())
+        h.update(json.dumps(list(brain)).encode())
+        return h.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _scan_disk(self):
+        """Rebuild the disk index (oldest access first) from a previous run."""
+        found = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                entry_file = os.path.join(entry_dir, ENTRY_FILE)
+                if not os.path.isfile(entry_file):
+                    # Incomplete write from a crash
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    continue
+                size = sum(
+                    os.path.getsize(os.path.join(root, f))
+                    for root, _, files in os.walk(entry_dir) for f in files
+                )
+                found.append((os.path.getmtime(entry_file), key, size))
+        for _, key, size in sorted(found):
+            self._disk[key] = size
+            self._disk_used += size
+        if found:
+            print(f"[HealthGuard AI] 🗂️ Result cache: {len(found)} entries on disk "
+                  f"({self._disk_used / (1024 * 1024):.1f} MB)")
+        self._evict_disk()
+
+    def get(self, key: str):
+        """Cached entry {"payload", "artifacts"} or None."""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and _expired(item[0]):
+                self._drop(key)
+                item = None
+            if item is not None:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.memory_hits += 1
+                self._record_hit(start)
+                return item[0]
+            on_disk = key in self._disk
+
+        if on_disk:
+            entry = self._read_disk(key)
+            if entry is not None and _expired(entry):
+                with self._lock:
+                    self._drop(key)
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+                    self._record_hit(start)
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, payload: dict, artifacts: dict, ttl: float = None):
+        """
+        Store a finished analysis. `artifacts` maps a relative path such as
+        "results/heatmap_x.png" or "reports/report_x.pdf" to its bytes.
+        With `ttl` (seconds) the entry expires after that time.
+        """
+        if not self.enabled:
+            return
+        entry = {"payload": payload, "artifacts": artifacts,
+                 "expires_at": time.time() + ttl if ttl is not None else None}
+        try:
+            size = self._write_disk(key, entry)
+        except Exception as e:
+            print(f"[HealthGuard AI] ⚠️ Result cache write failed: {e}")
+            return
+        with self._lock:
+            self._disk_used += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._remember(key, entry)
+            self.stores += 1
+            self._evict_disk()
+
+    def _remember(self, key: str, entry: dict):
+        """Insert into the memory tier and evict LRU entries over budget (lock held)."""
+        size = _entry_size(entry)
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        self._memory[key] = (entry, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_used -= evicted_size
+
+    def _drop(self, key: str):
+        """Remove an expired entry from both tiers (lock held)."""
+        self.expired += 1
+        item = self._memory.pop(key, None)
+        if item is not None:
+            self._memory_used -= item[1]
+        if key in self._disk:
+            self._disk_used -= self._disk.pop(key)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict_disk(self):
+        """Drop least recently used entries until the disk tier fits its budget."""
+        while self._disk_used > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self.evictions += 1
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _write_disk(self, key: str, entry: dict) -> int:
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir + f".tmp{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        size = 0
+        for rel_path, data in entry["artifacts"].items():
+            path = os.path.join(tmp_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            size += len(data)
+        manifest = json.dumps({"payload": entry["payload"], "artifacts": list(entry["artifacts"]),
+                               "expires_at": entry["expires_at"]})
+        # entry.json is written last: its presence marks a complete entry
+        with open(os.path.join(tmp_dir, ENTRY_FILE), "w") as f:
+            f.write(manifest)
+        size += len(manifest)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        return size
+
+    def _read_disk(self, key: str):
+        entry_dir = self._entry_dir(key)
+        try:
+            entry_file = os.path.join(entry_dir, ENTRY_FILE)
+            with open(entry_file) as f:
+                manifest = json.load(f)
+            artifacts = {}
+            for rel_path in manifest["artifacts"]:
+                with open(os.path.join(entry_dir, rel_path), "rb") as f:
+                    artifacts[rel_path] = f.read()
+            os.utime(entry_file)  # last access, for LRU order after a restart
+            return {"payload": manifest["payload"], "artifacts": artifacts,
+                    "expires_at": manifest.get("expires_at")}
+        except Exception as e:
+            print(f"[HealthGuard AI] ⚠️ Dropping unreadable result cache entry {key[:12]}: {e}")
+            with self._lock:
+                self._disk_used -= self._disk.pop(key, 0)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+    def _record_hit(self, start: float):
+        self._hit_ms.append((time.perf_counter() - start) * 1000)
+        del self._hit_ms[:-1000]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            hit_ms = sorted(self._hit_ms)
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._memory),
+                "memory_mb": round(self._memory_used / (1024 * 1024), 2),
+                "memory_limit_mb": round(self.memory_bytes / (1024 * 1024), 2),
+                "disk_entries": len(self._disk),
+                "disk_mb": round(self._disk_used / (1024 * 1024), 2),
+                "disk_limit_mb": round(self.disk_bytes / (1024 * 1024), 2),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "hit_lookup_ms_p50": round(hit_ms[len(hit_ms) // 2], 2) if hit_ms else None,
+            }
+
+
+def _expired(entry: dict) -> bool:
+    return entry.get("expires_at") is not None and time.time() >= entry["expires_at"]
+
+
+def _entry_size(entry: dict) -> int:
+    return sum(len(data) for data in entry["artifacts"].values()) + \
+        len(json.dumps(entry["payload"], default=str))
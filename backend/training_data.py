@@ -0,0 +1,543 @@
+"""
+Training Data Pipeline
+Dataset discovery and the torch Dataset/DataLoader pipeline used by
+MedicalImageAnalyzer.train_on_dataset:
+  - discover_labeled_images  label discovery (subfolders, single label, CSV)
+                             for a folder, discover_archive_images for an
+                             uploaded ZIP/TAR (ArchiveSource)
+  - ScanDataset              decodes + resizes scans to uint8 tensors in
+                             DataLoader worker processes, from files or
+                             straight out of an archive (no extraction)
+  - augment_batch            train_transform-equivalent augmentation applied
+                             to a whole batch of tensors (crop, flip, rotation,
+                             brightness/contrast jitter)
+  - ThroughputMeter          decode vs compute images/s for /api/train/status
+
+Loader settings come from HG_TRAIN_WORKERS, HG_TRAIN_PREFETCH and
+HG_TRAIN_PIN_MEMORY. Workers are forked only from a single-threaded
+process (scripts, benchmarks); inside the server, which already runs the
+batcher / feedback / checkpoint / LLM threads, decoding defaults to
+in-process and explicitly requested workers are started from a fork server.
+"""
+
+import io
+import os
+import csv
+import glob
+import math
+import mmap
+import time
+import zlib
+import struct
+import tarfile
+import zipfile
+import threading
+import multiprocessing
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset, IterableDataset, DataLoader, get_worker_info
+from PIL import Image
+
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp', '.dcm'}
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def discover_labeled_images(dataset_dir: str, finding_label: str = ""):
+    """
+    Collect (image paths, {path: label}) from a dataset folder:
+    subfolder names as labels, or one label for every image, plus labels
+    from the first CSV file in the folder (image/file/path + label/finding/
+    class/diagnosis/category columns).
+    """
+    all_images = []
+    label_map = {}  # maps image path -> finding label
+
+    # Check if dataset has subfolders (each subfolder = a label)
+    subdirs = [d for d in os.listdir(dataset_dir)
+               if os.path.isdir(os.path.join(dataset_dir, d))
+               and not d.startswith('.')]
+
+    if subdirs and not finding_label:
+        # Use subfolder names as labels
+        for subdir in subdirs:
+            subdir_path = os.path.join(dataset_dir, subdir)
+            for f in os.listdir(subdir_path):
+                ext = os.path.splitext(f)[1].lower()
+                if ext in IMAGE_EXTS:
+                    fpath = os.path.join(subdir_path, f)
+                    all_images.append(fpath)
+                    label_map[fpath] = subdir
+    else:
+        # All images get the same label
+        label = finding_label if finding_label else "Dataset Finding"
+        for root, dirs, files in os.walk(dataset_dir):
+            for f in files:
+                ext = os.path.splitext(f)[1].lower()
+                if ext in IMAGE_EXTS:
+                    fpath = os.path.join(root, f)
+                    all_images.append(fpath)
+                    label_map[fpath] = label
+
+    # Also check for CSV label files
+    csv_files = glob.glob(os.path.join(dataset_dir, "*.csv"))
+    if csv_files:
+        try:
+            with open(csv_files[0], 'r', encoding='utf-8', errors='ignore') as cf:
+                for img_name, lbl in _csv_labels(cf):
+                    # Try to find the image file
+                    possible_paths = [
+                        os.path.join(dataset_dir, img_name),
+                        os.path.join(dataset_dir, 'images', img_name),
+                    ]
+                    for pp in possible_paths:
+                        if os.path.exists(pp):
+                            if pp not in label_map:
+                                all_images.append(pp)
+                            label_map[pp] = lbl
+                            break
+
+            print(f"[HealthGuard AI] CSV labels loaded from {csv_files[0]}")
+        except Exception as e:
+            print(f"[HealthGuard AI] CSV parsing warning: {e}")
+
+    return all_images, label_map
+
+
+def _csv_labels(cf):
+    """(image name, label) rows of a label CSV (image/file/path + label/finding/class/... columns)."""
+    reader = csv.DictReader(cf)
+
+    # Try to find image and label columns
+    img_col = None
+    label_col = None
+    for h in reader.fieldnames or []:
+        hl = h.lower()
+        if any(k in hl for k in ['image', 'file', 'path', 'filename']):
+            img_col = h
+        if any(k in hl for k in ['label', 'finding', 'class', 'diagnosis', 'category']):
+            label_col = h
+
+    if not (img_col and label_col):
+        return []
+    rows = []
+    for row in reader:
+        img_name = row.get(img_col, '')
+        lbl = row.get(label_col, '')
+        if img_name and lbl:
+            rows.append((img_name, lbl))
+    return rows
+
+
+def discover_archive_images(source: "ArchiveSource", finding_label: str = ""):
+    """
+    discover_labeled_images for archive members: (member names, {name: label}).
+    A single top-level folder is skipped, like the extracted-folder case.
+    """
+    names = source.names()
+    name_set = set(names)
+
+    # Kaggle archives often wrap everything in one top-level folder
+    root = ""
+    tops = {n.split("/", 1)[0] for n in names}
+    if len(tops) == 1 and all("/" in n for n in names):
+        root = tops.pop() + "/"
+    relative = [(n, n[len(root):]) for n in names if n.startswith(root)]
+
+    all_images = []
+    label_map = {}
+    subdirs = {r.split("/", 1)[0] for _, r in relative if "/" in r and not r.startswith(".")}
+
+    if subdirs and not finding_label:
+        # Use subfolder names as labels (images directly inside each subfolder)
+        for name, rel in relative:
+            parts = rel.split("/")
+            if len(parts) == 2 and parts[0] in subdirs \
+                    and os.path.splitext(parts[1])[1].lower() in IMAGE_EXTS:
+                all_images.append(name)
+                label_map[name] = parts[0]
+    else:
+        # All images get the same label
+        label = finding_label if finding_label else "Dataset Finding"
+        for name, rel in relative:
+            if os.path.splitext(rel)[1].lower() in IMAGE_EXTS:
+                all_images.append(name)
+                label_map[name] = label
+
+    # CSV label files at the dataset root
+    csv_members = sorted(n for n, r in relative if "/" not in r and r.lower().endswith(".csv"))
+    if csv_members:
+        try:
+            text = source.read(csv_members[0]).decode("utf-8", errors="ignore")
+            for img_name, lbl in _csv_labels(io.StringIO(text)):
+                for candidate in (root + img_name, root + "images/" + img_name):
+                    if candidate in name_set:
+                        if candidate not in label_map:
+                            all_images.append(candidate)
+                        label_map[candidate] = lbl
+                        break
+            print(f"[HealthGuard AI] CSV labels loaded from {csv_members[0]}")
+        except Exception as e:
+            print(f"[HealthGuard AI] CSV parsing warning: {e}")
+
+    return all_images, label_map
+
+
+# ZIP local file header: signature ... filename length, extra field length
+_ZIP_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+
+class ArchiveSource:
+    """
+    Random-access view of an uploaded ZIP or TAR, indexed once (member name ->
+    offset/size). ZIP and uncompressed TAR members are read from a memory map
+    of the archive; compressed TARs (.tar.gz etc.) can only be streamed and
+    are read sequentially by ArchiveStreamDataset. Picklable: every DataLoader
+    worker re-opens its own map.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.members = {}  # name -> zip: (header offset, compress type, compressed size, encrypted)
+                           #         tar: (data offset, size)
+        self.uncompressed_bytes = 0
+        self.streaming = False
+        self._map = None
+        self._zip = None
+        self._pid = None
+
+        start = time.perf_counter()
+        if zipfile.is_zipfile(path):
+            self.kind = "zip"
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if info.is_dir():
+                        continue
+                    self.members[info.filename] = (
+                        info.header_offset, info.compress_type, info.compress_size,
+                        bool(info.flag_bits & 0x1),
+                    )
+                    self.uncompressed_bytes += info.file_size
+        elif tarfile.is_tarfile(path):
+            self.kind = "tar"
+            self._csv_cache = {}
+            try:
+                tf = tarfile.open(path, "r:")
+            except tarfile.ReadError:
+                tf = tarfile.open(path, "r:*")
+                self.streaming = True  # compressed: no random access
+            with tf:
+                for member in tf:
+                    if not member.isfile():
+                        continue
+                    self.members[member.name] = (member.offset_data, member.size)
+                    self.uncompressed_bytes += member.size
+                    if self.streaming and member.name.lower().endswith(".csv"):
+                        # Label CSVs are needed before the (sequential) read pass
+                        self._csv_cache[member.name] = tf.extractfile(member).read()
+        else:
+            raise ValueError(f"{os.path.basename(path)} is not a ZIP or TAR archive")
+        self.index_seconds = time.perf_counter() - start
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_map"] = state["_zip"] = state["_pid"] = None
+        return state
+
+    def names(self) -> list:
+        return list(self.members)
+
+    def _mapped(self):
+        """Memory map of the archive, opened once per process."""
+        if self._pid != os.getpid():
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._zip = None
+            self._pid = os.getpid()
+        return self._map
+
+    def read(self, name: str) -> bytes:
+        """Raw bytes of one member (random access; not for streaming TARs)."""
+        if self.kind == "tar":
+            if self.streaming:
+                return self._csv_cache[name]
+            offset, size = self.members[name]
+            return self._mapped()[offset:offset + size]
+
+        header_offset, compress_type, compress_size, encrypted = self.members[name]
+        mm = self._mapped()
+        if not encrypted and compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            header = _ZIP_LOCAL_HEADER.unpack_from(mm, header_offset)
+            start = header_offset + _ZIP_LOCAL_HEADER.size + header[10] + header[11]
+            data = mm[start:start + compress_size]
+            if compress_type == zipfile.ZIP_DEFLATED:
+                data = zlib.decompress(data, -15)
+            return data
+        # bzip2 / lzma / encrypted members go through zipfile
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        return self._zip.read(name)
+
+
+class ScanDataset(Dataset):
+    """
+    Decodes one scan per item into uint8 CHW tensors:
+      - plain: resized to plain_size (what the inference transform sees)
+      - base:  resized to base_size, the input of augment_batch
+    Either can be disabled. Unreadable files yield None (dropped by collate).
+    With a `source` (ArchiveSource), paths are archive member names.
+    """
+
+    def __init__(self, paths: list, labels: list, plain_size: int = 224,
+                 base_size: int = 256, plain: bool = True, base: bool = False,
+                 source: ArchiveSource = None):
+        self.paths = paths
+        self.labels = labels
+        self.plain_size = plain_size
+        self.base_size = base_size
+        self.plain = plain
+        self.base = base
+        self.source = source
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        start = time.perf_counter()
+        path = self.paths[index]
+        if self.source is not None:
+            try:
+                return self._decode(path, io.BytesIO(self.source.read(path)), self.labels[index], start)
+            except Exception as e:
+                print(f"[HealthGuard AI] Skipping {path}: {e}")
+                return None
+        return self._decode(path, path, self.labels[index], start)
+
+    def _decode(self, name, fp, label, start):
+        try:
+            img = Image.open(fp)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            plain = _to_uint8_tensor(img, self.plain_size) if self.plain else None
+            base = _to_uint8_tensor(img, self.base_size) if self.base else None
+        except Exception as e:
+            print(f"[HealthGuard AI] Skipping {name}: {e}")
+            return None
+        return plain, base, label, time.perf_counter() - start
+
+
+class ArchiveStreamDataset(IterableDataset):
+    """
+    Sequential reader for compressed TARs: every worker streams the archive
+    and decodes its share (every num_workers-th wanted member), in archive
+    order.
+    """
+
+    def __init__(self, source: ArchiveSource, names: list, labels: list, **kwargs):
+        self.source = source
+        self.wanted = dict(zip(names, labels))
+        self.decoder = ScanDataset([], [], **kwargs)
+
+    def __len__(self):
+        return len(self.wanted)
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker_id, num_workers = (info.id, info.num_workers) if info else (0, 1)
+        seen = 0
+        with tarfile.open(self.source.path, "r|*") as tf:
+            for member in tf:
+                label = self.wanted.get(member.name)
+                if label is None:
+                    continue
+                seen += 1
+                if (seen - 1) % num_workers != worker_id:
+                    continue
+                start = time.perf_counter()
+                data = tf.extractfile(member).read()
+                yield self.decoder._decode(member.name, io.BytesIO(data), label, start)
+
+
+def make_scan_dataset(paths: list, labels: list, source: ArchiveSource = None, **kwargs):
+    """ScanDataset over files or archive members (streaming for compressed TARs)."""
+    if source is not None and source.streaming:
+        return ArchiveStreamDataset(source, paths, labels, **kwargs)
+    return ScanDataset(paths, labels, source=source, **kwargs)
+
+
+def _to_uint8_tensor(img: Image.Image, size: int) -> torch.Tensor:
+    # Same bilinear PIL resize torchvision's Resize((size, size)) uses on PIL images
+    resized = img.resize((size, size), Image.BILINEAR)
+    return torch.from_numpy(np.asarray(resized).copy()).permute(2, 0, 1)
+
+
+def collate_scans(items: list) -> dict:
+    """Stack decoded items; dropped (None) items are counted as failed."""
+    ok = [item for item in items if item is not None]
+    batch = {
+        "plain": None,
+        "base": None,
+        "labels": torch.tensor([item[2] for item in ok], dtype=torch.long),
+        "decode_seconds": sum(item[3] for item in ok),
+        "failed": len(items) - len(ok),
+    }
+    if ok and ok[0][0] is not None:
+        batch["plain"] = torch.stack([item[0] for item in ok])
+    if ok and ok[0][1] is not None:
+        batch["base"] = torch.stack([item[1] for item in ok])
+    return batch
+
+
+def normalize_batch(batch: torch.Tensor) -> torch.Tensor:
+    """uint8 (or [0, 1] float) NCHW -> ImageNet-normalized float (ToTensor + Normalize)."""
+    if batch.dtype == torch.uint8:
+        batch = batch.float().div_(255)
+    mean = torch.tensor(IMAGENET_MEAN, device=batch.device).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=batch.device).view(1, 3, 1, 1)
+    return (batch - mean) / std
+
+
+def augment_batch(batch: torch.Tensor, crop: int = 224, max_degrees: float = 15.0,
+                  brightness: float = 0.2, contrast: float = 0.2) -> torch.Tensor:
+    """
+    Batched equivalent of the analyzer's train_transform on a uint8 NCHW batch
+    (already resized to 256): per-image random crop, horizontal flip, rotation
+    and brightness/contrast jitter. Returns a normalized float batch.
+    """
+    n, _, h, w = batch.shape
+    x = batch.float().div_(255)
+
+    # RandomCrop
+    tops = torch.randint(0, h - crop + 1, (n,)).tolist()
+    lefts = torch.randint(0, w - crop + 1, (n,)).tolist()
+    x = torch.stack([x[i, :, t:t + crop, l:l + crop] for i, (t, l) in enumerate(zip(tops, lefts))])
+
+    # RandomHorizontalFlip
+    flip = torch.rand(n, device=x.device) < 0.5
+    x = torch.where(flip.view(n, 1, 1, 1), x.flip(-1), x)
+
+    # RandomRotation (zero fill, like torchvision's default)
+    angles = (torch.rand(n, device=x.device) * 2 - 1) * math.radians(max_degrees)
+    cos, sin = torch.cos(angles), torch.sin(angles)
+    theta = torch.zeros(n, 2, 3, device=x.device)
+    theta[:, 0, 0], theta[:, 0, 1] = cos, -sin
+    theta[:, 1, 0], theta[:, 1, 1] = sin, cos
+    grid = F.affine_grid(theta, x.shape, align_corners=False)
+    x = F.grid_sample(x, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+    # ColorJitter(brightness, contrast)
+    b = 1 + (torch.rand(n, 1, 1, 1, device=x.device) * 2 - 1) * brightness
+    x = (x * b).clamp_(0, 1)
+    c = 1 + (torch.rand(n, 1, 1, 1, device=x.device) * 2 - 1) * contrast
+    gray = (0.299 * x[:, 0] + 0.587 * x[:, 1] + 0.114 * x[:, 2]).mean(dim=(1, 2)).view(n, 1, 1, 1)
+    x = ((x - gray) * c + gray).clamp_(0, 1)
+
+    return normalize_batch(x)
+
+
+def _can_fork() -> bool:
+    """fork is available and safe: no other thread could be holding a lock the child inherits."""
+    return "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1
+
+
+def loader_settings(device: torch.device) -> dict:
+    """DataLoader settings from the environment."""
+    # Cheap worker processes need fork, and forking a multi-threaded process
+    # (the server) can deadlock the children; spawn / forkserver workers
+    # re-import the main module (and load the models again), so default to
+    # in-process decoding unless fork is safe
+    default_workers = min(4, os.cpu_count() or 1) if _can_fork() else 0
+    return {
+        "workers": max(0, int(os.getenv("HG_TRAIN_WORKERS", str(default_workers)))),
+        "prefetch": max(1, int(os.getenv("HG_TRAIN_PREFETCH", "2"))),
+        "pin_memory": os.getenv("HG_TRAIN_PIN_MEMORY", "1" if device.type == "cuda" else "0") == "1",
+    }
+
+
+def make_loader(dataset: ScanDataset, batch_size: int, settings: dict, shuffle: bool = False) -> DataLoader:
+    workers = settings["workers"]
+    kwargs = {}
+    if workers > 0:
+        kwargs["prefetch_factor"] = settings["prefetch"]
+        if _can_fork():
+            kwargs["multiprocessing_context"] = "fork"
+        else:
+            kwargs["multiprocessing_context"] = _worker_context()
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle and not isinstance(dataset, IterableDataset),
+        num_workers=workers,
+        pin_memory=settings["pin_memory"],
+        collate_fn=collate_scans,
+        **kwargs,
+    )
+
+
+_warned_context = False
+
+
+def _worker_context():
+    """Start context for loader workers of a multi-threaded process (never fork)."""
+    global _warned_context
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["backend.training_data"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    if not _warned_context:
+        _warned_context = True
+        print(f"[HealthGuard AI] ⚠️ HG_TRAIN_WORKERS > 0 in a multi-threaded process: loader workers use "
+              f"{context.get_start_method()} and re-import the main module (set HG_TRAIN_WORKERS=0 "
+              f"to decode in-process)")
+    return context
+
+
+class ThroughputMeter:
+    """Decode (loader workers) vs compute (backbone + head) throughput."""
+
+    def __init__(self, workers: int, started: float = None):
+        self.workers = workers
+        self.images = 0
+        self.decode_seconds = 0.0   # summed over worker processes
+        self.compute_seconds = 0.0
+        self.wait_seconds = 0.0     # training loop blocked on the loader
+        # time.perf_counter() origin of first_batch_seconds (e.g. when the upload arrived)
+        self.started = started if started is not None else time.perf_counter()
+        self.first_batch_seconds = None
+        self._first_batch_at = None
+
+    def batch_loaded(self, batch: dict, waited: float):
+        self.images += len(batch["labels"])
+        self.decode_seconds += batch["decode_seconds"]
+        self.wait_seconds += waited
+        if self.first_batch_seconds is None:
+            self._first_batch_at = time.perf_counter()
+            self.first_batch_seconds = self._first_batch_at - self.started
+
+    def computed(self, seconds: float):
+        self.compute_seconds += seconds
+
+    def snapshot(self) -> dict:
+        parallel = max(self.workers, 1)
+        decode_rate = self.images / (self.decode_seconds / parallel) if self.decode_seconds else None
+        compute_rate = self.images / self.compute_seconds if self.compute_seconds else None
+        bottleneck = None
+        if decode_rate and compute_rate:
+            bottleneck = "decode" if decode_rate < compute_rate else "compute"
+        elapsed = time.perf_counter() - self._first_batch_at if self._first_batch_at else 0
+        return {
+            "images": self.images,
+            "images_per_second": round(self.images / elapsed, 1) if elapsed else None,
+            "workers": self.workers,
+            "decode_images_per_second": round(decode_rate, 1) if decode_rate else None,
+            "compute_images_per_second": round(compute_rate, 1) if compute_rate else None,
+            "loader_wait_seconds": round(self.wait_seconds, 2),
+            "first_batch_seconds": round(self.first_batch_seconds, 2) if self.first_batch_seconds else None,
+            "bottleneck": bottleneck,
+        }
@@ -0,0 +1,279 @@
+"""
+Training Job Manager
+Runs dataset training in the background instead of inside the /api/train
+request. Jobs are keyed by id and go through
+queued -> running -> completed | failed | cancelled.
+
+  - submit / get / cancel / list
+  - bounded worker pool (HG_TRAIN_JOB_WORKERS) fed by a bounded queue
+    (HG_TRAIN_MAX_QUEUED)
+  - one JSON record per job under HG_TRAIN_JOBS_DIR, rewritten atomically on
+    every state change; jobs that were queued or running when the server
+    stopped are queued again on startup if their dataset is still on disk
+  - every state change and progress update is published to a ProgressBroker
+    (topic "train:<job_id>") for the SSE endpoint
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import threading
+
+
+ACTIVE = ("queued", "running")
+FINISHED = ("completed", "failed", "cancelled")
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when HG_TRAIN_MAX_QUEUED jobs are already waiting."""
+
+
+class TrainingJobManager:
+    """
+    Background training jobs. `run_job(job, progress_callback, cancel_flag)`
+    does the actual work and returns the result dict; `job["params"]` holds
+    whatever was passed to submit().
+    """
+
+    def __init__(self, jobs_dir: str, run_job, workers: int = 1,
+                 max_queued: int = 8, history: int = 50, events=None):
+        self.jobs_dir = jobs_dir
+        self.run_job = run_job
+        self.events = events  # ProgressBroker or None
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.history = max(1, history)
+
+        self._jobs = {}      # id -> record
+        self._cancel = {}    # id -> {"cancel": bool}, the cancel_flag given to run_job
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._restore()
+
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"hg-train-{i}", daemon=True).start()
+
+    # ---------- Persistence ----------
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _persist(self, job: dict):
+        path = self._path(job["id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f, default=str)
+        os.replace(tmp, path)
+        self._publish(job)
+
+    def _publish(self, job: dict):
+        """Push the job's current state to SSE subscribers (lock held)."""
+        if self.events is not None:
+            self.events.publish(f"train:{job['id']}", self._view(job), final=job["status"] in FINISHED)
+
+    def _restore(self):
+        """Load job records from a previous run and queue unfinished jobs again."""
+        records = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name)) as f:
+                    records.append(json.load(f))
+            except Exception as e:
+                print(f"[HealthGuard AI] ⚠️ Skipping unreadable training job record {name}: {e}")
+
+        requeued = 0
+        for job in sorted(records, key=lambda j: j.get("created_at", 0)):
+            self._jobs[job["id"]] = job
+            if job["status"] not in ACTIVE:
+                continue
+            if os.path.exists(job["params"].get("dataset_path", "")):
+                job.update(status="queued", progress=0, started_at=None,
+                           message="Queued again after a server restart")
+                self._cancel[job["id"]] = {"cancel": False}
+                self._queue.put(job["id"])
+                requeued += 1
+            else:
+                job.update(status="failed", finished_at=time.time(),
+                           error="Dataset no longer available after a server restart")
+            self._persist(job)
+        if records:
+            print(f"[HealthGuard AI] 🗂️ Training jobs: {len(records)} records, {requeued} re-queued")
+
+    def _prune(self):
+        """Keep the newest `history` finished jobs (lock held)."""
+        finished = sorted((j for j in self._jobs.values() if j["status"] in FINISHED),
+                          key=lambda j: j.get("finished_at") or 0)
+        for job in finished[:-self.history]:
+            self._jobs.pop(job["id"], None)
+            try:
+                os.remove(self._path(job["id"]))
+            except OSError:
+                pass
+
+    # ---------- API ----------
+
+    def submit(self, params: dict, cleanup_dir: str = None) -> dict:
+        """
+        Queue a training job. `cleanup_dir` (the uploaded dataset) is deleted
+        when the job finishes. Raises QueueFullError when the queue is full.
+        """
+        with self._lock:
+            waiting = sum(1 for j in self._jobs.values() if j["status"] == "queued")
+            if waiting >= self.max_queued:
+                raise QueueFullError(f"{waiting} training jobs are already queued")
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "progress": 0,
+                "message": "Queued",
+                "throughput": None,
+                "event": None,  # phase, epoch, image index, running loss, images/s
+                "result": None,
+                "error": None,
+                "params": params,
+                "cleanup_dir": cleanup_dir,
+            }
+            self._jobs[job["id"]] = job
+            self._cancel[job["id"]] = {"cancel": False}
+            self._persist(job)
+            view = self._view(job)
+        print(f"[HealthGuard AI] Training job {job['id']} queued (position {view['queue_position']})")
+        self._queue.put(job["id"])
+        return view
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def list(self) -> list:
+        """All known jobs, newest first."""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda j: j["created_at"], reverse=True)
+            return [self._view(j) for j in jobs]
+
+    def latest(self):
+        """The running job, else the next queued one, else the most recent one."""
+        with self._lock:
+            for status in ("running", "queued"):
+                jobs = [j for j in self._jobs.values() if j["status"] == status]
+                if jobs:
+                    return self._view(min(jobs, key=lambda j: j["created_at"]))
+            if not self._jobs:
+                return None
+            return self._view(max(self._jobs.values(), key=lambda j: j["created_at"]))
+
+    def cancel(self, job_id: str):
+        """Cancel a queued job now, or ask a running one to stop. Returns the job or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                job.update(status="cancelled", finished_at=time.time(), message="Cancelled before start")
+                self._persist(job)
+                self._cleanup(job)
+            elif job["status"] == "running":
+                self._cancel[job_id]["cancel"] = True
+                job["message"] = "Cancelling..."
+                self._publish(job)
+            return self._view(job)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"workers": self.workers, "max_queued": self.max_queued, "jobs": counts}
+
+    def _view(self, job: dict) -> dict:
+        """Public copy of a record (lock held)."""
+        view = {k: v for k, v in job.items() if k not in ("params", "cleanup_dir")}
+        view["is_training"] = job["status"] == "running"
+        view["queue_position"] = None
+        if job["status"] == "queued":
+            view["queue_position"] = 1 + sum(
+                1 for j in self._jobs.values()
+                if j["status"] == "queued" and j["created_at"] < job["created_at"]
+            )
+        params = job["params"]
+        view["dataset"] = {k: params.get(k) for k in ("filename", "description", "finding_label", "epochs")}
+        return view
+
+    # ---------- Workers ----------
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue  # cancelled while waiting
+                job.update(status="running", started_at=time.time(), message="Preparing dataset...")
+                self._persist(job)
+                cancel_flag = self._cancel[job_id]
+            self._run(job, cancel_flag)
+
+    def _run(self, job: dict, cancel_flag: dict):
+        last_persist = [0.0]
+
+        def progress_callback(pct, msg, stats=None, event=None):
+            with self._lock:
+                job["progress"] = pct
+                job["message"] = msg
+                if stats is not None:
+                    job["throughput"] = stats
+                if event is not None:
+                    job["event"] = event
+                if time.time() - last_persist[0] > 2.0:
+                    last_persist[0] = time.time()
+                    self._persist(job)
+                else:
+                    self._publish(job)
+
+        print(f"[HealthGuard AI] ▶️ Training job {job['id']} started")
+        try:
+            result = self.run_job(job, progress_callback, cancel_flag)
+            if cancel_flag.get("cancel"):
+                status, message = "cancelled", "Training cancelled"
+            elif result.get("success"):
+                status, message = "completed", "Training complete!"
+            else:
+                status, message = "failed", result.get("message", "Training failed")
+            update = {"status": status, "message": message, "result": result}
+            if status == "completed":
+                update["progress"] = 100
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            update = {"status": "failed", "progress": 0, "message": f"Training failed: {e}", "error": str(e)}
+
+        with self._lock:
+            job.update(update, finished_at=time.time())
+            self._persist(job)
+            self._cleanup(job)
+            self._cancel.pop(job["id"], None)
+            self._prune()
+        print(f"[HealthGuard AI] Training job {job['id']} {job['status']}")
+
+    def _cleanup(self, job: dict):
+        """Delete the uploaded dataset of a finished job."""
+        path = job.get("cleanup_dir")
+        if not path or not os.path.exists(path):
+            return
+        try:
+            shutil.rmtree(path)
+            print(f"[HealthGuard AI] 🚮 CLEANUP: Deleted temporary training folder")
+            print(f"                 Path: {path}")
+        except Exception as cleanup_error:
+            print(f"[HealthGuard AI] Warning: Could not delete temp dir {path}: {cleanup_error}")
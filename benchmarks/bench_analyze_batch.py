@@ -0,0 +1,91 @@
+"""
+Benchmark: batched scan analysis
+Compares images/second of the per-image analyze() loop (what /api/analyze-batch
+used to do) against the tensor-batched MedicalImageAnalyzer.analyze_batch().
+LLM provider keys are removed from the environment so only the local
+DenseNet-121 + Hi-Res CAM pipeline is measured.
+
+Usage:
+    python benchmarks/bench_analyze_batch.py --images 32 --chunk-size 16
+    python benchmarks/bench_analyze_batch.py --folder path/to/scans
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp'}
+
+
+def load_images(folder: str, count: int) -> list:
+    """Load up to `count` images from a folder, or generate synthetic scans."""
+    if folder:
+        paths = sorted(
+            os.path.join(folder, f) for f in os.listdir(folder)
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTS
+        )[:count]
+        return [Image.open(p).convert("RGB") for p in paths]
+
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 255, (512, 512, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=32, help="Number of images to analyze")
+    parser.add_argument("--chunk-size", type=int, default=16, help="analyze_batch chunk size")
+    parser.add_argument("--folder", default="", help="Optional folder of real scans")
+    args = parser.parse_args()
+
+    # Local pipeline only — never call external LLM providers from a benchmark
+    for key in list(os.environ):
+        if key.startswith(("GROQ_API_KEY", "CLAUDE_API_KEY")):
+            del os.environ[key]
+
+    from backend.analyzer import MedicalImageAnalyzer
+
+    analyzer = MedicalImageAnalyzer()
+    images = load_images(args.folder, args.images)
+    n = len(images)
+    print(f"\nBenchmarking {n} images (chunk size {args.chunk_size}) on {analyzer.device}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dirs = []
+        for i in range(n):
+            d = os.path.join(tmp, f"scan_{i}")
+            os.makedirs(d)
+            out_dirs.append(d)
+
+        # Warm-up
+        analyzer.analyze(images[0], out_dirs[0])
+
+        start = time.perf_counter()
+        for img, out_dir in zip(images, out_dirs):
+            analyzer.analyze(img, out_dir)
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        analyzer.analyze_batch(images, out_dirs, chunk_size=args.chunk_size)
+        batch_s = time.perf_counter() - start
+
+    print("\n" + "-" * 56)
+    print(f"{'Mode':<28}{'Seconds':>12}{'Images/s':>14}")
+    print("-" * 56)
+    print(f"{'analyze() loop':<28}{loop_s:>12.2f}{n / loop_s:>14.2f}")
+    print(f"{'analyze_batch()':<28}{batch_s:>12.2f}{n / batch_s:>14.2f}")
+    print("-" * 56)
+    print(f"Speed-up: {loop_s / batch_s:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark: training from an extracted archive vs straight from the archive
+For a dataset archive (synthetic ZIP / TAR / TAR.GZ, or --archive), measures
+what /api/train does before and during the first pass over the data:
+  - extract  extractall() into a temp dir, discover_labeled_images, ScanDataset
+  - stream   ArchiveSource index, discover_archive_images, members decoded
+             straight from the archive
+and prints time to first batch, time for one full decode pass and the bytes
+written to disk on top of the uploaded archive. The model is not loaded.
+
+Usage:
+    python benchmarks/bench_archive_train.py --images 400 --formats zip tar.gz
+    python benchmarks/bench_archive_train.py --archive path/to/dataset.zip
+    HG_TRAIN_WORKERS=4 python benchmarks/bench_archive_train.py
+"""
+
+import os
+import sys
+import time
+import shutil
+import tarfile
+import zipfile
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.training_data import (
+    discover_labeled_images, discover_archive_images, ArchiveSource,
+    make_scan_dataset, loader_settings, make_loader,
+)
+
+FORMATS = ("zip", "tar", "tar.gz")
+
+
+def write_synthetic_archive(path: str, fmt: str, count: int):
+    """A Kaggle-style archive: one top-level folder with a subfolder per label."""
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as src:
+        for i in range(count):
+            label = "Bench Class A" if i % 2 == 0 else "Bench Class B"
+            os.makedirs(os.path.join(src, "dataset", label), exist_ok=True)
+            arr = rng.integers(0, 255, (320, 320, 3), dtype=np.uint8)
+            Image.fromarray(arr).save(os.path.join(src, "dataset", label, f"img_{i:05d}.png"))
+        if fmt == "zip":
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+                for root, _, files in os.walk(src):
+                    for f in files:
+                        full = os.path.join(root, f)
+                        zf.write(full, os.path.relpath(full, src))
+        else:
+            with tarfile.open(path, "w:gz" if fmt == "tar.gz" else "w") as tf:
+                tf.add(os.path.join(src, "dataset"), "dataset")
+
+
+def first_pass(dataset, batch_size: int, started: float):
+    """(seconds to first batch, seconds for the whole pass) over a training loader."""
+    loader = make_loader(dataset, batch_size, loader_settings(torch.device("cpu")), shuffle=False)
+    first = None
+    for _ in loader:
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+def run_extract(archive: str, batch_size: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        if zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as zf:
+                zf.extractall(tmp)
+        else:
+            with tarfile.open(archive, "r:*") as tf:
+                tf.extractall(tmp)
+        written = sum(os.path.getsize(os.path.join(root, f))
+                      for root, _, files in os.walk(tmp) for f in files)
+        items = os.listdir(tmp)
+        dataset_dir = os.path.join(tmp, items[0]) if len(items) == 1 else tmp
+        images, label_map = discover_labeled_images(dataset_dir)
+        dataset = make_scan_dataset(images, [0] * len(images))
+        first, total = first_pass(dataset, batch_size, started)
+    return {"first_batch": first, "pass": total, "written": written, "images": len(images)}
+
+
+def run_stream(archive: str, batch_size: int) -> dict:
+    started = time.perf_counter()
+    source = ArchiveSource(archive)
+    images, label_map = discover_archive_images(source)
+    dataset = make_scan_dataset(images, [0] * len(images), source=source)
+    first, total = first_pass(dataset, batch_size, started)
+    return {"first_batch": first, "pass": total, "written": 0, "images": len(images)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200, help="Synthetic images (without --archive)")
+    parser.add_argument("--archive", default="", help="Existing ZIP/TAR dataset archive")
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        archives = {}
+        if args.archive:
+            archives[os.path.basename(args.archive)] = args.archive
+        else:
+            for fmt in args.formats:
+                path = os.path.join(tmp, f"bench.{fmt}")
+                print(f"Writing synthetic {fmt} ({args.images} images)...")
+                write_synthetic_archive(path, fmt, args.images)
+                archives[fmt] = path
+
+        print("\n" + "-" * 78)
+        print(f"{'Archive':<12}{'Path':<10}{'Images':>8}{'First batch s':>15}{'Pass s':>10}"
+              f"{'Extra MB written':>19}")
+        print("-" * 78)
+        for name, path in archives.items():
+            for label, run in (("extract", run_extract), ("stream", run_stream)):
+                r = run(path, args.batch_size)
+                print(f"{name:<12}{label:<10}{r['images']:>8}{r['first_batch']:>15.2f}{r['pass']:>10.2f}"
+                      f"{r['written'] / (1024 * 1024):>19.1f}")
+        print("-" * 78)
+        print("Extra MB written: bytes written to disk on top of the uploaded archive.")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: fused forward + Hi-Res CAM
+Compares the old two-pass path (no_grad forward for the probabilities, then a
+pytorch_grad_cam HiResCAM that runs the network forward + backward again)
+against MedicalImageAnalyzer._forward_with_cam(), which reuses the backbone
+activations of a single forward. Also checks that probabilities and heatmaps
+match within a tolerance (exit code 1 if they don't).
+
+Usage:
+    python benchmarks/bench_fused_cam.py --images 16 --tolerance 1e-3
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from pytorch_grad_cam import HiResCAM
+from pytorch_grad_cam.utils.model_targets import ClassifierOutputTarget
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def two_pass(analyzer, input_tensor: torch.Tensor) -> tuple:
+    """The pre-fusion path: probability forward, then a separate HiResCAM pass."""
+    input_tensor = input_tensor.unsqueeze(0).to(analyzer.device)
+    with torch.no_grad():
+        probabilities = F.softmax(analyzer.model(input_tensor), dim=1).cpu().numpy()[0]
+    targets = [ClassifierOutputTarget(int(np.argmax(probabilities)))]
+    with HiResCAM(model=analyzer.model, target_layers=[analyzer.target_layer]) as cam:
+        grayscale_cam = cam(input_tensor=input_tensor, targets=targets)[0, :]
+    return probabilities, grayscale_cam
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=16, help="Number of synthetic scans")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Max abs heatmap difference")
+    args = parser.parse_args()
+
+    from backend.analyzer import MedicalImageAnalyzer
+
+    analyzer = MedicalImageAnalyzer()
+    torch.manual_seed(0)
+    tensors = [torch.randn(3, 224, 224) for _ in range(args.images)]
+
+    # Warm-up both paths
+    two_pass(analyzer, tensors[0])
+    analyzer._forward_with_cam([tensors[0]])
+
+    start = time.perf_counter()
+    reference = [two_pass(analyzer, t) for t in tensors]
+    two_pass_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fused = [analyzer._forward_with_cam([t])[0] for t in tensors]
+    fused_s = time.perf_counter() - start
+
+    prob_diff = max(np.abs(r[0] - f[0]).max() for r, f in zip(reference, fused))
+    cam_diff = max(np.abs(r[1] - f[1]).max() for r, f in zip(reference, fused))
+    top1_match = sum(int(np.argmax(r[0]) == np.argmax(f[0])) for r, f in zip(reference, fused))
+
+    n = len(tensors)
+    print("\n" + "-" * 56)
+    print(f"{'Path':<28}{'ms / image':>14}{'Images/s':>14}")
+    print("-" * 56)
+    print(f"{'two-pass (forward + CAM)':<28}{two_pass_s / n * 1000:>14.1f}{n / two_pass_s:>14.2f}")
+    print(f"{'fused single pass':<28}{fused_s / n * 1000:>14.1f}{n / fused_s:>14.2f}")
+    print("-" * 56)
+    print(f"Speed-up: {two_pass_s / fused_s:.2f}x")
+    print(f"Max |probability diff|: {prob_diff:.2e}")
+    print(f"Max |heatmap diff|:     {cam_diff:.2e} (tolerance {args.tolerance:.0e})")
+    print(f"Top-1 agreement:        {top1_match}/{n}")
+
+    if cam_diff > args.tolerance or top1_match != n:
+        print("❌ Fused heatmaps do NOT match the two-pass reference")
+        sys.exit(1)
+    print("✅ Fused heatmaps match the two-pass reference")
+
+
+if __name__ == "__main__":
+    main()
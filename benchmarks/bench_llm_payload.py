@@ -0,0 +1,194 @@
+"""
+Benchmark: LLM image payload, per-provider full-resolution encode vs shared budget encode
+Compares what the vision LLM requests carry for scans of several sizes:
+  - full    every provider encodes the full-resolution image (JPEG q75 +
+            base64), as before
+  - budget  one LLMImagePayload per request, capped to HG_LLM_IMAGE_MAX_EDGE /
+            HG_LLM_IMAGE_MAX_KB and shared by Groq and Claude
+and prints encode time, request image bytes and the upload time of both
+provider requests to a local sink throttled to --uplink-mbps (through the
+HTTP gateway, so connection setup is excluded).
+
+With --live and GROQ_API_KEY / CLAUDE_API_KEY set, the real providers are
+called with both payloads instead and their end-to-end latency is printed.
+
+Usage:
+    python benchmarks/bench_llm_payload.py --sizes 1024 2048 4000
+    python benchmarks/bench_llm_payload.py --folder scans/ --uplink-mbps 10
+    python benchmarks/bench_llm_payload.py --sizes 2048 --live
+"""
+
+import io
+import os
+import sys
+import glob
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.http_gateway import HttpGateway
+from backend.llm_payload import LLMImagePayload, EncodedImage
+
+PROVIDERS = ("groq", "claude")
+
+
+def synthetic_scan(size: int, seed: int = 0) -> Image.Image:
+    """Grayscale radiograph-like image: smooth anatomy-ish blobs plus sensor noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    img = 0.35 + 0.25 * np.sin(6 * x) * np.cos(4 * y)
+    for _ in range(12):
+        cx, cy, r = rng.random(), rng.random(), 0.03 + 0.15 * rng.random()
+        img += 0.3 * rng.random() * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * r * r))
+    img += rng.normal(0, 0.03, img.shape)
+    return Image.fromarray((np.clip(img, 0, 1) * 255).astype(np.uint8)).convert("RGB")
+
+
+class FullResolutionPayload(LLMImagePayload):
+    """The old behaviour: every provider encodes the full image with PIL's default JPEG settings."""
+
+    def for_provider(self, provider: str) -> EncodedImage:
+        start = time.perf_counter()
+        buffered = io.BytesIO()
+        self.image.save(buffered, format="JPEG")
+        encoded = EncodedImage(
+            base64=base64.b64encode(buffered.getvalue()).decode(), media_type="image/jpeg",
+            size=self.image.size, quality=75, jpeg_bytes=buffered.tell(),
+            encode_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        with self._lock:
+            self._encoded[provider] = encoded
+            self.encodes += 1
+        return encoded
+
+
+def full_payload(image: Image.Image) -> LLMImagePayload:
+    return FullResolutionPayload(image)
+
+
+def budget_payload(image: Image.Image) -> LLMImagePayload:
+    return LLMImagePayload(
+        image,
+        max_edge=int(os.getenv("HG_LLM_IMAGE_MAX_EDGE", "1568")),
+        max_bytes=int(float(os.getenv("HG_LLM_IMAGE_MAX_KB", "1024")) * 1024),
+        min_quality=int(os.getenv("HG_LLM_IMAGE_MIN_QUALITY", "40")),
+        max_quality=int(os.getenv("HG_LLM_IMAGE_MAX_QUALITY", "75")),
+    )
+
+
+def start_sink(uplink_mbps: float) -> str:
+    """Local HTTP endpoint that reads request bodies at `uplink_mbps`."""
+    class Sink(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            self.rfile.read(length)
+            time.sleep(length * 8 / (uplink_mbps * 1e6))
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1/chat"
+
+
+def measure(image: Image.Image, make_payload, gateway: HttpGateway, url: str) -> dict:
+    """Encode for both providers (as the fan-out does) and upload both requests concurrently."""
+    start = time.perf_counter()
+    payload = make_payload(image)
+    bodies = {}
+
+    def provider(name):
+        bodies[name] = payload.for_provider(name).data_url
+        gateway.post(url, endpoint=f"sink.{name}", json={"image": bodies[name]})
+
+    threads = [threading.Thread(target=provider, args=(name,)) for name in PROVIDERS]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    variants = payload.stats()["variants"]
+    return {
+        "encodes": payload.encodes,
+        "encode_ms": sum(v["encode_ms"] for v in variants),
+        "sent_size": variants[0]["size"],
+        "quality": variants[0]["quality"],
+        "request_kb": sum(len(b) for b in bodies.values()) / 1024,
+        "wall_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def measure_live(analyzer, image: Image.Image, make_payload) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+    payload = make_payload(image)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(2) as pool:
+        futures = {
+            "groq": pool.submit(analyzer._analyze_with_groq, image, "", "X-Ray", "Chest", image_payload=payload),
+            "claude": pool.submit(analyzer._analyze_with_claude, image, "", "X-Ray", "Chest", image_payload=payload),
+        }
+        ok = {name: f.result() is not None for name, f in futures.items()}
+    return {"wall_ms": (time.perf_counter() - start) * 1000, "ok": ok,
+            "image_kb": max(v["jpeg_bytes"] for v in payload.stats()["variants"]) / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4000])
+    parser.add_argument("--folder", help="Use the images in this folder instead of synthetic scans")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--live", action="store_true", help="Call the real Groq / Claude APIs")
+    args = parser.parse_args()
+
+    if args.folder:
+        paths = sorted(p for p in glob.glob(os.path.join(args.folder, "*"))
+                       if p.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")))
+        images = [(os.path.basename(p), Image.open(p).convert("RGB")) for p in paths]
+    else:
+        images = [(f"synthetic {s}x{s}", synthetic_scan(s, seed=s)) for s in args.sizes]
+
+    if args.live:
+        from backend.analyzer import MedicalImageAnalyzer
+        analyzer = MedicalImageAnalyzer()
+        print(f"{'image':<24} {'mode':<7} {'image KB':>9} {'LLM wall ms':>12}  ok")
+        for name, image in images:
+            for mode, make_payload in (("full", full_payload), ("budget", budget_payload)):
+                r = measure_live(analyzer, image, make_payload)
+                print(f"{name:<24} {mode:<7} {r['image_kb']:>9.0f} {r['wall_ms']:>12.0f}  {r['ok']}")
+        return
+
+    gateway = HttpGateway()
+    url = start_sink(args.uplink_mbps)
+    print(f"uplink {args.uplink_mbps:g} Mbit/s, both providers per request, best of {args.repeat}\n")
+    print(f"{'image':<24} {'mode':<7} {'encodes':>7} {'sent':>11} {'q':>3} {'encode ms':>10} "
+          f"{'request KB':>11} {'wall ms':>9}")
+    for name, image in images:
+        rows = {}
+        for mode, make_payload in (("full", full_payload), ("budget", budget_payload)):
+            runs = [measure(image, make_payload, gateway, url) for _ in range(args.repeat)]
+            r = min(runs, key=lambda run: run["wall_ms"])
+            rows[mode] = r
+            sent = f"{r['sent_size'][0]}x{r['sent_size'][1]}"
+            print(f"{name:<24} {mode:<7} {r['encodes']:>7} {sent:>11} {r['quality']:>3} {r['encode_ms']:>10.1f} "
+                  f"{r['request_kb']:>11.0f} {r['wall_ms']:>9.0f}")
+        print(f"{'':<24} -> {rows['full']['request_kb'] / rows['budget']['request_kb']:.1f}x fewer bytes, "
+              f"{rows['full']['wall_ms'] / rows['budget']['wall_ms']:.1f}x faster\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: LLM answer, buffered completion vs streamed early fields
+A local provider stand-in generates a Groq-style JSON answer (findings,
+severity, primary finding, then the long detailed_report) at
+--tokens-per-s and the script measures, through the HTTP gateway:
+  - buffered  "stream": false; nothing is usable until the whole body is in
+  - stream    "stream": true; time until findings / overall_severity /
+              primary_finding are parsed, and until the full answer is in
+
+Usage:
+    python benchmarks/bench_llm_stream.py
+    python benchmarks/bench_llm_stream.py --tokens-per-s 60 --report-tokens 2500
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.http_gateway import HttpGateway
+from backend.llm_stream import EARLY_FIELDS, StreamedCompletion, iter_sse
+
+
+def answer_text(report_tokens: int) -> str:
+    """A JSON answer shaped like the analysis prompt asks for (~4 characters per token)."""
+    report = {
+        "summary": "Observation of the scan. " * max(1, report_tokens // 6),
+        "recommendations": ["Follow-up imaging in 6 weeks", "Clinical correlation"],
+    }
+    return json.dumps({
+        "findings": [{"finding": "Pneumonia", "confidence": 87.0, "description": "Right lower lobe consolidation",
+                      "severity": "high"}],
+        "overall_severity": "high",
+        "primary_finding": "Pneumonia",
+        "detailed_report": report,
+    })
+
+
+def start_provider(text: str, tokens_per_s: float) -> str:
+    """Local endpoint generating `text` at `tokens_per_s`, streamed or buffered as requested."""
+    chunks = [text[i:i + 4] for i in range(0, len(text), 4)]  # one token ~ 4 characters
+
+    class Provider(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if not body.get("stream"):
+                time.sleep(len(chunks) / tokens_per_s)
+                data = json.dumps({"choices": [{"message": {"content": text}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            start = time.perf_counter()
+            for n in range(0, len(chunks), 8):  # providers flush a few tokens per event
+                self.send_event({"choices": [{"delta": {"content": "".join(chunks[n:n + 8])}}]})
+                time.sleep(max(0.0, start + (n + 8) / tokens_per_s - time.perf_counter()))
+            self.send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def send_event(self, data):
+            frame = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            self.wfile.flush()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Provider)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+
+
+def buffered(gateway: HttpGateway, url: str) -> dict:
+    start = time.perf_counter()
+    response = gateway.post(url, endpoint="bench.buffered", json={"stream": False})
+    json.loads(response.json()["choices"][0]["message"]["content"])
+    total = (time.perf_counter() - start) * 1000
+    return {"early_ms": total, "total_ms": total}
+
+
+def streamed(gateway: HttpGateway, url: str) -> dict:
+    start = time.perf_counter()
+    early = {}
+
+    def on_field(key, value):
+        if key in EARLY_FIELDS:
+            early[key] = (time.perf_counter() - start) * 1000
+
+    completion = StreamedCompletion("groq", on_field=on_field)
+    response = gateway.post(url, endpoint="bench.stream", json={"stream": True}, stream=True)
+    for event, data in iter_sse(gateway.iter_lines(response, "bench.stream")):
+        completion.feed(event, data)
+    json.loads(completion.text)
+    return {"early_ms": max(early.values()), "total_ms": (time.perf_counter() - start) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens-per-s", type=float, default=150.0)
+    parser.add_argument("--report-tokens", type=int, default=1500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text = answer_text(args.report_tokens)
+    url = start_provider(text, args.tokens_per_s)
+    gateway = HttpGateway()
+    print(f"answer ~{len(text) // 4} tokens at {args.tokens_per_s:g} tokens/s, best of {args.repeat}\n")
+    print(f"{'mode':<10} {'early fields ms':>16} {'full answer ms':>15}")
+    rows = {}
+    for mode, run in (("buffered", buffered), ("stream", streamed)):
+        rows[mode] = min((run(gateway, url) for _ in range(args.repeat)), key=lambda r: r["early_ms"])
+        print(f"{mode:<10} {rows[mode]['early_ms']:>16.0f} {rows[mode]['total_ms']:>15.0f}")
+    print(f"\n-> early fields {rows['buffered']['early_ms'] / rows['stream']['early_ms']:.1f}x sooner")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: PyTorch vs ONNX Runtime findings-only inference
+Runs the findings-only path (backbone + brain head, no Hi-Res CAM) with
+HG_FINDINGS_ENGINE=torch and HG_FINDINGS_ENGINE=onnxruntime, each in its own
+process, and prints latency per batch size, peak RSS and the max probability
+difference between the two engines.
+
+Usage:
+    python benchmarks/bench_onnx.py --batch-sizes 1 8 --iterations 20
+    HG_ORT_INTRA_OP_THREADS=4 python benchmarks/bench_onnx.py
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import numpy as np
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ENGINES = ("torch", "onnxruntime")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(args):
+    """Measure one engine in this process and print a RESULT json line."""
+    os.environ["HG_FINDINGS_ENGINE"] = args.engine
+    from backend.analyzer import MedicalImageAnalyzer
+
+    analyzer = MedicalImageAnalyzer()
+    analyzer.warm_up()
+
+    torch.manual_seed(0)
+    probe = [torch.randn(3, 224, 224) for _ in range(4)]
+    latency = {}
+    for bs in args.batch_sizes:
+        tensors = [torch.randn(3, 224, 224) for _ in range(bs)]
+        analyzer._predict_findings(tensors)  # warm-up
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            analyzer._predict_findings(tensors)
+        latency[bs] = (time.perf_counter() - start) / args.iterations * 1000
+
+    engine_stats = analyzer.findings_engine.stats() if analyzer.findings_engine else None
+    print("RESULT " + json.dumps({
+        "engine": args.engine,
+        "latency_ms": latency,
+        "peak_rss_mb": peak_rss_mb(),
+        "probe": np.stack(analyzer._predict_findings(probe)).tolist(),
+        "served_by_ort": engine_stats["requests_served"] if engine_stats else 0,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", default="torch", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    for engine in ENGINES:
+        print(f"Running {engine}...")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--engine", engine,
+             "--iterations", str(args.iterations),
+             "--batch-sizes", *[str(b) for b in args.batch_sizes]],
+            capture_output=True, text=True, cwd=ROOT,
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+        if proc.returncode != 0 or not lines:
+            print(f"  ❌ {engine} failed:\n{proc.stderr[-2000:]}")
+            continue
+        results[engine] = json.loads(lines[-1][len("RESULT "):])
+
+    header = f"{'Engine':<14}" + "".join(f"{f'bs={b} ms':>12}" for b in args.batch_sizes) + f"{'Peak RSS MB':>14}"
+    print("\n" + "-" * len(header))
+    print(header)
+    print("-" * len(header))
+    for engine, r in results.items():
+        row = f"{engine:<14}" + "".join(f"{r['latency_ms'][str(b)]:>12.1f}" for b in args.batch_sizes)
+        print(row + f"{r['peak_rss_mb']:>14.0f}")
+    print("-" * len(header))
+
+    if len(results) == 2:
+        diff = np.abs(np.array(results["torch"]["probe"]) - np.array(results["onnxruntime"]["probe"])).max()
+        print(f"Max |probability diff| torch vs onnxruntime: {diff:.2e}")
+        if not results["onnxruntime"]["served_by_ort"]:
+            print("⚠️ onnxruntime requests fell back to PyTorch (is onnxruntime installed?)")
+
+
+if __name__ == "__main__":
+    main()
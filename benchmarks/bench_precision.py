@@ -0,0 +1,136 @@
+"""
+Benchmark: precision tiers
+Runs the findings-only DenseNet-121 path at each HG_PRECISION tier (fp32, bf16,
+int8-dynamic, int8-static) in its own process and prints per-image latency,
+peak RSS and top-1 agreement with fp32, so a tier can be picked per deployment.
+
+Static int8 is calibrated on --calibration-dir (defaults to --folder). Without
+--folder, synthetic images are generated; agreement numbers are only
+meaningful on real scans.
+
+Usage:
+    python benchmarks/bench_precision.py --folder path/to/scans --images 100
+    python benchmarks/bench_precision.py --tiers fp32 int8-static --calibration-dir calib/
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.precision import PRECISION_TIERS, load_calibration_tensors
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def write_synthetic_images(folder: str, count: int):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        arr = rng.integers(0, 255, (320, 320, 3), dtype=np.uint8)
+        Image.fromarray(arr).save(os.path.join(folder, f"synthetic_{i:04d}.png"))
+
+
+def run_worker(args):
+    """Measure one tier in this process and print a RESULT json line."""
+    os.environ["HG_PRECISION"] = args.tier
+    os.environ["HG_CALIBRATION_DIR"] = args.calibration_dir
+    os.environ["HG_INFERENCE_BACKEND"] = "eager"
+
+    from backend.analyzer import MedicalImageAnalyzer
+
+    analyzer = MedicalImageAnalyzer()
+    backend_stats = analyzer.warm_up()
+    tensors = load_calibration_tensors(args.folder, analyzer.transform, limit=args.images)
+
+    analyzer._predict_batch([tensors[0]])  # warm-up
+    predictions = []
+    start = time.perf_counter()
+    for t in tensors:
+        predictions.append(int(np.argmax(analyzer._predict_batch([t])[0])))
+    elapsed = time.perf_counter() - start
+
+    print("RESULT " + json.dumps({
+        "tier": args.tier,
+        "active_precision": backend_stats["active_precision"],
+        "fallback_reason": backend_stats["fallback_reason"],
+        "ms_per_image": elapsed / len(tensors) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "predictions": predictions,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", default="", help="Folder of evaluation scans")
+    parser.add_argument("--calibration-dir", default="", help="Calibration images for int8-static")
+    parser.add_argument("--images", type=int, default=50, help="Max evaluation images")
+    parser.add_argument("--tiers", nargs="+", default=list(PRECISION_TIERS), choices=PRECISION_TIERS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--tier", default="fp32", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder
+        if not folder:
+            folder = tmp
+            write_synthetic_images(folder, args.images)
+            print("No --folder given: using synthetic images (agreement is not clinically meaningful)")
+        calibration_dir = args.calibration_dir or folder
+
+        tiers = list(args.tiers)
+        if "fp32" not in tiers:
+            tiers.insert(0, "fp32")
+
+        results = {}
+        for tier in tiers:
+            print(f"Running tier {tier}...")
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", "--tier", tier,
+                 "--folder", folder, "--calibration-dir", calibration_dir,
+                 "--images", str(args.images)],
+                capture_output=True, text=True, cwd=ROOT,
+            )
+            lines = [l for l in proc.stdout.splitlines() if l.startswith("RESULT ")]
+            if proc.returncode != 0 or not lines:
+                print(f"  ❌ tier {tier} failed:\n{proc.stderr[-2000:]}")
+                continue
+            results[tier] = json.loads(lines[-1][len("RESULT "):])
+
+    if "fp32" not in results:
+        print("fp32 baseline failed; cannot compute agreement")
+        return
+    baseline = results["fp32"]["predictions"]
+
+    print("\n" + "-" * 78)
+    print(f"{'Tier':<15}{'Active':<15}{'ms / image':>12}{'Peak RSS MB':>14}{'Top-1 vs fp32':>16}")
+    print("-" * 78)
+    for tier, r in results.items():
+        agree = sum(int(a == b) for a, b in zip(r["predictions"], baseline)) / len(baseline) * 100
+        print(f"{tier:<15}{r['active_precision']:<15}{r['ms_per_image']:>12.1f}"
+              f"{r['peak_rss_mb']:>14.0f}{agree:>15.1f}%")
+        if r["fallback_reason"]:
+            print(f"{'':<15}fallback: {r['fallback_reason']}")
+    print("-" * 78)
+
+
+if __name__ == "__main__":
+    main()
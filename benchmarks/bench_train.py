@@ -0,0 +1,98 @@
+"""
+Benchmark: dataset training modes
+Trains the classifier head on the same dataset with train_on_dataset() in
+"online" mode (augmented minibatches through the backbone every epoch) and in
+"precomputed" mode (features extracted once, then shuffled minibatches),
+starting from the same head each time, and prints the data pipeline's decode
+vs compute throughput. The brain file is not written.
+
+Usage:
+    python benchmarks/bench_train.py --images 200 --epochs 3
+    python benchmarks/bench_train.py --dataset path/to/dataset --modes precomputed
+    HG_TRAIN_AUGMENT_VIEWS=2 HG_TRAIN_WORKERS=4 python benchmarks/bench_train.py
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ("online", "precomputed")
+
+
+def write_synthetic_dataset(folder: str, count: int):
+    """Two class subfolders of random 320x320 images."""
+    rng = np.random.default_rng(0)
+    for label in ("Bench Class A", "Bench Class B"):
+        os.makedirs(os.path.join(folder, label))
+    for i in range(count):
+        label = "Bench Class A" if i % 2 == 0 else "Bench Class B"
+        arr = rng.integers(0, 255, (320, 320, 3), dtype=np.uint8)
+        Image.fromarray(arr).save(os.path.join(folder, label, f"img_{i:05d}.png"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=200, help="Synthetic images (without --dataset)")
+    parser.add_argument("--dataset", default="", help="Dataset folder (subfolder per label)")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args()
+
+    from backend.analyzer import MedicalImageAnalyzer
+
+    analyzer = MedicalImageAnalyzer()
+    analyzer.warm_up()
+    analyzer._save_brain = lambda: None  # never overwrite the real brain
+    analyzer.checkpoints.append_history = lambda record: None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = args.dataset
+        if not dataset:
+            dataset = tmp
+            write_synthetic_dataset(dataset, args.images)
+
+        # Add the label neurons up front so every mode starts from the same head
+        for label in sorted(os.listdir(dataset)):
+            if os.path.isdir(os.path.join(dataset, label)):
+                analyzer._expand_classifier(label)
+        initial = copy.deepcopy(analyzer.working_head.state_dict())
+
+        results = {}
+        for mode in args.modes:
+            analyzer.working_head.load_state_dict(initial)
+            analyzer.optimizer = torch.optim.Adam(
+                analyzer.working_head.parameters(), lr=analyzer.learning_rate
+            )
+            print(f"Training in {mode} mode...")
+            start = time.perf_counter()
+            results[mode] = analyzer.train_on_dataset(dataset, epochs=args.epochs, mode=mode)
+            results[mode]["wall_seconds"] = time.perf_counter() - start
+
+    print("\n" + "-" * 64)
+    print(f"{'Mode':<14}{'Seconds':>10}{'Images':>10}{'Final loss':>14}{'Speed-up':>12}")
+    print("-" * 64)
+    baseline = results.get("online", {}).get("wall_seconds")
+    for mode, r in results.items():
+        speedup = f"{baseline / r['wall_seconds']:.1f}x" if baseline else "—"
+        final_loss = r["epoch_losses"][-1] if r.get("epoch_losses") else float("nan")
+        print(f"{mode:<14}{r['wall_seconds']:>10.1f}{r['images_found']:>10}"
+              f"{final_loss:>14.4f}{speedup:>12}")
+    print("-" * 64)
+    for mode, r in results.items():
+        t = r.get("throughput") or {}
+        print(f"{mode}: decode {t.get('decode_images_per_second')} img/s "
+              f"({t.get('workers')} worker(s)), compute {t.get('compute_images_per_second')} img/s, "
+              f"loader wait {t.get('loader_wait_seconds')}s -> bottleneck: {t.get('bottleneck')}")
+
+
+if __name__ == "__main__":
+    main()
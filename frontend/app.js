@@ -611,6 +611,15 @@ Analyze this medical scan image in detail and return a valid JSON object ONLY, w
             }
         }, 1500);
 
+        let analysisEvents = null;
+        const closeAnalysisEvents = () => {
+            if (!analysisEvents) return;
+            analysisEvents.close();
+            analysisEvents = null;
+            const loadH2 = document.querySelector(".loading-content h2");
+            if (loadH2) loadH2.textContent = "Analyzing Your Scan";
+        };
+
         try {
             const formData = new FormData();
             const isBatch = selectedFiles.length > 1;
@@ -680,6 +689,43 @@ Analyze this medical scan image in detail and return a valid JSON object ONLY, w
             }
 
             const endpoint = isBatch ? `${API_BASE}/api/analyze-batch` : `${API_BASE}/api/analyze`;
+            // The results view needs the full report (HG_ANALYZE_PROGRESSIVE is for API clients)
+            if (!isBatch) formData.append("progressive", "false");
+
+            // Batch: follow per-file completion over Server-Sent Events
+            if (isBatch) {
+                const batchId = `b${Date.now().toString(36)}${Math.random().toString(36).slice(2, 8)}`;
+                formData.append("batch_id", batchId);
+                if (window.EventSource) {
+                    const loadH2 = document.querySelector(".loading-content h2");
+                    analysisEvents = new EventSource(`${API_BASE}/api/analyze-batch/${batchId}/events`);
+                    const onBatchEvent = (e) => {
+                        const p = JSON.parse(e.data);
+                        if (loadH2) loadH2.textContent = `Analyzing Scans — ${p.completed}/${p.total} done`;
+                    };
+                    analysisEvents.addEventListener("progress", onBatchEvent);
+                    analysisEvents.addEventListener("done", (e) => {
+                        onBatchEvent(e);
+                        analysisEvents.close();
+                    });
+                }
+            } else if (window.EventSource) {
+                // Single scan: show the early findings while the full report is generated
+                const analysisId = `a${Date.now().toString(36)}${Math.random().toString(36).slice(2, 8)}`;
+                formData.append("analysis_id", analysisId);
+                const loadH2 = document.querySelector(".loading-content h2");
+                analysisEvents = new EventSource(`${API_BASE}/api/analyze/${analysisId}/events`);
+                const onAnalysisEvent = (e) => {
+                    const early = JSON.parse(e.data).preliminary || {};
+                    const best = early.claude || early.groq || early.local;
+                    if (loadH2 && best && best.primary_finding) {
+                        const severity = best.overall_severity ? ` (${best.overall_severity} severity)` : "";
+                        loadH2.textContent = `Preliminary: ${best.primary_finding}${severity}`;
+                    }
+                };
+                analysisEvents.addEventListener("progress", onAnalysisEvent);
+                analysisEvents.addEventListener("done", () => analysisEvents.close());
+            }
 
             const response = await fetch(endpoint, {
                 method: "POST",
@@ -687,6 +733,7 @@ Analyze this medical scan image in detail and return a valid JSON object ONLY, w
             });
 
             clearInterval(stepInterval);
+            closeAnalysisEvents();
 
             if (!response.ok) {
                 const err = await response.json();
@@ -740,6 +787,7 @@ Analyze this medical scan image in detail and return a valid JSON object ONLY, w
             }
         } catch (err) {
             clearInterval(stepInterval);
+            closeAnalysisEvents();
             loadingOverlay.classList.add("hidden");
             document.body.style.overflow = "";
 
@@ -1126,7 +1174,7 @@ Analyze this medical scan image in detail and return a valid JSON object ONLY, w
         // ... (removed logic)
 
         // Report URL (Prefer Supabase Cloud CDN if configured)
-        currentReportUrl = data.report.supabase_report_url || data.report.download_url;
+        currentReportUrl = data.report ? (data.report.supabase_report_url || data.report.download_url) : null;
 
         // Medical Visualization
         const medicalVizPanel = document.getElementById("medicalVizPanel");
@@ -1425,7 +1473,11 @@ Format each recommendation exactly like this:
 
             if (response.ok) {
                 const result = await response.json();
-                console.log(`[Auto - Train] ✅ Model successfully trained on scan! Loss: ${result.loss}`);
+                if (result.queued) {
+                    console.log(`[Auto-Train] ✅ Scan queued for the next feedback minibatch (${result.queue_depth} waiting)`);
+                } else {
+                    console.log(`[Auto - Train] ✅ Model successfully trained on scan! Loss: ${result.loss}`);
+                }
             } else {
                 console.warn("[Auto-Train] ⚠️ Background training request failed.", await response.text());
             }
@@ -1718,7 +1770,7 @@ Format each recommendation exactly like this:
                         <span class="feedback-stat-label">Total Feedbacks</span>
                     </div>
                     <div class="feedback-stat-item">
-                        <span class="feedback-stat-value">${result.model_updated ? "✓" : "—"}</span>
+                        <span class="feedback-stat-value">${result.model_updated ? "✓" : result.queued ? "Queued" : "—"}</span>
                         <span class="feedback-stat-label">Model Updated</span>
                     </div>
                     ${result.training_steps ? `
@@ -2106,7 +2158,7 @@ Format each recommendation exactly like this:
                 xhr.upload.addEventListener("load", () => {
                     trainingProgressFill.style.width = "50%";
                     trainingProgressPct.textContent = "50%";
-                    trainingStatusMessage.textContent = "Upload complete! Server is processing & training...";
+                    trainingStatusMessage.textContent = "Upload complete! Server is preparing the dataset...";
                 });
 
                 xhr.addEventListener("load", () => {
@@ -2115,7 +2167,7 @@ Format each recommendation exactly like this:
                         if (xhr.status >= 200 && xhr.status < 300) {
                             resolve(result);
                         } else {
-                            reject(new Error(result.error || "Training failed"));
+                            reject(new Error(result.error || "Could not start training"));
                         }
                     } catch (e) {
                         reject(new Error("Invalid response from server"));
@@ -2130,31 +2182,74 @@ Format each recommendation exactly like this:
                     reject(new Error("Upload timed out"));
                 });
 
-                xhr.open("POST", `${API_BASE} / api / train`);
+                xhr.open("POST", `${API_BASE}/api/train`);
                 xhr.timeout = 0; // No timeout for large uploads
                 xhr.send(formData);
             });
 
-            // Poll training progress while waiting for server response
-            let trainingPollInterval = setInterval(async () => {
-                try {
-                    const statusRes = await fetch(`${API_BASE} / api / train / status`);
-                    const status = await statusRes.json();
-                    if (status.is_training && status.progress > 0) {
+            // The server answers with a queued job; follow it over Server-Sent
+            // Events, falling back to polling /api/train/status
+            const waitForTrainingJob = (jobId) => new Promise((resolve, reject) => {
+                // Returns true once the job has finished
+                const applyStatus = (status) => {
+                    if (status.status === "completed") {
+                        resolve(status.result);
+                        return true;
+                    }
+                    if (status.status === "failed" || status.status === "cancelled") {
+                        reject(new Error(status.error || status.message || `Training ${status.status}`));
+                        return true;
+                    }
+                    if (status.status === "queued") {
+                        trainingStatusMessage.textContent = `Queued for training (position ${status.queue_position})...`;
+                    } else if (status.progress > 0) {
                         // Map server progress (0-100) to bar progress (50-100)
                         const serverPct = 50 + Math.round(status.progress * 0.5);
-                        trainingProgressFill.style.width = `${serverPct} % `;
-                        trainingProgressPct.textContent = `${serverPct} % `;
-                        trainingStatusMessage.textContent = status.message || "Training...";
+                        trainingProgressFill.style.width = `${serverPct}%`;
+                        trainingProgressPct.textContent = `${serverPct}%`;
+                        let message = status.message || "Training...";
+                        const ev = status.event;
+                        if (ev && ev.running_loss != null) message += ` — loss ${ev.running_loss}`;
+                        if (ev && ev.images_per_second) message += ` — ${ev.images_per_second} img/s`;
+                        trainingStatusMessage.textContent = message;
                     }
-                } catch (e) {
-                    // Ignore poll errors
+                    return false;
+                };
+
+                const poll = async () => {
+                    try {
+                        const statusRes = await fetch(`${API_BASE}/api/train/status?job_id=${jobId}`);
+                        const status = await statusRes.json();
+                        if (!statusRes.ok) {
+                            reject(new Error(status.error || "Training job not found"));
+                            return;
+                        }
+                        if (applyStatus(status)) return;
+                    } catch (e) {
+                        // Ignore poll errors, try again
+                    }
+                    setTimeout(poll, 1500);
+                };
+
+                if (!window.EventSource) {
+                    poll();
+                    return;
                 }
-            }, 1500);
+                const source = new EventSource(`${API_BASE}/api/train/jobs/${jobId}/events`);
+                const onEvent = (e) => {
+                    if (applyStatus(JSON.parse(e.data))) source.close();
+                };
+                source.addEventListener("progress", onEvent);
+                source.addEventListener("done", onEvent);
+                source.onerror = () => {
+                    // CLOSED means the stream was refused; otherwise EventSource reconnects itself
+                    if (source.readyState === EventSource.CLOSED) poll();
+                };
+            });
 
             try {
-                const result = await uploadPromise;
-                clearInterval(trainingPollInterval);
+                const job = await uploadPromise;
+                const result = await waitForTrainingJob(job.id);
 
                 // Update progress to 100%
                 trainingProgressFill.style.width = "100%";
@@ -2204,7 +2299,6 @@ Format each recommendation exactly like this:
                 trainingResultPanel.scrollIntoView({ behavior: "smooth", block: "center" });
 
             } catch (err) {
-                clearInterval(trainingPollInterval);
                 trainingProgressPanel.classList.add("hidden");
                 alert("Training Error: " + err.message);
                 console.error(err);
@@ -13,10 +13,10 @@ import zipfile
 import tarfile
 import tempfile
 import threading
+import time
 import io
-import requests
 import base64
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 from PIL import Image
 from werkzeug.utils import secure_filename
@@ -25,6 +25,11 @@ from werkzeug.exceptions import RequestEntityTooLarge
 from backend.scan_classifier import classify_scan_type
 from backend.analyzer import MedicalImageAnalyzer, MEDICAL_FINDINGS
 from backend.report_generator import generate_report, compress_pdf
+from backend.result_cache import AnalysisResultCache
+from backend.feature_store import image_digest
+from backend.training_jobs import TrainingJobManager, QueueFullError
+from backend.progress_events import ProgressBroker
+from backend.analysis_tracker import AnalysisTracker
 
 # ---------- Configuration ----------
 import tempfile
@@ -38,14 +43,26 @@ DATASET_EXTENSIONS = {"zip", "tar", "gz", "tgz", "tar.gz", "7z", "rar"}
 SUPABASE_URL = os.getenv("project_url")
 SUPABASE_KEY = os.getenv("anon_key")
 
-supabase_client = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        from supabase import create_client, Client
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("[HealthGuard AI] ✅ Supabase Python client initialized")
-    except Exception as e:
-        print(f"[HealthGuard AI] ⚠️ Failed to initialize Supabase client: {e}")
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+
+def _supabase_headers(content_type="application/json", **extra):
+    """Auth headers for the Supabase REST / Storage APIs (called through analyzer.http)."""
+    return dict({
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": content_type,
+    }, **extra)
+
+
+def _groq_chat(api_key, endpoint, **payload):
+    """One Groq chat completion through the shared HTTP gateway; returns the message text."""
+    resp = analyzer.http.post(GROQ_CHAT_URL, endpoint=endpoint, json=payload,
+                              headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+                              timeout=(10, 120))
+    if resp.status_code != 200:
+        raise RuntimeError(f"Groq API error {resp.status_code}: {resp.text[:300]}")
+    return resp.json()["choices"][0]["message"]["content"]
 
 def _save_to_supabase(data_dict, image_bytes, user_id=None):
     if not SUPABASE_URL or not SUPABASE_KEY:
@@ -57,13 +74,9 @@ def _save_to_supabase(data_dict, image_bytes, user_id=None):
             payload["user_id"] = user_id
         if image_bytes:
             payload["scan_image_base64"] = base64.b64encode(image_bytes).decode('utf-8')
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=minimal"
-        }
-        resp = requests.post(f"{SUPABASE_URL}/rest/v1/scan_results", json=payload, headers=headers, timeout=10)
+        headers = _supabase_headers(Prefer="return=minimal")
+        resp = analyzer.http.post(f"{SUPABASE_URL}/rest/v1/scan_results", endpoint="supabase.scan_results",
+                                  json=payload, headers=headers, timeout=10)
         if resp.status_code in [200, 201]:
             print("[HealthGuard AI] ✅ Successfully pushed results and image to Supabase!")
         else:
@@ -105,19 +118,94 @@ def handle_server_error(e):
 # ---------- Load ML Model ----------
 print("[HealthGuard AI] Loading ML models...")
 analyzer = MedicalImageAnalyzer()
+analyzer.warm_up()
 print("[HealthGuard AI] Models loaded and ready!")
 
 # ---------- Session storage for re-analysis ----------
 session_store = {}
 
-# ---------- Training state management ----------
-training_state = {
-    "is_training": False,
-    "progress": 0,
-    "message": "",
-    "result": None,
-    "cancel": False,  # Flag to cancel an in-progress training
-}
+# ---------- Analysis result cache (re-uploads of the same scan) ----------
+result_cache = AnalysisResultCache(
+    cache_dir=os.getenv("HG_RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "HealthGuard_cache")),
+    memory_bytes=int(float(os.getenv("HG_RESULT_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+    disk_bytes=int(float(os.getenv("HG_RESULT_CACHE_DISK_MB", "1024")) * 1024 * 1024),
+    enabled=os.getenv("HG_RESULT_CACHE", "1") != "0",
+)
+# Analyses missing an LLM answer (late, circuit open, failed) are only cached briefly
+RESULT_CACHE_PARTIAL_TTL_S = float(os.getenv("HG_RESULT_CACHE_PARTIAL_TTL_S", "300"))
+
+# ---------- Background training jobs ----------
+def _run_training_job(job, progress_callback, cancel_flag):
+    """Train on an uploaded dataset (called on a training job worker thread)."""
+    import time as _time
+    params = job["params"]
+    prep_seconds = params.get("prep_seconds", 0.0)
+
+    result = analyzer.train_on_dataset(
+        dataset_dir=params["dataset_path"],
+        description=params.get("description", ""),
+        finding_label=params.get("finding_label", ""),
+        epochs=params.get("epochs", 3),
+        progress_callback=progress_callback,
+        cancel_flag=cancel_flag,
+        # Time to first batch counts the upload preparation, not the queue wait
+        started_at=_time.perf_counter() - prep_seconds,
+    )
+
+    throughput = result.get("throughput") or {}
+    result["dataset_io"] = {
+        "source": params.get("dataset_source"),
+        "bytes_written": params.get("bytes_written"),
+        "prep_seconds": round(prep_seconds, 3),
+        "time_to_first_batch_seconds": throughput.get("first_batch_seconds"),
+    }
+    if result.get("archive"):
+        # What extracting the archive would have written on top of the upload
+        result["dataset_io"]["extraction_bytes_avoided"] = result["archive"]["uncompressed_bytes"]
+    print(f"[HealthGuard AI] Dataset I/O ({params.get('dataset_source')}): "
+          f"{(params.get('bytes_written') or 0) / (1024 * 1024):.1f} MB written, "
+          f"first batch after {throughput.get('first_batch_seconds')}s")
+    return result
+
+
+# ---------- Progress push channel (Server-Sent Events) ----------
+progress_events = ProgressBroker(
+    min_interval=float(os.getenv("HG_PROGRESS_MIN_INTERVAL_MS", "250")) / 1000,
+)
+
+
+def _sse_response(topic):
+    """text/event-stream of a progress topic (resumes after Last-Event-ID)."""
+    try:
+        last_seq = int(request.headers.get("Last-Event-ID", "0"))
+    except ValueError:
+        last_seq = 0
+    return Response(
+        progress_events.stream(topic, last_seq=last_seq),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+training_jobs = TrainingJobManager(
+    jobs_dir=os.getenv("HG_TRAIN_JOBS_DIR", os.path.join(tempfile.gettempdir(), "HealthGuard_training_jobs")),
+    run_job=_run_training_job,
+    workers=int(os.getenv("HG_TRAIN_JOB_WORKERS", "1")),
+    max_queued=int(os.getenv("HG_TRAIN_MAX_QUEUED", "8")),
+    events=progress_events,
+)
+
+
+# ---------- Progressive analysis ----------
+# Default for API clients that send no `progressive` field (the bundled frontend
+# always sends progressive=false and waits for the full report)
+ANALYZE_PROGRESSIVE = os.getenv("HG_ANALYZE_PROGRESSIVE", "0") == "1"
+ANALYZE_SLA_MS = float(os.getenv("HG_ANALYZE_SLA_MS", "3000"))
+analysis_tracker = AnalysisTracker(
+    workers=int(os.getenv("HG_ANALYZE_BACKGROUND_WORKERS", "4")),
+    history=int(os.getenv("HG_ANALYZE_HISTORY", "500")),
+    events=progress_events,
+)
 
 
 def allowed_file(filename):
@@ -199,6 +287,22 @@ def health_check():
         "version": "1.0.0",
         "device": str(analyzer.device),
         "feedback_stats": stats,
+        "inference_queue": analyzer.batcher.stats(),
+        "inference_backend": analyzer.backbone.stats(),
+        "findings_engine": analyzer.findings_engine.stats() if analyzer.findings_engine else None,
+        "result_cache": result_cache.stats(),
+        "feature_store": analyzer.feature_store.stats() if analyzer.feature_store else None,
+        "training_jobs": training_jobs.stats(),
+        "progress_events": progress_events.stats(),
+        "heads": analyzer.heads.stats(),
+        "checkpoints": analyzer.checkpoints.stats(),
+        "llm_fanout": analyzer.llm_fanout.stats(),
+        "http_gateway": analyzer.http.stats(),
+        "llm_cache": analyzer.llm_cache.stats(),
+        "llm_keys": {"groq": analyzer.groq_keys.stats(), "claude": analyzer.claude_keys.stats()},
+        "llm_breakers": analyzer.breakers.stats(),
+        "llm_hedging": analyzer.hedger.stats(),
+        "analysis_sessions": analysis_tracker.stats(),
     })
 
 
@@ -206,7 +310,7 @@ def health_check():
 def get_findings():
     """Return the list of known medical findings for feedback dropdown."""
     return jsonify({
-        "findings": analyzer.findings_list,
+        "findings": list(analyzer.heads.current().findings),
         "custom_findings": analyzer.custom_findings,
     })
 
@@ -216,8 +320,16 @@ def analyze_scan():
     """
     Analyze an uploaded medical scan image.
     Expects multipart form data with an 'image' file.
+    An optional client-chosen 'analysis_id' lets the client receive the early
+    findings (local model, then each LLM provider as its answer streams in)
+    on /api/analyze/<analysis_id>/events while the request runs.
+    With progressive=true (default: HG_ANALYZE_PROGRESSIVE) the response is
+    sent once the local findings and heatmap are ready (with the LLM answers
+    if they arrive within HG_ANALYZE_SLA_MS); the enriched result and the PDF
+    follow on /api/analyze/<session_id>/status and the events stream.
     Returns JSON with scan type classification, findings, and image paths.
     """
+    started = time.perf_counter()
     if "image" not in request.files:
         return jsonify({"error": "No image file provided"}), 400
 
@@ -227,9 +339,14 @@ def analyze_scan():
             "error": "Invalid file. Supported formats: " + ", ".join(ALLOWED_EXTENSIONS)
         }), 400
 
+    analysis_id = secure_filename(request.form.get("analysis_id", ""))
+    progressive = request.form.get("progressive", "true" if ANALYZE_PROGRESSIVE else "false") == "true"
+
+    # Generate unique session ID
+    session_id = str(uuid.uuid4())[:12]
+    analysis_tracker.start(session_id, analysis_id=analysis_id, progressive=progressive, started=started)
+
     try:
-        # Generate unique session ID
-        session_id = str(uuid.uuid4())[:12]
         original_filename = secure_filename(file.filename)
 
         # Read image to memory directly
@@ -237,24 +354,54 @@ def analyze_scan():
         image = Image.open(io.BytesIO(image_bytes))
         upload_path = None # Deprecated parameter for legacy dict compat
 
+        # Get metadata from form
+        patient_name = request.form.get("patient_name", "")
+        scan_type_input = request.form.get("scan_type", "")
+        body_part = request.form.get("body_part", "")
+        patient_description = request.form.get("patient_description", "")
+        user_id = request.form.get("user_id", "")
+        findings_only = request.form.get("findings_only", "false") == "true"
+        use_llm_cache = request.form.get("llm_cache", "true") != "false"
+        puter_result_raw = request.form.get("puter_result", "")
+        image_hash = image_digest(image)
+        # The classifier head version this request is analyzed with (and cached under)
+        head = analyzer.heads.current()
+
+        # Step 0: Serve re-uploads of the same scan from the result cache
+        cache_key = None
+        if result_cache.enabled:
+            cache_key = AnalysisResultCache.make_key(
+                image_hash,
+                {
+                    "original_filename": original_filename,
+                    "patient_name": patient_name,
+                    "scan_type": scan_type_input,
+                    "body_part": body_part,
+                    "patient_description": patient_description,
+                    "puter_result": puter_result_raw,
+                    "findings_only": findings_only,
+                },
+                (analyzer.brain_id, head.version),
+            )
+            # llm_cache=false asks for fresh provider answers: skip the lookup (the
+            # fresh result is stored over the cached one)
+            cached = result_cache.get(cache_key) if use_llm_cache else None
+            if cached is not None:
+                print(f"[HealthGuard AI] ⚡ Result cache hit for {original_filename}")
+                served = _serve_cached_analysis(cached, session_id, image_hash, image_bytes, user_id)
+                analysis_tracker.complete(session_id, served[0].get_json(), message="Served from the result cache")
+                return served
+
         # Step 1: Classify scan type
         scan_type_result = classify_scan_type(image)
+        analysis_tracker.stage(session_id, "classified")
 
         # Step 2: Analyze with ML model + generate heatmap
-        # Step 2: Analyze with ML model
         results_dir = os.path.join(RESULTS_FOLDER, session_id)
         os.makedirs(results_dir, exist_ok=True)
 
-        # Get metadata from form
-        patient_name = request.form.get("patient_name", "")
-        scan_type_input = request.form.get("scan_type", "")
-        body_part = request.form.get("body_part", "")
-        patient_description = request.form.get("patient_description", "")
-        user_id = request.form.get("user_id", "")
-        
         # Check for pre-analyzed result from Puter.js (frontend free AI)
         puter_result = None
-        puter_result_raw = request.form.get("puter_result", "")
         if puter_result_raw:
             try:
                 puter_result = json.loads(puter_result_raw)
@@ -266,129 +413,306 @@ def analyze_scan():
         final_scan_type = scan_type_input if scan_type_input else scan_type_result.get("scan_type", "Unknown")
         scan_type_result["scan_type"] = final_scan_type
 
-        analysis_result = analyzer.analyze(
+        def partial_result(source, field, value):
+            analysis_tracker.partial(session_id, source, field, value)
+
+        # Local findings + heatmap; the LLM providers keep running in the background
+        local_result, llm = analyzer.analyze_local(
             image=image, 
             output_dir=results_dir,
             patient_name=patient_name,
             scan_type=final_scan_type,
             body_part=body_part,
             patient_description=patient_description,
-            puter_result=puter_result
+            puter_result=puter_result,
+            generate_heatmap=not findings_only,
+            session_id=session_id,
+            image_hash=image_hash,
+            head=head,
+            use_llm_cache=use_llm_cache,
+            on_partial=partial_result,
         )
+        analysis_tracker.stage(session_id, "local", "Local findings ready")
 
-        # Step 3: Generate PDF report
-        report_filename = generate_report(
-            scan_type_result=scan_type_result,
-            analysis_result=analysis_result,
-            original_filename=original_filename,
-            output_dir=REPORTS_FOLDER,
-            images_dir=results_dir,
-            detailed_report=analysis_result.get("detailed_report")
-        )
+        persistence_path = os.path.join(results_dir, "original_scan.png")
 
-        # --- Cloud PDF Compression & Storage ---
-        report_path = os.path.join(REPORTS_FOLDER, report_filename)
-        compressed_path = os.path.join(REPORTS_FOLDER, "compressed_" + report_filename)
-        supabase_report_url = None
+        def save_session(analysis_result, status, report_filename=None, supabase_report_url=None):
+            """Persist the session (image, metadata with stages) so feedback / reanalyze can use it."""
+            # Save session data to disk for persistence (fixes "Session not found" after restart)
+            # 1. Save original image copy
+            if not os.path.exists(persistence_path):
+                image.save(persistence_path)
 
-        if supabase_client:
-            print("[HealthGuard AI] 🗜️ Compressing PDF report...")
-            is_compressed = compress_pdf(report_path, compressed_path)
-            final_upload_path = compressed_path if is_compressed else report_path
+            # 2. Save metadata
+            record = analysis_tracker.get(session_id)
+            metadata = {
+                "original_filename": original_filename,
+                "scan_type_result": scan_type_result,
+                "patient_name": patient_name,
+                "upload_path": upload_path,
+                "analysis_result": analysis_result,
+                "status": status,
+                "stages": record["stages"] if record else {},
+                "report_filename": report_filename,
+                "supabase_report_url": supabase_report_url,
+            }
+            with open(os.path.join(results_dir, "session_metadata.json"), "w") as f:
+                json.dump(metadata, f)
 
-            try:
-                file_size_kb = os.path.getsize(final_upload_path) // 1024
-                with open(final_upload_path, "rb") as f:
-                    pdf_bytes = f.read()
-
-                # Upload to Supabase Storage
-                storage_path = f"{session_id}/{report_filename}"
-                print(f"[HealthGuard AI] ☁️ Uploading PDF to Supabase ({file_size_kb}KB)...")
-                
-                supabase_client.storage.from_("reports").upload(
-                    file=pdf_bytes,
-                    path=storage_path,
-                    file_options={"content-type": "application/pdf"}
-                )
+            # Store session in memory
+            session_store[session_id] = {
+                "upload_path": upload_path,
+                "original_filename": original_filename,
+                "scan_type_result": scan_type_result,
+                "persistence_path": persistence_path
+            }
+            return metadata
 
-                # Get public URL
-                supabase_report_url = supabase_client.storage.from_("reports").get_public_url(storage_path)
-                print(f"[HealthGuard AI] ✅ Uploaded PDF to Supabase: {supabase_report_url}")
+        def finish(analysis_result, llm=None):
+            """LLM enrichment (if `llm` is still pending), PDF, cloud upload and persistence of the session."""
+            if llm is not None:
+                analysis_result = analyzer.enrich(analysis_result, llm, puter_result=puter_result)
+                analysis_tracker.stage(session_id, "enriched", "LLM report merged")
 
-                # Insert tracking row
-                supabase_client.table("scan_reports").insert({
-                    "session_id": session_id,
-                    "patient_name": patient_name,
-                    "scan_type": final_scan_type,
-                    "severity": analysis_result["overall_severity"],
-                    "file_name": report_filename,
-                    "file_size_kb": file_size_kb,
-                    "storage_path": storage_path,
-                    "user_id": user_id if user_id else None
-                }).execute()
-                print("[HealthGuard AI] ✅ Created DB record for PDF report.")
+            # Step 3: Generate PDF report
+            report_filename = generate_report(
+                scan_type_result=scan_type_result,
+                analysis_result=analysis_result,
+                original_filename=original_filename,
+                output_dir=REPORTS_FOLDER,
+                images_dir=results_dir,
+                detailed_report=analysis_result.get("detailed_report")
+            )
+            analysis_tracker.stage(session_id, "report", "PDF report ready")
+
+            # --- Cloud PDF Compression & Storage ---
+            report_path = os.path.join(REPORTS_FOLDER, report_filename)
+            compressed_path = os.path.join(REPORTS_FOLDER, "compressed_" + report_filename)
+            supabase_report_url = None
+
+            if SUPABASE_URL and SUPABASE_KEY:
+                print("[HealthGuard AI] 🗜️ Compressing PDF report...")
+                is_compressed = compress_pdf(report_path, compressed_path)
+                final_upload_path = compressed_path if is_compressed else report_path
+
+                try:
+                    file_size_kb = os.path.getsize(final_upload_path) // 1024
+                    with open(final_upload_path, "rb") as f:
+                        pdf_bytes = f.read()
+
+                    # Upload to Supabase Storage
+                    storage_path = f"{session_id}/{report_filename}"
+                    print(f"[HealthGuard AI] ☁️ Uploading PDF to Supabase ({file_size_kb}KB)...")
+                    
+                    resp = analyzer.http.post(f"{SUPABASE_URL}/storage/v1/object/reports/{storage_path}",
+                                              endpoint="supabase.storage.reports", data=pdf_bytes,
+                                              headers=_supabase_headers("application/pdf"), timeout=(10, 60))
+                    resp.raise_for_status()
+
+                    # Get public URL
+                    supabase_report_url = f"{SUPABASE_URL}/storage/v1/object/public/reports/{storage_path}"
+                    print(f"[HealthGuard AI] ✅ Uploaded PDF to Supabase: {supabase_report_url}")
+
+                    # Insert tracking row
+                    resp = analyzer.http.post(f"{SUPABASE_URL}/rest/v1/scan_reports", endpoint="supabase.scan_reports",
+                                              headers=_supabase_headers(Prefer="return=minimal"), timeout=10, json={
+                        "session_id": session_id,
+                        "patient_name": patient_name,
+                        "scan_type": final_scan_type,
+                        "severity": analysis_result["overall_severity"],
+                        "file_name": report_filename,
+                        "file_size_kb": file_size_kb,
+                        "storage_path": storage_path,
+                        "user_id": user_id if user_id else None
+                    })
+                    resp.raise_for_status()
+                    print("[HealthGuard AI] ✅ Created DB record for PDF report.")
+
+                except Exception as e:
+                    print(f"[HealthGuard AI] ⚠️ Supabase PDF Upload Error: {e}")
+                analysis_tracker.stage(session_id, "uploaded")
+
+            metadata = save_session(analysis_result, "complete", report_filename, supabase_report_url)
+
+            # Build response
+            response = _build_analysis_response(
+                session_id, scan_type_result, analysis_result, report_filename, supabase_report_url
+            )
+            ttl = None if analysis_result["timings"].get("llm_complete") else RESULT_CACHE_PARTIAL_TTL_S
+            if cache_key and (ttl is None or ttl > 0):
+                threading.Thread(target=_store_cached_analysis, args=(
+                    cache_key, results_dir, metadata, report_filename, supabase_report_url, ttl
+                )).start()
+            # Async-capable push to Supabase
+            threading.Thread(target=_save_to_supabase, args=(response, image_bytes, user_id)).start()
+
+            analysis_tracker.complete(session_id, response)
+            return response
+
+        if progressive:
+            # Session usable (feedback, reanalyze) right away; then answer within the
+            # SLA, with the LLM answers only if they are already in by then
+            save_session(local_result, "running")
+            sla_left = ANALYZE_SLA_MS / 1000 - (time.perf_counter() - started) - 0.05  # to build + send the response
+            enriched = llm.join(sla_left)
+            analysis_result = local_result
+            if enriched:
+                analysis_result = analyzer.enrich(local_result, llm, puter_result=puter_result)
+                analysis_tracker.stage(session_id, "enriched", "LLM report merged")
+                save_session(analysis_result, "running")
+            response = _build_analysis_response(session_id, scan_type_result, analysis_result, None)
+            response["progressive"] = {
+                "status": "running",
+                "enriched": enriched,
+                "sla_ms": ANALYZE_SLA_MS,
+                "responded_ms": round((time.perf_counter() - started) * 1000, 1),
+                "status_url": f"/api/analyze/{session_id}/status",
+                "events_url": f"/api/analyze/{analysis_id or session_id}/events",
+            }
+            analysis_tracker.responded(session_id, enriched,
+                                       within_sla=response["progressive"]["responded_ms"] <= ANALYZE_SLA_MS)
+            analysis_tracker.submit(session_id, finish, analysis_result, None if enriched else llm)
+            return jsonify(response), 200, {"X-Result-Cache": "miss" if cache_key else "off"}
 
-            except Exception as e:
-                print(f"[HealthGuard AI] ⚠️ Supabase PDF Upload Error: {e}")
+        response = finish(local_result, llm)
+        return jsonify(response), 200, {"X-Result-Cache": "miss" if cache_key else "off"}
 
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        analysis_tracker.fail(session_id, f"Analysis failed: {str(e)}")
+        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
 
 
-        # Save session data to disk for persistence (fixes "Session not found" after restart)
-        # 1. Save original image copy
-        persistence_path = os.path.join(results_dir, "original_scan.png")
-        image.save(persistence_path)
-        
-        # 2. Save metadata
-        metadata = {
-            "original_filename": original_filename,
-            "scan_type_result": scan_type_result,
-            "patient_name": patient_name,
-            "upload_path": upload_path,
-            "analysis_result": analysis_result
-        }
-        with open(os.path.join(results_dir, "session_metadata.json"), "w") as f:
-            json.dump(metadata, f)
+@app.route("/api/analyze/<analysis_id>/events", methods=["GET"])
+def analyze_scan_events(analysis_id):
+    """
+    Server-Sent Events stream of a single analysis: the early findings of the
+    local model and of each LLM provider while the full report is still being
+    generated, with the analysis_id the client sent along with /api/analyze
+    (or the session_id of a progressive analysis). The final event of a
+    progressive analysis carries the upgraded result.
+    """
+    return _sse_response(f"analyze:{secure_filename(analysis_id)}")
 
-        # Store session in memory
-        session_store[session_id] = {
-            "upload_path": upload_path,
-            "original_filename": original_filename,
-            "scan_type_result": scan_type_result,
-            "persistence_path": persistence_path
-        }
 
-        # Build response
-        response = {
-            "session_id": session_id,
-            "scan_type": scan_type_result,
-            "analysis": {
-                "findings": analysis_result["findings"],
-                "overall_severity": analysis_result["overall_severity"],
-                "primary_finding": analysis_result["primary_finding"],
-                "description": analysis_result["findings"][0].get("description", ""),
-                "model_info": analysis_result["model_info"],
-                "detailed_report": analysis_result.get("detailed_report"),
-            },
-            "images": {
-                "heatmap": f"/api/results/{session_id}/{analysis_result['heatmap_path']}" if analysis_result.get('heatmap_path') else None,
-                "annotated": f"/api/results/{session_id}/{analysis_result['annotated_path']}" if analysis_result.get('annotated_path') else None,
-                "medical_viz": f"/api/results/{session_id}/{analysis_result['medical_viz_path']}" if analysis_result.get('medical_viz_path') else None,
-            },
-            "report": {
-                "filename": report_filename,
-                "download_url": f"/api/report/{report_filename}",
-                "supabase_report_url": supabase_report_url
-            },
-        }
-        # Async-capable push to Supabase
-        threading.Thread(target=_save_to_supabase, args=(response, image_bytes, user_id)).start()
+@app.route("/api/analyze/<session_id>/status", methods=["GET"])
+def analyze_scan_status(session_id):
+    """
+    Poll an analysis: status (running / complete / failed), the stages that
+    finished and when, and - once a progressive analysis is complete - the
+    upgraded result (same shape as the /api/analyze response).
+    """
+    session_id = secure_filename(session_id)
+    record = analysis_tracker.get(session_id)
+    if record is not None:
+        return jsonify(record), 200
+
+    # No longer tracked (server restart / history limit): answer from the persisted session
+    metadata_path = os.path.join(RESULTS_FOLDER, session_id, "session_metadata.json")
+    if not os.path.exists(metadata_path):
+        return jsonify({"error": "Session not found"}), 404
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    status = metadata.get("status", "complete")
+    record = {
+        "session_id": session_id,
+        "status": "failed" if status == "running" else status,
+        "stages": metadata.get("stages", {}),
+        "error": "Interrupted by a server restart; the local result was kept" if status == "running" else None,
+        "result": _build_analysis_response(
+            session_id, metadata["scan_type_result"], metadata["analysis_result"],
+            metadata.get("report_filename"), metadata.get("supabase_report_url"),
+        ),
+    }
+    return jsonify(record), 200
+
+
+def _build_analysis_response(session_id, scan_type_result, analysis_result, report_filename,
+                             supabase_report_url=None):
+    """JSON body returned by /api/analyze for one session."""
+    return {
+        "session_id": session_id,
+        "scan_type": scan_type_result,
+        "analysis": {
+            "findings": analysis_result["findings"],
+            "overall_severity": analysis_result["overall_severity"],
+            "primary_finding": analysis_result["primary_finding"],
+            "description": analysis_result["findings"][0].get("description", ""),
+            "model_info": analysis_result["model_info"],
+            "detailed_report": analysis_result.get("detailed_report"),
+            "head_version": analysis_result.get("head_version"),
+            "timings": analysis_result.get("timings"),
+        },
+        "images": {
+            "heatmap": f"/api/results/{session_id}/{analysis_result['heatmap_path']}" if analysis_result.get('heatmap_path') else None,
+            "annotated": f"/api/results/{session_id}/{analysis_result['annotated_path']}" if analysis_result.get('annotated_path') else None,
+            "medical_viz": f"/api/results/{session_id}/{analysis_result['medical_viz_path']}" if analysis_result.get('medical_viz_path') else None,
+        },
+        "report": {
+            "filename": report_filename,
+            "download_url": f"/api/report/{report_filename}",
+            "supabase_report_url": supabase_report_url
+        } if report_filename else None,  # progressive: the PDF follows in the background
+    }
+
+
+def _store_cached_analysis(cache_key, results_dir, metadata, report_filename, supabase_report_url, ttl=None):
+    """Put a finished analysis (payload + session artifacts + PDF) into the result cache (`ttl` in seconds)."""
+    try:
+        artifacts = {}
+        for name in os.listdir(results_dir):
+            if name == "session_metadata.json":
+                continue  # rebuilt for every session
+            with open(os.path.join(results_dir, name), "rb") as f:
+                artifacts[f"results/{name}"] = f.read()
+        with open(os.path.join(REPORTS_FOLDER, report_filename), "rb") as f:
+            artifacts[f"reports/{report_filename}"] = f.read()
+
+        payload = dict(metadata, report_filename=report_filename,
+                       supabase_report_url=supabase_report_url)
+        result_cache.put(cache_key, payload, artifacts, ttl=ttl)
+    except Exception as e:
+        print(f"[HealthGuard AI] ⚠️ Could not cache analysis result: {e}")
 
-        return jsonify(response), 200
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
+def _serve_cached_analysis(cached, session_id, image_hash, image_bytes, user_id):
+    """Materialize a cached analysis as a new session and return its response."""
+    payload = cached["payload"]
+    if analyzer.feature_store:
+        analyzer.feature_store.alias(session_id, image_hash=image_hash)
+    results_dir = os.path.join(RESULTS_FOLDER, session_id)
+    os.makedirs(results_dir, exist_ok=True)
+
+    for rel_path, data in cached["artifacts"].items():
+        folder, name = rel_path.split("/", 1)
+        if folder == "reports":
+            path = os.path.join(REPORTS_FOLDER, name)
+            if os.path.exists(path):
+                continue  # report from the original session is still around
+        else:
+            path = os.path.join(results_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    metadata = {k: payload[k] for k in
+                ("original_filename", "scan_type_result", "patient_name", "upload_path", "analysis_result")}
+    with open(os.path.join(results_dir, "session_metadata.json"), "w") as f:
+        json.dump(metadata, f)
+
+    session_store[session_id] = {
+        "upload_path": None,
+        "original_filename": payload["original_filename"],
+        "scan_type_result": payload["scan_type_result"],
+        "persistence_path": os.path.join(results_dir, "original_scan.png"),
+    }
+
+    response = _build_analysis_response(
+        session_id, payload["scan_type_result"], payload["analysis_result"],
+        payload["report_filename"], payload.get("supabase_report_url"),
+    )
+    threading.Thread(target=_save_to_supabase, args=(response, image_bytes, user_id)).start()
+    return jsonify(response), 200, {"X-Result-Cache": "hit"}
 
 
 @app.route("/api/feedback", methods=["POST"])
@@ -419,7 +743,13 @@ def submit_feedback():
                     image = image.convert("RGB")
                     
                 # Restore to session_store for this request context
-                session_store[session_id] = {"recovered": True}
+                session_data = {"recovered": True, "persistence_path": persisted_img}
+                if os.path.exists(persisted_meta):
+                    with open(persisted_meta, "r") as f:
+                        metadata = json.load(f)
+                    session_data["original_filename"] = metadata.get("original_filename", "")
+                    session_data["scan_type_result"] = metadata.get("scan_type_result") or {}
+                session_store[session_id] = session_data
             else:
                 return jsonify({"error": "Session not found. Please re-upload the scan."}), 404
         else:
@@ -449,20 +779,11 @@ def submit_feedback():
             "scan_type": data.get("scan_type", session_data.get("scan_type_result", {}).get("scan_type", "Unknown")),
         }
 
-        result = analyzer.apply_feedback(image, feedback)
-
-        # Save feedback to file for persistence
-        feedback_file = os.path.join(
-            FEEDBACK_FOLDER,
-            f"feedback_{session_id}_{result['feedback_id']}.json"
+        # Applied (or queued) and persisted in the feedback log
+        result = analyzer.apply_feedback(
+            image, feedback, session_id=session_id,
+            original_filename=session_data.get("original_filename", ""),
         )
-        with open(feedback_file, "w") as f:
-            json.dump({
-                "session_id": session_id,
-                "feedback": feedback,
-                "result": result,
-                "original_filename": session_data["original_filename"],
-            }, f, indent=2)
 
         return jsonify(result), 200
 
@@ -478,6 +799,7 @@ def reanalyze_scan():
     Re-analyze a previously uploaded scan with the updated model.
     Expects JSON body with:
       - session_id: str
+      - llm_cache: bool (optional, false to skip cached LLM answers)
     """
     try:
         data = request.get_json()
@@ -498,8 +820,14 @@ def reanalyze_scan():
         results_dir = os.path.join(RESULTS_FOLDER, new_session_id)
         os.makedirs(results_dir, exist_ok=True)
 
-        # Re-analyze with updated model
-        analysis_result = analyzer.analyze(image, results_dir)
+        # Re-analyze with updated model (head only when the session's
+        # backbone features are in the feature store); queued feedback is
+        # trained first so the re-analysis reflects it
+        analyzer.feedback_buffer.flush()
+        if analyzer.feature_store:
+            analyzer.feature_store.alias(new_session_id, source_session_id=session_id)
+        analysis_result = analyzer.analyze(image, results_dir, session_id=new_session_id,
+                                           use_llm_cache=data.get("llm_cache", True) is not False)
 
         # Generate new PDF report
         report_filename = generate_report(
@@ -523,6 +851,7 @@ def reanalyze_scan():
                 "primary_finding": analysis_result["primary_finding"],
                 "description": analysis_result["findings"][0].get("description", ""),
                 "model_info": analysis_result["model_info"],
+                "head_version": analysis_result.get("head_version"),
             },
             "images": {
                 "heatmap": f"/api/results/{new_session_id}/{analysis_result['heatmap_path']}",
@@ -629,20 +958,33 @@ def update_report_viz():
 
 
 
+@app.route("/api/feedback/history", methods=["GET"])
+def feedback_history():
+    """Feedback records from the feedback log, newest first (?session_id=, ?finding=, ?limit=)."""
+    records = analyzer.feedback_log.find(
+        session_id=request.args.get("session_id"),
+        finding=request.args.get("finding"),
+        limit=request.args.get("limit", 50, type=int),
+    )
+    return jsonify({"feedbacks": records, "count": len(records)})
+
+
 @app.route("/api/feedback/stats", methods=["GET"])
 def feedback_stats():
     """Get feedback and training statistics."""
     stats = analyzer.get_feedback_stats()
-    stats["is_training"] = training_state["is_training"]
-    stats["training_progress"] = training_state["progress"]
-    stats["training_message"] = training_state["message"]
+    job = training_jobs.latest()
+    stats["is_training"] = bool(job and job["is_training"])
+    stats["training_progress"] = job["progress"] if job else 0
+    stats["training_message"] = job["message"] if job else ""
+    stats["training_job_id"] = job["id"] if job else None
     return jsonify(stats)
 
 
 @app.route("/api/train", methods=["POST"])
 def train_on_dataset():
     """
-    Upload a dataset (folder, zip, tar.gz, or images) and train the AI model.
+    Upload a dataset (folder, zip, tar.gz, or images) and queue a training job.
     Supports two upload modes:
       - Folder upload: 'dataset_files' (multiple files with relative paths)
       - Archive/file upload: 'dataset' (single zip/tar/image)
@@ -651,18 +993,9 @@ def train_on_dataset():
       - finding_label: str (optional - label to assign)
       - epochs: int (default 3)
       - is_folder: "true" or "false"
+    Returns 202 with the job (id, status, queue_position) right after the
+    upload is stored; follow it with /api/train/status?job_id=<id>.
     """
-    # If a training session is already running, cancel it and wait for it to stop
-    if training_state["is_training"]:
-        print("[HealthGuard AI] Cancelling previous training session...")
-        training_state["cancel"] = True
-        import time as _time
-        for _ in range(20):  # Wait up to 10 seconds for it to stop
-            _time.sleep(0.5)
-            if not training_state["is_training"]:
-                break
-        training_state["cancel"] = False
-
     is_folder = request.form.get("is_folder", "false") == "true"
     description = request.form.get("description", "")
     finding_label = request.form.get("finding_label", "")
@@ -687,6 +1020,14 @@ def train_on_dataset():
     extract_dir = os.path.join(dataset_dir, "extracted")
     os.makedirs(extract_dir, exist_ok=True)
 
+    # Dataset I/O accounting: bytes written to disk and time to the first training batch
+    import time as _time
+    received_at = _time.perf_counter()
+    bytes_written = 0
+    dataset_source = "folder"
+    train_path = None  # archive trained in place (no extraction)
+    submitted = False  # the training job owns dataset_dir from here on
+
     try:
         if is_folder:
             # ─── Folder Upload: multiple files with relative paths ───
@@ -721,6 +1062,7 @@ def train_on_dataset():
 
                 dest_path = os.path.join(extract_dir, *clean_parts)
                 f.save(dest_path)
+                bytes_written += os.path.getsize(dest_path)
                 saved_count += 1
 
             print(f"[HealthGuard AI] Folder upload: saved {saved_count} files to {extract_dir}")
@@ -740,77 +1082,83 @@ def train_on_dataset():
             original_filename = secure_filename(file.filename)
             save_path = os.path.join(dataset_dir, original_filename)
             file.save(save_path)
+            bytes_written += os.path.getsize(save_path)
+            files = request.files.getlist("dataset")
 
-            # Extract archive if needed
-            if zipfile.is_zipfile(save_path):
+            # ZIP/TAR archives are read in place by train_on_dataset unless extra
+            # files came along or HG_TRAIN_EXTRACT_ARCHIVES=1
+            is_archive = zipfile.is_zipfile(save_path) or tarfile.is_tarfile(save_path)
+            if is_archive and len(files) <= 1 and os.getenv("HG_TRAIN_EXTRACT_ARCHIVES", "0") != "1":
+                train_path = save_path
+                dataset_source = "archive"
+                print(f"[HealthGuard AI] Training straight from archive: {original_filename}")
+            elif zipfile.is_zipfile(save_path):
                 with zipfile.ZipFile(save_path, 'r') as zf:
                     zf.extractall(extract_dir)
+                dataset_source = "extracted"
                 print(f"[HealthGuard AI] Extracted ZIP: {original_filename}")
             elif tarfile.is_tarfile(save_path):
                 with tarfile.open(save_path, 'r:*') as tf:
                     tf.extractall(extract_dir)
+                dataset_source = "extracted"
                 print(f"[HealthGuard AI] Extracted TAR: {original_filename}")
             else:
                 # Not an archive — treat as a single image
                 ext = os.path.splitext(original_filename)[1].lower()
                 if ext in ('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp', '.dcm'):
                     shutil.copy2(save_path, os.path.join(extract_dir, original_filename))
+                    bytes_written += os.path.getsize(save_path)
                 else:
                     return jsonify({"error": f"Unsupported file format: {ext}. Please upload a ZIP, TAR, or image file."}), 400
 
             # Handle multiple files uploaded via standard file input
-            files = request.files.getlist("dataset")
             if len(files) > 1:
                 for f in files[1:]:
                     fname = secure_filename(f.filename)
                     f.save(os.path.join(extract_dir, fname))
+                    bytes_written += os.path.getsize(os.path.join(extract_dir, fname))
 
-        # Find the actual image directory (sometimes Kaggle zips have a single subfolder)
-        actual_dir = extract_dir
-        items = os.listdir(extract_dir)
-        if len(items) == 1 and os.path.isdir(os.path.join(extract_dir, items[0])):
-            actual_dir = os.path.join(extract_dir, items[0])
-
-        # Track training progress
-        def progress_callback(pct, msg):
-            training_state["progress"] = pct
-            training_state["message"] = msg
-
-        training_state["is_training"] = True
-        training_state["progress"] = 0
-        training_state["message"] = "Preparing dataset..."
-        training_state["result"] = None
-        training_state["cancel"] = False
-
-        # Run training (passes training_state as cancel_flag for cancellation support)
-        result = analyzer.train_on_dataset(
-            dataset_dir=actual_dir,
-            description=description,
-            finding_label=finding_label,
-            epochs=epochs,
-            progress_callback=progress_callback,
-            cancel_flag=training_state,
-        )
-
-        training_state["is_training"] = False
-        training_state["progress"] = 100
-        training_state["message"] = "Training complete!"
-        training_state["result"] = result
+            if dataset_source == "extracted":
+                bytes_written += sum(
+                    os.path.getsize(os.path.join(root, f))
+                    for root, _, names in os.walk(extract_dir) for f in names
+                )
 
-        return jsonify(result), 200
+        if train_path is None:
+            # Find the actual image directory (sometimes Kaggle zips have a single subfolder)
+            train_path = extract_dir
+            items = os.listdir(extract_dir)
+            if len(items) == 1 and os.path.isdir(os.path.join(extract_dir, items[0])):
+                train_path = os.path.join(extract_dir, items[0])
+        prep_seconds = _time.perf_counter() - received_at
+
+        # Hand the stored dataset to a background training job
+        job = training_jobs.submit({
+            "dataset_path": train_path,
+            "filename": request.form.get("folder_name", "") if is_folder else original_filename,
+            "description": description,
+            "finding_label": finding_label,
+            "epochs": epochs,
+            "dataset_source": dataset_source,
+            "bytes_written": bytes_written,
+            "prep_seconds": prep_seconds,
+        }, cleanup_dir=dataset_dir)
+        submitted = True
+
+        return jsonify(job), 202
+
+    except QueueFullError as e:
+        return jsonify({"error": f"Training queue is full: {e}. Try again later."}), 429
 
     except Exception as e:
         import traceback
         traceback.print_exc()
-        training_state["is_training"] = False
-        training_state["progress"] = 0
-        training_state["message"] = f"Training failed: {str(e)}"
         return jsonify({"error": f"Training failed: {str(e)}"}), 500
 
     finally:
-        # CLEANUP: Delete the temp directory and all uploaded files
+        # CLEANUP: the job deletes the dataset when it finishes; otherwise delete it now
         try:
-            if 'dataset_dir' in locals() and os.path.exists(dataset_dir):
+            if not submitted and os.path.exists(dataset_dir):
                 shutil.rmtree(dataset_dir)
                 print(f"[HealthGuard AI] 🚮 CLEANUP: Deleted temporary training folder")
                 print(f"                 Path: {dataset_dir}")
@@ -820,13 +1168,58 @@ def train_on_dataset():
 
 @app.route("/api/train/status", methods=["GET"])
 def training_status():
-    """Get current training status."""
-    return jsonify({
-        "is_training": training_state["is_training"],
-        "progress": training_state["progress"],
-        "message": training_state["message"],
-        "result": training_state["result"],
-    })
+    """
+    Status of one training job (?job_id=...), or of the running / next /
+    most recent job when no id is given.
+    """
+    job_id = request.args.get("job_id", "")
+    job = training_jobs.get(job_id) if job_id else training_jobs.latest()
+    if job is None:
+        if job_id:
+            return jsonify({"error": "Training job not found"}), 404
+        return jsonify({"is_training": False, "progress": 0, "message": "", "result": None,
+                        "throughput": None, "status": None})
+    return jsonify(job)
+
+
+@app.route("/api/train/jobs", methods=["GET"])
+def list_training_jobs():
+    """All known training jobs, newest first."""
+    return jsonify({"jobs": training_jobs.list(), "stats": training_jobs.stats()})
+
+
+@app.route("/api/train/jobs/<job_id>", methods=["GET"])
+def get_training_job(job_id):
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Training job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/train/jobs/<job_id>/events", methods=["GET"])
+def training_job_events(job_id):
+    """
+    Server-Sent Events stream of a training job: phase, epoch, image index,
+    running loss and images/s, coalesced; the last event ("done") carries the
+    final job record.
+    """
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Training job not found"}), 404
+    topic = f"train:{job_id}"
+    if progress_events.latest(topic) is None:
+        # Nothing published since the server started (e.g. a finished job)
+        progress_events.publish(topic, job, final=job["status"] in ("completed", "failed", "cancelled"))
+    return _sse_response(topic)
+
+
+@app.route("/api/train/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_training_job(job_id):
+    """Cancel a queued job, or stop a running one at its next batch."""
+    job = training_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Training job not found"}), 404
+    return jsonify(job)
 
 
 @app.route("/api/analyze-batch", methods=["POST"])
@@ -836,18 +1229,52 @@ def analyze_batch():
     Expects multipart form data with one or more 'images' files.
     Shared metadata (patient_name, scan_type, body_part, patient_description)
     applies to every image in the batch.
+    An optional client-chosen 'batch_id' lets the client follow per-file
+    completion on /api/analyze-batch/<batch_id>/events while the request runs.
     Returns a JSON array of per-scan result objects.
     """
     files = request.files.getlist("images")
     if not files or all(f.filename == "" for f in files):
         return jsonify({"error": "No image files provided"}), 400
 
+    batch_id = secure_filename(request.form.get("batch_id", "")) or str(uuid.uuid4())[:12]
+    batch_progress = {
+        "batch_id": batch_id,
+        "total": len(files),
+        "completed": 0,
+        "analyzed": 0,
+        "files": [],  # one entry per finished file, in completion order
+        "message": "Preparing scans...",
+    }
+
+    def publish_batch(final=False):
+        progress_events.publish(f"batch:{batch_id}", dict(batch_progress, files=list(batch_progress["files"])),
+                                final=final)
+
+    def file_done(idx):
+        r = results[idx]
+        batch_progress["completed"] += 1
+        batch_progress["files"].append({
+            "index": idx,
+            "filename": r.get("filename"),
+            "session_id": r.get("session_id"),
+            "error": r.get("error"),
+        })
+        batch_progress["message"] = f"Finished {batch_progress['completed']}/{len(files)} scans"
+        publish_batch()
+
+    def analysis_progress(pct, msg, stats=None, event=None):
+        batch_progress["analyzed"] = event["completed"] if event else batch_progress["analyzed"]
+        batch_progress["message"] = msg
+        publish_batch()
+
     # Shared metadata
     patient_name = request.form.get("patient_name", "")
     scan_type_input = request.form.get("scan_type", "")
     body_part = request.form.get("body_part", "")
     patient_description = request.form.get("patient_description", "")
     user_id = request.form.get("user_id", "")
+    use_llm_cache = request.form.get("llm_cache", "true") != "false"
 
     # Check for pre-analyzed result from Puter.js (frontend free AI)
     puter_result = None
@@ -859,14 +1286,17 @@ def analyze_batch():
         except json.JSONDecodeError:
             print("[HealthGuard AI] ⚠️ Failed to parse Puter.js result, will use API keys")
 
-    results = []
+    results = [None] * len(files)
+    prepared = []  # (index, session_id, original_filename, image, image_bytes, scan_type_result, results_dir, image_hash)
 
+    # Step 1: Decode and classify every file
     for idx, file in enumerate(files):
         if file.filename == "" or not allowed_file(file.filename):
-            results.append({
+            results[idx] = {
                 "filename": file.filename or "unknown",
                 "error": "Invalid file format",
-            })
+            }
+            file_done(idx)
             continue
 
         try:
@@ -876,29 +1306,66 @@ def analyze_batch():
             # Read image to memory directly
             image_bytes = file.read()
             image = Image.open(io.BytesIO(image_bytes))
-            upload_path = None
+            image_hash = image_digest(image)
 
-            # Step 1: Classify scan type
             scan_type_result = classify_scan_type(image)
             final_scan_type = scan_type_input if scan_type_input else scan_type_result.get("scan_type", "Unknown")
             scan_type_result["scan_type"] = final_scan_type
 
-            # Step 2: Analyze with ML model
-            # Use Puter result for first file only (subsequent files use API keys / server Puter)
             results_dir = os.path.join(RESULTS_FOLDER, session_id)
             os.makedirs(results_dir, exist_ok=True)
 
-            analysis_result = analyzer.analyze(
-                image=image,
-                output_dir=results_dir,
+            prepared.append((idx, session_id, original_filename, image, image_bytes,
+                             scan_type_result, results_dir, image_hash))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            results[idx] = {
+                "filename": file.filename or "unknown",
+                "error": f"Analysis failed: {str(e)}",
+            }
+            file_done(idx)
+
+    # Step 2: Analyze all decoded images with tensor-batched execution
+    # (Puter result is used for the first image only)
+    analysis_results = []
+    if prepared:
+        try:
+            analysis_results = analyzer.analyze_batch(
+                images=[p[3] for p in prepared],
+                output_dirs=[p[6] for p in prepared],
                 patient_name=patient_name,
-                scan_type=final_scan_type,
+                scan_types=[p[5]["scan_type"] for p in prepared],
                 body_part=body_part,
                 patient_description=patient_description,
-                puter_result=puter_result if idx == 0 else None,
+                puter_result=puter_result,
+                session_ids=[p[1] for p in prepared],
+                image_hashes=[p[7] for p in prepared],
+                progress_callback=analysis_progress,
+                use_llm_cache=use_llm_cache,
             )
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            for p in prepared:
+                results[p[0]] = {
+                    "filename": p[2],
+                    "error": f"Analysis failed: {str(e)}",
+                }
+                file_done(p[0])
+            prepared = []
+
+    # Step 3: Reports and session persistence per image
+    for (idx, session_id, original_filename, image, image_bytes,
+         scan_type_result, results_dir, _), analysis_result in zip(prepared, analysis_results):
+        if "error" in analysis_result:
+            # Only this file failed in the batched analysis
+            results[idx] = {"filename": original_filename, "error": analysis_result["error"]}
+            file_done(idx)
+            continue
+        try:
+            upload_path = None
 
-            # Step 3: Generate PDF report
             report_filename = generate_report(
                 scan_type_result=scan_type_result,
                 analysis_result=analysis_result,
@@ -939,6 +1406,8 @@ def analyze_batch():
                     "description": analysis_result["findings"][0].get("description", ""),
                     "model_info": analysis_result["model_info"],
                     "detailed_report": analysis_result.get("detailed_report"),
+                    "head_version": analysis_result.get("head_version"),
+                    "timings": analysis_result.get("timings"),
                 },
                 "images": {
                     "heatmap": f"/api/results/{session_id}/{analysis_result['heatmap_path']}" if analysis_result.get('heatmap_path') else None,
@@ -950,18 +1419,30 @@ def analyze_batch():
                     "download_url": f"/api/report/{report_filename}",
                 },
             }
-            results.append(result_payload)
+            results[idx] = result_payload
             threading.Thread(target=_save_to_supabase, args=(result_payload, image_bytes, user_id)).start()
 
         except Exception as e:
             import traceback
             traceback.print_exc()
-            results.append({
-                "filename": file.filename or "unknown",
+            results[idx] = {
+                "filename": original_filename,
                 "error": f"Analysis failed: {str(e)}",
-            })
+            }
+        file_done(idx)
+
+    batch_progress["message"] = "Batch complete"
+    publish_batch(final=True)
+    return jsonify({"batch_id": batch_id, "results": results}), 200
 
-    return jsonify({"results": results}), 200
+
+@app.route("/api/analyze-batch/<batch_id>/events", methods=["GET"])
+def analyze_batch_events(batch_id):
+    """
+    Server-Sent Events stream of a batch analysis: per-file completion, with
+    the batch_id the client sent along with /api/analyze-batch.
+    """
+    return _sse_response(f"batch:{secure_filename(batch_id)}")
 
 
 @app.route("/api/reports/download-all", methods=["POST"])
@@ -1041,9 +1522,6 @@ def check_drug_interactions():
         if not groq_key:
             return jsonify({"error": "Groq API key not configured."}), 500
 
-        from groq import Groq
-        client = Groq(api_key=groq_key)
-
         medicine_list = ", ".join(medicines)
 
         prompt = f"""You are an expert pharmacologist AI. Analyze all possible drug interactions between these medicines: {medicine_list}
@@ -1076,14 +1554,13 @@ Return strictly as a valid JSON object:
 
 Be thorough and accurate. Check every possible pair combination. Do not include any other text except the JSON object."""
 
-        response = client.chat.completions.create(
+        raw = _groq_chat(
+            groq_key, "groq.interactions",
             model="meta-llama/llama-4-scout-17b-16e-instruct",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_completion_tokens=2000
-        )
-
-        raw = response.choices[0].message.content.strip()
+        ).strip()
         # Clean markdown
         if raw.startswith("```"):
             raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
@@ -1123,9 +1600,6 @@ def ayush_lookup():
         if not groq_key:
             return jsonify({"error": "Groq API key not configured."}), 500
 
-        from groq import Groq
-        client = Groq(api_key=groq_key)
-
         prompt = f"""You are an expert AYUSH (Ayurveda, Yoga, Unani, Siddha, Homeopathy) specialist AI based in India with deep knowledge of the Ministry of AYUSH approved formulations.
 
 A patient is looking for AYUSH treatments for: "{query}"
@@ -1218,14 +1692,13 @@ Return strictly as a valid JSON object:
 
 IMPORTANT: Only suggest real, genuine medicines/treatments. Be accurate with classical text references. Do not include any text except the JSON object."""
 
-        response = client.chat.completions.create(
+        raw = _groq_chat(
+            groq_key, "groq.ayush",
             model="meta-llama/llama-4-scout-17b-16e-instruct",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.3,
             max_completion_tokens=3000
-        )
-
-        raw = response.choices[0].message.content.strip()
+        ).strip()
         if raw.startswith("```"):
             raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
         if raw.endswith("```"):
@@ -1261,9 +1734,6 @@ def analyze_prescription():
         if not groq_api_key:
             return jsonify({"error": "groq_insurance API key is not configured in .env"}), 500
 
-        from groq import Groq
-        client = Groq(api_key=groq_api_key)
-
         # Ensure base64 string is properly formatted for Groq request
         if image_data.startswith("data:image"):
             base64_url = image_data
@@ -1365,7 +1835,8 @@ def analyze_prescription():
         """
 
         # Using Llama 4 Scout (multimodal) for direct image-to-JSON OCR+Reasoning
-        response = client.chat.completions.create(
+        response_content = _groq_chat(
+            groq_api_key, "groq.advocate",
             messages=[
                 {
                     "role": "user", 
@@ -1384,8 +1855,6 @@ def analyze_prescription():
             temperature=0.2,
             response_format={"type": "json_object"}
         )
-
-        response_content = response.choices[0].message.content
         parsed_response = json.loads(response_content)
         
         return jsonify(parsed_response)